@@ -0,0 +1,13 @@
+"""
+The load test and micro benchmark suite of the application. It drives the
+application in process through httpx's ASGITransport and, optionally, a
+local uvicorn server, and writes the p50/p95/p99 latencies and throughput
+of every benchmarked route as JSON, so runs can be compared and a run can
+be gated against a baseline.
+
+Run it from the root of the repository:
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --transport both --groups crud,children
+    python -m benchmarks --baseline results.json --max-regression 0.2
+"""
@@ -0,0 +1,142 @@
+"""
+This module contains the benchmark cases, the requests every group of
+routes is benchmarked with. The cases are derived from the routes of the
+application, so a new model, child route or sort column is benchmarked
+without changing this module.
+"""
+
+import re
+from types import ModuleType
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi.routing import APIRoute
+
+
+# the parent IDs of the child routes whose parent 1 has no children
+CHILD_PARENT_IDS = {
+    "/api/v1/employees/{id}/customers": 3,
+}
+
+# the parents of the batched child route cases
+BATCH_PARENT_IDS = ",".join(str(id) for id in range(1, 21))
+
+# the pages of the HTMX tab cases, the first one and one past the prefetch
+HTMX_PAGES = (1, 4)
+
+# the paths of the generated routes that aren't batched child routes
+GENERATED_PATHS = ("bulk", "batch", "export")
+
+CHILD_PATH = re.compile(r"^/api/v1/\w+/\{id\}/\w+$")
+BATCH_CHILD_PATH = re.compile(r"^/api/v1/\w+/(\w+)$")
+
+
+def build_case(
+    group: str, url: str, method: str = "GET", body: Optional[Dict] = None
+) -> Dict:
+    """
+    Build a benchmark case
+
+    :param group: the group of routes the case belongs to
+    :param url: the URL of the request, with the query string
+    :param method: the HTTP method of the request
+    :param body: the JSON body of the request, if any
+    :return: Dict of the case
+    """
+    return {"group": group, "method": method, "url": url, "body": body}
+
+
+async def crud_cases(client: httpx.AsyncClient, main: ModuleType) -> List[Dict]:
+    """
+    Build the cases of the generated CRUD routes of every model, the list
+    pages by offset, without the count and with a sparse fieldset, a single
+    item, a batch of items, the streaming export, and a patch of an item
+    with its own values so the table is unchanged. The patches are the last
+    cases, every one of them invalidates the cached counts of its table.
+
+    :param client: the client of the application, to read the patched items
+    :param main: the main module of the application
+    :return: List of the cases
+    """
+    from endpoints.routes import get_model_names
+
+    ids = ",".join(str(id) for id in range(1, 51))
+    cases = []
+    patches = []
+    for route_config in main.get_routes_config():
+        model = route_config["model"]
+        prefix, _, class_name = get_model_names(model)
+        base = f"/api/v1/{prefix}"
+        cases.extend(
+            build_case("crud", url)
+            for url in (
+                f"{base}/?limit=10",
+                f"{base}/?limit=100&count=none",
+                f"{base}/?limit=100&fields=id",
+                f"{base}/1",
+                f"{base}/batch?ids={ids}",
+                f"{base}/export",
+            )
+        )
+        # the item patched with its own values, the Patch models of some
+        # tables require their foreign keys
+        item = (await client.get(f"{base}/1")).json()["response"]
+        item.pop("id")
+        patches.append(build_case("crud", f"{base}/1", "PATCH", item))
+    return cases + patches
+
+
+def children_cases(main: ModuleType) -> List[Dict]:
+    """
+    Build the cases of every child route and batched child route
+
+    :param main: the main module of the application
+    :return: List of the cases
+    """
+    cases = []
+    for route in main.app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods:
+            continue
+        if CHILD_PATH.match(route.path):
+            parent_id = CHILD_PARENT_IDS.get(route.path, 1)
+            url = route.path.replace("{id}", str(parent_id))
+            cases.append(build_case("children", f"{url}?limit=10"))
+            cases.append(build_case("children", f"{url}?limit=10&count=none"))
+        match = BATCH_CHILD_PATH.match(route.path)
+        if match and match.group(1) not in GENERATED_PATHS:
+            cases.append(
+                build_case(
+                    "children",
+                    f"{route.path}?parent_ids={BATCH_PARENT_IDS}&per_parent_limit=10",
+                )
+            )
+    return cases
+
+
+def htmx_cases() -> List[Dict]:
+    """
+    Build the cases of the HTMX tab views, every sort column of the tab in
+    both directions, and the tab's default order, on the first page and a
+    later one, and the first chunk of the infinite scroll mode
+
+    :return: List of the cases
+    """
+    from endpoints.application import SORT_COLUMNS, STATS_CLASSES
+
+    cases = []
+    for tab, stats_class in STATS_CLASSES.items():
+        sorts = [("", "")] + [
+            (sort, direction)
+            for sort, column in SORT_COLUMNS.items()
+            if column.class_ is stats_class
+            for direction in ("asc", "desc")
+        ]
+        for sort, direction in sorts:
+            order = f"&sort={sort}&direction={direction}" if sort else ""
+            for page in HTMX_PAGES:
+                url = f"/application/{tab}?current_page={page}&items_per_page=10"
+                cases.append(build_case("htmx", f"{url}{order}"))
+        cases.append(
+            build_case("htmx", f"/application/{tab}?items_per_page=10&scroll=true")
+        )
+    return cases
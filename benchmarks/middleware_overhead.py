@@ -0,0 +1,81 @@
+"""
+This module benchmarks the MetadataMiddleware in isolation. The same route,
+returning a page of items without touching the database, is served by
+three minimal applications: a plain JSONResponse, the MetadataJSONResponse
+without the middleware (the metadata is skipped when there is no request
+scope) and the MetadataJSONResponse behind the MetadataMiddleware, so the
+difference of the last two is the cost of the middleware and the metadata.
+"""
+
+from typing import Callable, Dict, Optional
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+
+# the page of items every variant returns
+PAGE = [{"id": id, "name": f"Item {id}", "album_id": id // 10} for id in range(10)]
+
+URL = "/items/?offset=0&limit=10"
+
+
+def build_app(response_class: type, middleware: Optional[type]) -> FastAPI:
+    """
+    Build the minimal application of a variant
+
+    :param response_class: the default response class of the application
+    :param middleware: the middleware to add, if any
+    :return: the application
+    """
+    app = FastAPI(default_response_class=response_class)
+    if middleware is not None:
+        app.add_middleware(middleware)
+
+    @app.get("/items/")
+    async def read_items():
+        return response_class(
+            content={
+                "meta_data": None,
+                "response": PAGE,
+                "total_count": 100,
+                "next_cursor": None,
+            }
+        )
+
+    return app
+
+
+async def middleware_overhead(run_case: Callable, **options) -> Dict:
+    """
+    Benchmark the three variants and the overhead of the middleware
+
+    :param run_case: the coroutine function that benchmarks a case with a client
+    :param options: the options of run_case, the requests and concurrency
+    :return: Dict of the results of every variant, and the overhead in
+        milliseconds of the middleware at every percentile
+    """
+    from middleware import MetadataJSONResponse, MetadataMiddleware
+
+    variants = {
+        "json_response": build_app(JSONResponse, None),
+        "metadata_response": build_app(MetadataJSONResponse, None),
+        "metadata_middleware": build_app(MetadataJSONResponse, MetadataMiddleware),
+    }
+    results = {}
+    for name, app in variants.items():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark"
+        ) as client:
+            case = {"group": "middleware", "method": "GET", "url": URL, "body": None}
+            results[name] = await run_case(client, case, **options)
+    with_middleware = results["metadata_middleware"]
+    without_middleware = results["metadata_response"]
+    return {
+        "variants": results,
+        "overhead_ms": {
+            metric: round(with_middleware[metric] - without_middleware[metric], 3)
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "mean_ms")
+        },
+    }
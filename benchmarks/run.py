@@ -0,0 +1,441 @@
+"""
+This module runs the benchmarks. The application is benchmarked against a
+copy of the original chinook database, so the active database is never
+changed, with the settings of the environment (SQLITE_PRAGMA_PROFILE,
+CACHE_BACKEND, READ_POOL_SIZE, etc.), which are recorded in the output so
+runs of different configurations can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from benchmarks.stats import find_regressions, summarize
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+APP_DIR = ROOT_DIR / "project" / "app"
+ORIGINAL_DB_PATH = APP_DIR / "db" / "original" / "chinook.db"
+
+GROUPS = ("crud", "children", "htmx", "middleware")
+TRANSPORTS = ("asgi", "uvicorn")
+
+# the settings of the application recorded with the results
+SETTING_NAMES = (
+    "CACHE_BACKEND",
+    "COUNT_CACHE_TTL",
+    "FRAGMENT_CACHE_TTL",
+    "PREFETCH_QUEUE_SIZE",
+    "READ_POOL_SIZE",
+    "SQLITE_CACHE_SIZE_KB",
+    "SQLITE_MMAP_SIZE",
+    "SQLITE_PRAGMA_PROFILE",
+)
+
+# the seconds the uvicorn server has to start
+SERVER_START_TIMEOUT = 30
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse the command line arguments
+
+    :param argv: the arguments, the process arguments when None
+    :return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the REST and HTMX routes of the application",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=(*TRANSPORTS, "both"),
+        default="asgi",
+        help="drive the application in process (asgi), through a local "
+        "uvicorn server, or both",
+    )
+    parser.add_argument(
+        "--groups",
+        default=",".join(GROUPS),
+        help=f"comma separated groups of cases to run: {', '.join(GROUPS)}",
+    )
+    parser.add_argument(
+        "--filter", default="", help="only run the cases whose URL has this text"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=100, help="measured requests per case"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=5, help="unmeasured requests before a case"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="requests in flight at a time"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="expire the cached counts and HTMX fragments right away, so "
+        "every request does the full work",
+    )
+    parser.add_argument(
+        "--app-logging",
+        action="store_true",
+        help="keep the request logging of the application, which is "
+        "turned down to warnings by default",
+    )
+    parser.add_argument(
+        "--output", default="benchmark-results.json", help="the JSON results file"
+    )
+    parser.add_argument(
+        "--baseline", help="the JSON results file of a run to compare with"
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="the largest allowed growth of a case's metric over the baseline, "
+        "0.2 for 20%%, a larger one fails the run",
+    )
+    parser.add_argument(
+        "--metric",
+        default="p95_ms",
+        choices=("p50_ms", "p95_ms", "p99_ms", "mean_ms"),
+        help="the metric compared with the baseline",
+    )
+    return parser.parse_args(argv)
+
+
+def prepare_environment(args: argparse.Namespace, data_dir: Path) -> Dict[str, str]:
+    """
+    Set the environment of the application, read when its config is
+    imported, and make the application modules importable
+
+    :param args: the command line arguments
+    :param data_dir: the directory of the database copies
+    :return: Dict of the recorded settings
+    """
+    shutil.copy(ORIGINAL_DB_PATH, data_dir / "chinook.db")
+    os.environ["DATABASE_PATH"] = str(data_dir / "chinook.db")
+    os.environ["CACHE_PATH"] = str(data_dir / "cache.db")
+    if args.no_cache:
+        os.environ["COUNT_CACHE_TTL"] = "0"
+        os.environ["FRAGMENT_CACHE_TTL"] = "0"
+    if str(APP_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_DIR))
+    return {name: os.environ[name] for name in SETTING_NAMES if name in os.environ}
+
+
+async def run_case(
+    client: httpx.AsyncClient,
+    case: Dict,
+    requests: int,
+    warmup: int,
+    concurrency: int,
+) -> Dict:
+    """
+    Benchmark a case, the warmup requests aren't measured, then the measured
+    requests are sent with at most `concurrency` of them in flight
+
+    :param client: the client of the application
+    :param case: the case to benchmark
+    :param requests: the number of measured requests
+    :param warmup: the number of unmeasured requests
+    :param concurrency: the most requests in flight at a time
+    :return: Dict of the case's summary
+    """
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(measured: bool) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(
+                case["method"], case["url"], json=case["body"]
+            )
+            await response.aread()
+            latency = time.perf_counter() - start
+        if not measured:
+            return
+        latencies.append(latency)
+        if response.status_code >= 400:
+            errors += 1
+
+    for _ in range(warmup):
+        await send(measured=False)
+    start = time.perf_counter()
+    await asyncio.gather(*(send(measured=True) for _ in range(requests)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+@asynccontextmanager
+async def asgi_client(main) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client of the application in process, the application's lifespan is
+    run around it, ASGITransport doesn't send the lifespan events
+
+    :param main: the main module of the application
+    :return: the client
+    """
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark"
+        ) as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(
+    args: argparse.Namespace, data_dir: Path
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client of the application served by a local uvicorn server, the
+    server runs in a process of its own with a database copy of its own
+
+    :param args: the command line arguments
+    :param data_dir: the directory of the database copies
+    :return: the client
+    """
+    server_dir = data_dir / "uvicorn"
+    server_dir.mkdir()
+    shutil.copy(ORIGINAL_DB_PATH, server_dir / "chinook.db")
+    env = {
+        **os.environ,
+        "DATABASE_PATH": str(server_dir / "chinook.db"),
+        "CACHE_PATH": str(server_dir / "cache.db"),
+    }
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    output = None if args.app_logging else subprocess.DEVNULL
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--app-dir",
+            str(APP_DIR),
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "info" if args.app_logging else "warning",
+        ],
+        cwd=APP_DIR,
+        env=env,
+        stdout=output,
+        stderr=output,
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits
+        ) as client:
+            await wait_for_server(client, server)
+            yield client
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def wait_for_server(client: httpx.AsyncClient, server: subprocess.Popen) -> None:
+    """
+    Wait until the uvicorn server answers requests
+
+    :param client: the client of the server
+    :param server: the server process
+    """
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {server.returncode}")
+        try:
+            await client.get("/api/v1/genres/1")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"uvicorn didn't start in {SERVER_START_TIMEOUT} seconds")
+
+
+async def run_cases(
+    client: httpx.AsyncClient,
+    main,
+    transport: str,
+    args: argparse.Namespace,
+    groups: List[str],
+) -> List[Dict]:
+    """
+    Benchmark the cases of the groups with the client
+
+    :param client: the client of the application
+    :param main: the main module of the application
+    :param transport: the name of the client's transport
+    :param args: the command line arguments
+    :param groups: the groups of cases to run
+    :return: List of the results of every case
+    """
+    from benchmarks import cases
+
+    group_cases = []
+    if "crud" in groups:
+        group_cases.extend(await cases.crud_cases(client, main))
+    if "children" in groups:
+        group_cases.extend(cases.children_cases(main))
+    if "htmx" in groups:
+        group_cases.extend(cases.htmx_cases())
+
+    results = []
+    for case in group_cases:
+        if args.filter not in case["url"]:
+            continue
+        summary = await run_case(
+            client,
+            case,
+            requests=args.requests,
+            warmup=args.warmup,
+            concurrency=args.concurrency,
+        )
+        key = f"{transport} {case['method']} {case['url']}"
+        results.append(
+            {
+                "key": key,
+                "group": case["group"],
+                "transport": transport,
+                "method": case["method"],
+                "url": case["url"],
+                **summary,
+            }
+        )
+        print(
+            f"{key}: p50 {summary['p50_ms']}ms p95 {summary['p95_ms']}ms "
+            f"p99 {summary['p99_ms']}ms {summary['throughput_rps']}/s",
+            file=sys.stderr,
+        )
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """
+    Returns the commit of the benchmarked code, if it is a git checkout
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> int:
+    """
+    Run the benchmarks and write the results
+
+    :param args: the command line arguments
+    :return: the exit status, 1 when a case regressed from the baseline
+    """
+    groups = [group.strip() for group in args.groups.split(",") if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        raise SystemExit(f"Unknown groups {', '.join(sorted(unknown))}")
+    transports = TRANSPORTS if args.transport == "both" else (args.transport,)
+
+    data_dir = Path(tempfile.mkdtemp(prefix="chinook-benchmarks-"))
+    try:
+        settings = prepare_environment(args, data_dir)
+        import main
+
+        if not args.app_logging:
+            logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+        results = []
+        route_groups = [group for group in groups if group != "middleware"]
+        if route_groups and "asgi" in transports:
+            async with asgi_client(main) as client:
+                results.extend(
+                    await run_cases(client, main, "asgi", args, route_groups)
+                )
+        if route_groups and "uvicorn" in transports:
+            async with uvicorn_client(args, data_dir) as client:
+                results.extend(
+                    await run_cases(client, main, "uvicorn", args, route_groups)
+                )
+
+        overhead = None
+        if "middleware" in groups:
+            from benchmarks.middleware_overhead import middleware_overhead
+
+            overhead = await middleware_overhead(
+                run_case,
+                requests=args.requests,
+                warmup=args.warmup,
+                concurrency=args.concurrency,
+            )
+            print(f"middleware overhead: {overhead['overhead_ms']}", file=sys.stderr)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = find_regressions(
+            baseline, results, args.max_regression, args.metric
+        )
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+
+    output = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "transports": list(transports),
+            "groups": groups,
+            "filter": args.filter,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "no_cache": args.no_cache,
+        },
+        "settings": settings,
+        "results": results,
+        "middleware_overhead": overhead,
+        "baseline": args.baseline,
+        "regressions": regressions,
+    }
+    Path(args.output).write_text(json.dumps(output, indent=2) + "\n")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    The entry point of python -m benchmarks
+
+    :param argv: the arguments, the process arguments when None
+    :return: the exit status
+    """
+    return asyncio.run(run(parse_args(argv)))
@@ -0,0 +1,68 @@
+"""
+This module contains the statistics of the benchmark runs, the summary of
+a case's latencies and the comparison of a run with a baseline run
+"""
+
+import statistics
+from typing import Dict, List, Sequence
+
+
+def summarize(latencies: Sequence[float], elapsed: float, errors: int) -> Dict:
+    """
+    Summarize the latencies of a case's requests
+
+    :param latencies: the seconds every request took
+    :param elapsed: the wall clock seconds all the requests took
+    :param errors: the number of requests that didn't succeed
+    :return: Dict of the latency percentiles in milliseconds and the throughput
+    """
+    milliseconds = sorted(latency * 1000 for latency in latencies)
+    if len(milliseconds) > 1:
+        percentiles = statistics.quantiles(milliseconds, n=100, method="inclusive")
+    else:
+        percentiles = milliseconds * 99
+    return {
+        "requests": len(milliseconds),
+        "errors": errors,
+        "p50_ms": round(percentiles[49], 3),
+        "p95_ms": round(percentiles[94], 3),
+        "p99_ms": round(percentiles[98], 3),
+        "mean_ms": round(statistics.fmean(milliseconds), 3),
+        "min_ms": round(milliseconds[0], 3),
+        "max_ms": round(milliseconds[-1], 3),
+        "throughput_rps": round(len(milliseconds) / elapsed, 1) if elapsed else None,
+    }
+
+
+def find_regressions(
+    baseline: Dict, results: List[Dict], max_regression: float, metric: str
+) -> List[Dict]:
+    """
+    Compare the results of a run with the results of a baseline run, a case
+    regresses when its metric grew by more than max_regression, e.g. 0.2 for
+    20%. The cases that aren't in both runs aren't compared.
+
+    :param baseline: the JSON output of the baseline run
+    :param results: the results of the run
+    :param max_regression: the largest allowed relative growth of the metric
+    :param metric: the metric to compare, e.g. p95_ms
+    :return: List of the regressed cases
+    """
+    baseline_results = {result["key"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get(result["key"])
+        if previous is None or not previous[metric]:
+            continue
+        change = result[metric] / previous[metric] - 1
+        if change > max_regression:
+            regressions.append(
+                {
+                    "key": result["key"],
+                    "metric": metric,
+                    "baseline": previous[metric],
+                    "current": result[metric],
+                    "change": round(change, 3),
+                }
+            )
+    return regressions
@@ -0,0 +1,581 @@
+"""
+This module contains the caches used to avoid repeating queries whose
+results rarely change, like the total count of rows returned with every
+paginated list response, the rendered HTMX fragments, and the change
+counters of the tables the conditional GETs and the cached entries are
+validated against.
+
+The caches keep their entries and the table versions in a cache backend,
+either in the memory of the process, or in a SQLite file on the same host
+that every worker process reads, so adding workers doesn't multiply the
+cold caches and a write made by one worker invalidates the entries of
+all of them through the backend's change log.
+"""
+
+import math
+import secrets
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from config import settings
+
+
+# milliseconds the change log of the SQLite backend waits for the lock of
+# another worker, a lost bump would leave stale entries behind
+LOG_BUSY_TIMEOUT_MS = 5000
+
+
+class CountMode(str, Enum):
+    """
+    How the total count of a paginated list is computed
+
+    exact: always run the COUNT query
+    cached: use the cached count if there is one, otherwise count and cache it
+    none: skip the count, the response has no total_count or page_count
+    """
+
+    exact = "exact"
+    cached = "cached"
+    none = "none"
+
+
+class CacheBackend(ABC):
+    """
+    The interface of the cache backends. A backend stores the cache entries
+    as bytes, each with its own ttl, evicting the least recently stored or
+    used entries to stay under max_bytes, and the version of every table,
+    bumped after every write to the table.
+    """
+
+    # every worker process sees the same entries and versions
+    shared = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get the entry, or None if it isn't cached or has expired
+
+        :param key: the key of the entry
+        :return: the entry or None
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        """
+        Cache the entry
+
+        :param key: the key of the entry
+        :param value: the entry
+        :param ttl: seconds the entry is kept
+        """
+
+    @abstractmethod
+    def versions(self) -> Dict[str, int]:
+        """
+        Get the versions of the tables that have been modified
+
+        :return: Dict of table name to version
+        """
+
+    @abstractmethod
+    def bump(self, table_name: str) -> None:
+        """
+        Count a modification of the table
+
+        :param table_name: the name of the table that was modified
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of entries and their size
+
+        :return: Dict of the entries, size and max_bytes
+        """
+
+
+class MemoryBackend(CacheBackend):
+    """
+    LRU cache backend in the memory of the process, fastest, but every
+    worker process has its own copy of the entries and versions
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, Tuple[bytes, float]] = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def versions(self) -> Dict[str, int]:
+        return self._versions
+
+    def bump(self, table_name: str) -> None:
+        self._versions[table_name] = self._versions.get(table_name, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Cache backend in a SQLite file shared by the worker processes of the
+    host. Every write to a table appends a row to the change log table,
+    and every process reads the rows appended since its last read, at most
+    every sync_interval seconds, so the writes of one worker invalidate the
+    cached entries of all of them.
+
+    The file is local and its statements take microseconds, so they run on
+    the event loop, but a statement waiting for the lock of another worker
+    would block the loop. The entries are read and written with a short
+    busy_timeout, an entry that can't be read in time is a miss and one
+    that can't be written in time isn't cached. Only the change log, whose
+    writes must not be lost, has a connection of its own that waits for
+    the lock, it is written once per database write.
+
+    The entries are evicted in least recently used order, approximately,
+    the last use of an entry is only written when it is older than
+    TOUCH_INTERVAL so the reads of hot entries stay reads. The number and
+    total size of the entries are kept by triggers, so nothing scans the
+    entries to know when to evict.
+    """
+
+    shared = True
+
+    # the change log is pruned to the last change of every table
+    # after this many changes
+    PRUNE_INTERVAL = 1000
+
+    # seconds before a read of an entry moves it to the end of the
+    # eviction order again
+    TOUCH_INTERVAL = 10.0
+
+    # the most entries deleted per statement, and the share of max_bytes the
+    # eviction frees down to, so it doesn't run again on the next set
+    EVICT_BATCH_SIZE = 100
+    EVICT_TARGET = 0.9
+
+    def __init__(
+        self, path: Path, max_bytes: int, sync_interval: float, busy_timeout_ms: int
+    ):
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self._versions: Dict[str, int] = {}
+        self._last_change = 0
+        self._synced_at = 0.0
+        self._log_connection = self._connect(path, LOG_BUSY_TIMEOUT_MS)
+        self._log_connection.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                -- when the entry was stored or last used
+                stored_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS IX_CacheEntriesStoredAt
+                ON cache_entries (stored_at);
+            CREATE TABLE IF NOT EXISTS cache_change_log (
+                change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache_totals (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            BEGIN IMMEDIATE;
+            INSERT OR IGNORE INTO cache_totals (name, value)
+                SELECT 'entries', COUNT(*) FROM cache_entries;
+            INSERT OR IGNORE INTO cache_totals (name, value)
+                SELECT 'size', COALESCE(SUM(size), 0) FROM cache_entries;
+            CREATE TRIGGER IF NOT EXISTS TR_CacheEntriesInsert
+                AFTER INSERT ON cache_entries BEGIN
+                UPDATE cache_totals SET value = value + 1 WHERE name = 'entries';
+                UPDATE cache_totals SET value = value + new.size
+                    WHERE name = 'size';
+            END;
+            CREATE TRIGGER IF NOT EXISTS TR_CacheEntriesUpdate
+                AFTER UPDATE OF size ON cache_entries BEGIN
+                UPDATE cache_totals SET value = value + new.size - old.size
+                    WHERE name = 'size';
+            END;
+            CREATE TRIGGER IF NOT EXISTS TR_CacheEntriesDelete
+                AFTER DELETE ON cache_entries BEGIN
+                UPDATE cache_totals SET value = value - 1 WHERE name = 'entries';
+                UPDATE cache_totals SET value = value - old.size
+                    WHERE name = 'size';
+            END;
+            COMMIT;
+        """)
+        self._connection = self._connect(path, busy_timeout_ms)
+
+    @staticmethod
+    def _connect(path: Path, busy_timeout_ms: int) -> sqlite3.Connection:
+        """
+        Open a connection to the cache file in autocommit mode
+
+        :param path: the path of the cache file
+        :param busy_timeout_ms: milliseconds a statement waits for the lock
+        :return: the connection
+        """
+        connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        connection.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        try:
+            row = self._connection.execute(
+                "SELECT value, stored_at FROM cache_entries "
+                "WHERE key = ? AND expires >= ?",
+                (key, now),
+            ).fetchone()
+            if row is not None and now - row[1] > self.TOUCH_INTERVAL:
+                self._connection.execute(
+                    "UPDATE cache_entries SET stored_at = ? WHERE key = ?", (now, key)
+                )
+        except sqlite3.OperationalError:
+            # locked by another worker for longer than the busy_timeout
+            return None
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            # an upsert and not INSERT OR REPLACE, whose implicit delete
+            # doesn't fire the delete trigger that keeps the totals
+            self._connection.execute(
+                """
+                INSERT INTO cache_entries (key, value, size, expires, stored_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = excluded.value,
+                    size = excluded.size,
+                    expires = excluded.expires,
+                    stored_at = excluded.stored_at
+                """,
+                (key, value, len(value), now + ttl, now),
+            )
+            if self._total("size") > self.max_bytes:
+                self._evict(now)
+        except sqlite3.OperationalError:
+            # locked by another worker for longer than the busy_timeout,
+            # the entry just isn't cached
+            pass
+
+    def _total(self, name: str) -> int:
+        """
+        Get a running total of the entries
+
+        :param name: the total, entries or size
+        :return: the total
+        """
+        return self._connection.execute(
+            "SELECT value FROM cache_totals WHERE name = ?", (name,)
+        ).fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        """
+        Drop the expired entries, then the least recently used entries a
+        batch at a time, until the cache is back under EVICT_TARGET of
+        max_bytes
+
+        :param now: the current time
+        """
+        target = self.max_bytes * self.EVICT_TARGET
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.execute(
+                "DELETE FROM cache_entries WHERE expires < ?", (now,)
+            )
+            while (size := self._total("size")) > target:
+                # the entries of average size that free enough, so a small
+                # cache isn't emptied by a single batch
+                entries = self._total("entries")
+                count = math.ceil((size - target) * entries / size)
+                self._connection.execute(
+                    """
+                    DELETE FROM cache_entries WHERE key IN (
+                        SELECT key FROM cache_entries ORDER BY stored_at LIMIT ?
+                    )
+                    """,
+                    (min(count, self.EVICT_BATCH_SIZE),),
+                )
+            self._connection.execute("COMMIT")
+        except sqlite3.Error:
+            self._connection.execute("ROLLBACK")
+            raise
+
+    def versions(self) -> Dict[str, int]:
+        now = time.monotonic()
+        if now - self._synced_at >= self.sync_interval:
+            try:
+                rows = self._connection.execute(
+                    """
+                    SELECT change_id, table_name FROM cache_change_log
+                    WHERE change_id > ? ORDER BY change_id
+                    """,
+                    (self._last_change,),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # locked for longer than the busy_timeout, the versions
+                # read so far are used until the next read succeeds
+                return self._versions
+            self._synced_at = now
+            for change_id, table_name in rows:
+                self._versions[table_name] = change_id
+                self._last_change = change_id
+        return self._versions
+
+    def bump(self, table_name: str) -> None:
+        change_id = self._log_connection.execute(
+            "INSERT INTO cache_change_log (table_name) VALUES (?)", (table_name,)
+        ).lastrowid
+        # the writing worker sees its own write right away
+        self._versions[table_name] = change_id
+        if change_id % self.PRUNE_INTERVAL == 0:
+            self._log_connection.execute("""
+                DELETE FROM cache_change_log WHERE change_id NOT IN (
+                    SELECT MAX(change_id) FROM cache_change_log GROUP BY table_name
+                )
+            """)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": self._total("entries"),
+            "size": self._total("size"),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class TableVersions:
+    """
+    The versions of the tables, bumped by the write paths in crud. The
+    version token of a set of tables changes whenever one of them is
+    modified. The versions of a backend that isn't shared only count the
+    writes of this process, so their tokens also hold the id of the process,
+    so a restarted process doesn't reuse the tokens of the data it replaced,
+    and the current ttl period, so the tokens expire and writes made by
+    other processes are picked up within ttl seconds.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.process_id = secrets.token_hex(4)
+
+    def get(self, table_name: str) -> int:
+        """
+        Get the version of the table
+
+        :param table_name: the name of the table
+        :return: the version, 0 if it hasn't been modified
+        """
+        return self.backend.versions().get(table_name, 0)
+
+    def bump(self, table_name: str) -> None:
+        """
+        Count a modification of the table
+
+        :param table_name: the name of the table that was modified
+        """
+        self.backend.bump(table_name)
+
+    def token(self, table_names: Iterable[str]) -> str:
+        """
+        Get the version token of the tables
+
+        :param table_names: the names of the tables
+        :return: the version token
+        """
+        versions = self.backend.versions()
+        token = ".".join(str(versions.get(table_name, 0)) for table_name in table_names)
+        if self.backend.shared:
+            return token
+        period = int(time.time() // self.ttl)
+        return f"{self.process_id}:{period}:{token}"
+
+
+class CountCache:
+    """
+    Cache of row counts keyed by table name and the parent filter of the
+    count (None for a whole table). Every count is stored with the version
+    of its table, so a write to the table invalidates all of its counts,
+    and entries expire after ttl seconds.
+    """
+
+    def __init__(self, backend: CacheBackend, versions: TableVersions, ttl: float):
+        self.backend = backend
+        self.versions = versions
+        self.ttl = ttl
+
+    def get(self, table_name: str, key: Hashable = None) -> Optional[int]:
+        """
+        Get the cached count, or None if it isn't cached, was counted
+        before the table was modified or has expired
+
+        :param table_name: the name of the table that was counted
+        :param key: the parent filter of the count
+        :return: the count or None
+        """
+        entry = self.backend.get(f"count:{table_name}:{key!r}")
+        if entry is None:
+            return None
+        version, count = entry.split(b":")
+        if int(version) != self.versions.get(table_name):
+            return None
+        return int(count)
+
+    def set(self, table_name: str, key: Hashable, count: int) -> None:
+        """
+        Cache the count
+
+        :param table_name: the name of the table that was counted
+        :param key: the parent filter of the count
+        :param count: the count to cache
+        """
+        version = self.versions.get(table_name)
+        self.backend.set(
+            f"count:{table_name}:{key!r}", f"{version}:{count}".encode(), self.ttl
+        )
+
+
+class FragmentCache:
+    """
+    Cache of rendered HTML fragments keyed by the request that rendered
+    them. Every fragment is stored with the version token of the tables it
+    was rendered from, and is rendered again when the token has changed
+    or after ttl seconds. The fragments of a paginated page are stored with
+    the number of pages, so the neighbours of a cached page are known.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: str) -> Optional[Tuple[bytes, Optional[int]]]:
+        """
+        Get the cached fragment, or None if it isn't cached, was rendered
+        from an older version of its tables or has expired
+
+        :param key: the request that rendered the fragment
+        :param version: the current version token of the fragment's tables
+        :return: Tuple of the fragment and its number of pages, or None
+        """
+        entry = self.backend.get(f"fragment:{key}")
+        if entry is not None:
+            fragment_version, _, entry = entry.partition(b"\n")
+            if fragment_version == version.encode():
+                self.hits += 1
+                total_pages, _, fragment = entry.partition(b"\n")
+                return fragment, int(total_pages) if total_pages else None
+        self.misses += 1
+        return None
+
+    def contains(self, key: str, version: str) -> bool:
+        """
+        Check if the fragment is cached and current, without counting
+        it as a hit or a miss
+
+        :param key: the request that rendered the fragment
+        :param version: the current version token of the fragment's tables
+        :return: True if the fragment is cached
+        """
+        entry = self.backend.get(f"fragment:{key}")
+        return entry is not None and entry.startswith(version.encode() + b"\n")
+
+    def set(
+        self,
+        key: str,
+        version: str,
+        fragment: bytes,
+        total_pages: Optional[int] = None,
+    ) -> None:
+        """
+        Cache the fragment
+
+        :param key: the request that rendered the fragment
+        :param version: the version token of the tables it was rendered from
+        :param fragment: the rendered fragment
+        :param total_pages: the number of pages, if the fragment is a page
+        """
+        pages = b"" if total_pages is None else str(total_pages).encode()
+        self.backend.set(
+            f"fragment:{key}",
+            version.encode() + b"\n" + pages + b"\n" + fragment,
+            self.ttl,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the counters of the cache, the hits and misses are
+        counted by every worker process on its own
+
+        :return: Dict of the hits, misses, and the backend's entries and size
+        """
+        return {"hits": self.hits, "misses": self.misses, **self.backend.stats()}
+
+
+def create_backend() -> CacheBackend:
+    """
+    Create the cache backend selected by the settings
+
+    :return: the cache backend
+    """
+    if settings.cache_backend == "sqlite":
+        return SQLiteBackend(
+            path=settings.cache_path,
+            max_bytes=settings.cache_max_bytes,
+            sync_interval=settings.cache_sync_interval_ms / 1000,
+            busy_timeout_ms=settings.cache_busy_timeout_ms,
+        )
+    return MemoryBackend(max_bytes=settings.cache_max_bytes)
+
+
+cache_backend = create_backend()
+table_versions = TableVersions(backend=cache_backend, ttl=settings.etag_ttl)
+count_cache = CountCache(
+    backend=cache_backend, versions=table_versions, ttl=settings.count_cache_ttl
+)
+fragment_cache = FragmentCache(backend=cache_backend, ttl=settings.fragment_cache_ttl)
@@ -0,0 +1,157 @@
+"""
+This module contains the application settings. The values are read
+once from the environment when the module is imported so the different
+configurations (pool sizes, SQLite pragma profiles, etc.) can be
+benchmarked against each other without changing any code.
+"""
+
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict
+
+
+DEFAULT_DB_PATH = Path(__file__).parent / "db" / "active" / "chinook.db"
+DEFAULT_CACHE_PATH = Path(__file__).parent / "db" / "active" / "cache.db"
+
+CACHE_BACKENDS = ("memory", "sqlite")
+
+# The SQLite pragma profiles that can be applied to every pooled connection.
+# The "default" profile keeps SQLite's built in settings (2MB page cache,
+# no mmap) and switches the persistent journal mode back to the rollback
+# journal, the "wal" profile only changes the journaling so readers aren't
+# blocked by writers, and the "tuned" profile adds a bigger page cache,
+# memory mapped reads and in memory temp storage.
+PRAGMA_PROFILES: Dict[str, Dict[str, str | int]] = {
+    "default": {"journal_mode": "DELETE"},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+    },
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+# pragmas that change the database file and can only be set by the writer
+PERSISTENT_PRAGMAS = frozenset({"journal_mode"})
+
+
+def _env_int(name: str, default: int) -> int:
+    """Get an integer setting from the environment, or the default if not set"""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    The application settings, each one can be overridden by
+    setting the environment variable of the same name in upper case
+    """
+
+    database_path: Path = field(
+        default_factory=lambda: Path(os.getenv("DATABASE_PATH", str(DEFAULT_DB_PATH)))
+    )
+    read_pool_size: int = field(default_factory=lambda: _env_int("READ_POOL_SIZE", 5))
+    sqlite_pragma_profile: str = field(
+        default_factory=lambda: os.getenv("SQLITE_PRAGMA_PROFILE", "tuned")
+    )
+    # optional overrides of the profile's cache_size (KiB) and mmap_size (bytes)
+    sqlite_cache_size_kb: int = field(
+        default_factory=lambda: _env_int("SQLITE_CACHE_SIZE_KB", 0)
+    )
+    sqlite_mmap_size: int = field(
+        default_factory=lambda: _env_int("SQLITE_MMAP_SIZE", -1)
+    )
+    # the backend of the caches, "memory" keeps a copy in every worker
+    # process, "sqlite" shares one copy between the workers of the host
+    # through the cache_path file
+    cache_backend: str = field(
+        default_factory=lambda: os.getenv("CACHE_BACKEND", "memory")
+    )
+    cache_path: Path = field(
+        default_factory=lambda: Path(os.getenv("CACHE_PATH", str(DEFAULT_CACHE_PATH)))
+    )
+    # total size in bytes of the cached counts and rendered HTMX fragments
+    cache_max_bytes: int = field(
+        default_factory=lambda: _env_int("CACHE_MAX_BYTES", 8 * 1024 * 1024)
+    )
+    # milliseconds between the reads of the shared change log, bounds how
+    # long writes made by other worker processes can go unnoticed
+    cache_sync_interval_ms: int = field(
+        default_factory=lambda: _env_int("CACHE_SYNC_INTERVAL_MS", 100)
+    )
+    # milliseconds a read or write of the shared cache waits, on the event
+    # loop, for the lock of another worker before it's a miss or skipped
+    cache_busy_timeout_ms: int = field(
+        default_factory=lambda: _env_int("CACHE_BUSY_TIMEOUT_MS", 20)
+    )
+    # seconds a cached COUNT(*) is trusted
+    count_cache_ttl: int = field(
+        default_factory=lambda: _env_int("COUNT_CACHE_TTL", 60)
+    )
+    # seconds an ETag of the memory backend stays valid without a write to
+    # its tables, it doesn't count the writes made by other workers
+    etag_ttl: int = field(default_factory=lambda: _env_int("ETAG_TTL", 60))
+    # seconds a rendered HTMX fragment is kept when its tables don't change
+    fragment_cache_ttl: int = field(
+        default_factory=lambda: _env_int("FRAGMENT_CACHE_TTL", 300)
+    )
+    # the neighbour pages of a tab waiting to be rendered into the fragment
+    # cache in the background, new pages are dropped when it's full, 0 turns
+    # the prefetching off
+    prefetch_queue_size: int = field(
+        default_factory=lambda: _env_int("PREFETCH_QUEUE_SIZE", 16)
+    )
+
+    # rows indexed per write transaction by the background search index
+    # build, and seconds between the merges of the index segments
+    search_index_batch_size: int = field(
+        default_factory=lambda: _env_int("SEARCH_INDEX_BATCH_SIZE", 500)
+    )
+    search_merge_interval: int = field(
+        default_factory=lambda: _env_int("SEARCH_MERGE_INTERVAL", 300)
+    )
+
+    def __post_init__(self):
+        if self.sqlite_pragma_profile not in PRAGMA_PROFILES:
+            raise ValueError(
+                f"Unknown SQLITE_PRAGMA_PROFILE {self.sqlite_pragma_profile!r}, "
+                f"expected one of {', '.join(PRAGMA_PROFILES)}"
+            )
+        if self.cache_backend not in CACHE_BACKENDS:
+            raise ValueError(
+                f"Unknown CACHE_BACKEND {self.cache_backend!r}, "
+                f"expected one of {', '.join(CACHE_BACKENDS)}"
+            )
+
+    def sqlite_pragmas(self, read_only: bool = False) -> Dict[str, str | int]:
+        """
+        Returns the pragmas to run on every new connection for the
+        configured profile, with the size overrides applied
+
+        :param read_only: leave out the pragmas only the writer can set
+        :return: Dict of pragma name to value
+        """
+        pragmas = dict(PRAGMA_PROFILES[self.sqlite_pragma_profile])
+        if self.sqlite_cache_size_kb > 0:
+            pragmas["cache_size"] = -self.sqlite_cache_size_kb
+        if self.sqlite_mmap_size >= 0:
+            pragmas["mmap_size"] = self.sqlite_mmap_size
+        if read_only:
+            pragmas = {
+                name: value
+                for name, value in pragmas.items()
+                if name not in PERSISTENT_PRAGMAS
+            }
+        return pragmas
+
+
+settings = Settings()
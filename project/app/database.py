@@ -1,39 +1,111 @@
-from pathlib import Path
-from typing import AsyncGenerator, List
+import asyncio
+from logging import getLogger
+from typing import AsyncContextManager, AsyncGenerator, Dict, List, Set, Tuple
 from contextlib import asynccontextmanager
 
+from fastapi import Request
 from sqlmodel import SQLModel
-from sqlalchemy import text
-from sqlalchemy.pool import StaticPool
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, AsyncConnection
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+    AsyncConnection,
+)
+
+from config import settings
+
 
+logger = getLogger(__name__)
 
-DB_PATH = Path(__file__).parent / "db" / "active" / "chinook.db"
+DB_PATH = settings.database_path
 DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
-POOL_SIZE = 5
+# read only connections are opened with a SQLite URI so the driver enforces mode=ro
+READ_DATABASE_URL = f"sqlite+aiosqlite:///file:{DB_PATH}?mode=ro&uri=true"
+POOL_SIZE = settings.read_pool_size
 
+# HTTP methods that never modify the database and can use a read session
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
 
-# create the async engine with connection pooling
-engine = create_async_engine(
+
+# create the async engine for the single writer connection, SQLite only
+# allows one writer at a time so queueing writers in the pool avoids
+# "database is locked" errors
+write_engine = create_async_engine(
     DATABASE_URL,
     echo=False,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
+    pool_size=1,
+    max_overflow=0,
+)
+
+# create the async engine with a pool of read only connections
+read_engine = create_async_engine(
+    READ_DATABASE_URL,
+    echo=False,
+    connect_args={"check_same_thread": False},
+    pool_size=POOL_SIZE,
+    max_overflow=0,
 )
 
 
+def apply_pragmas(engine: AsyncEngine, pragmas: Dict[str, str | int]) -> None:
+    """
+    Register a connect event handler on the engine that runs the
+    pragmas on every new pooled connection
+
+    :param engine: the engine whose connections get the pragmas
+    :param pragmas: Dict of pragma name to value
+    """
+    if not pragmas:
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+# the writer runs first (init_db) so it switches the journal mode before
+# any of the read only connections are opened
+apply_pragmas(write_engine, settings.sqlite_pragmas(read_only=False))
+apply_pragmas(read_engine, settings.sqlite_pragmas(read_only=True))
+
+
 async def init_db():
     """Initialize the database and create tables if they don't exist."""
-    async with engine.begin() as conn:
+    async with write_engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
-        # await TextSearchManager.create_virtual_table(conn)
-        # return "Text search initialized successfully"
-        return "Database initialized successfully"
+        await StatsManager.create_triggers(conn)
+        await StatsManager.rebuild(conn, only_empty=True)
+        journal_mode = await conn.scalar(text("PRAGMA journal_mode"))
+        await TextSearchManager.drop_legacy_index(conn)
+        await TextSearchManager.create_state_table(conn)
+        return (
+            "Database initialized successfully "
+            f"(pragma profile: {settings.sqlite_pragma_profile}, "
+            f"journal mode: {journal_mode})"
+        )
+
+
+async def close_db():
+    """Close all the pooled database connections."""
+    await read_engine.dispose()
+    await write_engine.dispose()
 
 
 @asynccontextmanager
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    """Provide a transactional scope for the database session."""
+async def get_session(read_only: bool = False) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Provide a transactional scope for a database session from either
+    the read only connection pool or the single writer connection.
+
+    :param read_only: use a connection from the read only pool
+    """
+    engine = read_engine if read_only else write_engine
     async with AsyncSession(engine) as session:
         try:
             yield session
@@ -41,114 +113,527 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+def get_db(request: Request) -> AsyncContextManager[AsyncSession]:
+    """
+    Dependency that provides a database session scope for the route. Requests
+    that can't modify the database (GET, HEAD, OPTIONS) get a session from
+    the read only pool so they don't queue behind each other or behind writes,
+    everything else gets the writer session.
+
+    :param request: the incoming request, used to pick the session type
+    """
+    return get_session(read_only=request.method in READ_METHODS)
+
+
 # Text search functionality
+#
+# bump the version whenever SEARCH_TABLES or the index definition changes,
+# the indexes built by an older version are then rebuilt in the background
+SEARCH_INDEX_VERSION = 2
+
+# the build mark of a fully built index
+INDEXED_ALL = 2**63 - 1
+
+# the searchable tables, the primary key that becomes the rowid of the
+# table's external content FTS5 index, the indexed text columns and the
+# expression of the index columns shown as the content of a search result
+SEARCH_TABLES: Dict[str, Tuple[str, Tuple[str, ...], str]] = {
+    "artists": ("ArtistId", ("Name",), "Name"),
+    "albums": ("AlbumId", ("Title",), "Title"),
+    "tracks": ("TrackId", ("Name", "Composer"), "Name"),
+    "customers": (
+        "CustomerId",
+        ("FirstName", "LastName", "Company", "Email", "City", "Country"),
+        "LastName || ', ' || FirstName",
+    ),
+}
+
+
 class TextSearchManager:
+    """
+    Builds and maintains the FTS5 indexes of the searchable tables.
+
+    The indexes are persistent and versioned, search_index_state holds the
+    index version of every table and how far its batched build has got
+    (indexed_through, the highest source rowid in the index, INDEXED_ALL
+    once the build is done). Startup only creates the state table, the
+    builds run as a background task in batches of short write transactions
+    so no worker ever waits on indexing. The triggers only index rows below
+    the mark, rows above it are picked up by the next batch, so writes made
+    during a build are never lost or indexed twice, and several workers can
+    work on the same build without coordinating.
+    """
+
+    # tables whose index is built at the current version, checked once per
+    # process by the search endpoint
+    ready_tables: Set[str] = set()
+
+    @staticmethod
+    def index_name(table_name: str) -> str:
+        """Returns the name of the FTS5 index of the table"""
+        return f"{table_name}_fts"
+
     @staticmethod
-    async def get_text_columns(conn: AsyncConnection) -> List[tuple]:
+    async def drop_legacy_index(conn: AsyncConnection):
+        """
+        Drops the old text_search table, which held a copy of every text
+        column of every table, and the triggers that kept it up to date
+        """
         result = await conn.execute(
             text("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name NOT LIKE 'sqlite_%'
-            AND name != 'text_search'
+            SELECT name FROM sqlite_master
+            WHERE type = 'trigger' AND name LIKE 'text\\_search\\_%' ESCAPE '\\'
         """)
         )
-        tables = result.fetchall()
-
-        text_columns = []
-        for (table_name,) in tables:
-            result = await conn.execute(text(f"PRAGMA table_info({table_name})"))
-            columns = result.fetchall()
-
-            for col in columns:
-                col_name = col[1]
-                col_type = col[2].upper()
-                if any(
-                    text_type in col_type
-                    for text_type in ["TEXT", "CHAR", "CLOB", "VARCHAR"]
-                ):
-                    text_columns.append((table_name, col_name, col_type))
-
-        return text_columns
+        for (trigger_name,) in result.fetchall():
+            await conn.execute(text(f'DROP TRIGGER IF EXISTS "{trigger_name}"'))
+        await conn.execute(text("DROP TABLE IF EXISTS text_search"))
 
     @staticmethod
-    async def create_virtual_table(conn: AsyncConnection):
-        # Create FTS5 virtual table
-        await conn.execute(text("DROP TABLE IF EXISTS text_search"))
+    async def create_state_table(conn: AsyncConnection):
+        """Creates the table holding the build state of every index"""
         await conn.execute(
             text("""
-            CREATE VIRTUAL TABLE text_search 
-            USING fts5(
-                table_name,
-                column_name,
-                content,
-                content_rowid UNINDEXED
+            CREATE TABLE IF NOT EXISTS search_index_state (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                indexed_through INTEGER NOT NULL,
+                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
             )
         """)
         )
 
-        # Get all text columns and populate the virtual table
-        text_columns = await TextSearchManager.get_text_columns(conn)
+    @staticmethod
+    async def create_virtual_table(conn: AsyncConnection, table_name: str):
+        """
+        Replaces the table's index with a new, empty, external content
+        FTS5 index at the current version. The index only stores the tokens,
+        the text itself is read from the source table by rowid, and the
+        extra prefix indexes make the 2 to 4 character prefix queries of the
+        typeahead a single lookup instead of a scan of the term list.
+        """
+        rowid, columns, _ = SEARCH_TABLES[table_name]
+        index_name = TextSearchManager.index_name(table_name)
+        for operation in ("insert", "update", "delete"):
+            await conn.execute(text(f"DROP TRIGGER IF EXISTS {index_name}_{operation}"))
+        await conn.execute(text(f"DROP TABLE IF EXISTS {index_name}"))
+        await conn.execute(
+            text(f"""
+            CREATE VIRTUAL TABLE {index_name}
+            USING fts5(
+                {", ".join(columns)},
+                content='{table_name}',
+                content_rowid='{rowid}',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3 4'
+            )
+        """)
+        )
+        await conn.execute(
+            text("""
+            INSERT OR REPLACE INTO search_index_state
+                (table_name, version, indexed_through, updated_at)
+            VALUES (:table_name, :version, 0, CURRENT_TIMESTAMP)
+        """),
+            {"table_name": table_name, "version": SEARCH_INDEX_VERSION},
+        )
+        await TextSearchManager.create_triggers(conn, table_name)
 
-        for table_name, column_name, _ in text_columns:
+    @staticmethod
+    async def create_triggers(conn: AsyncConnection, table_name: str):
+        """
+        Creates the triggers that keep the table's external content index
+        in step with the table, an external content index has to be told
+        the old values of a row to remove it with the 'delete' command.
+        Rows above the build mark aren't in the index yet and are skipped.
+        """
+        rowid, columns, _ = SEARCH_TABLES[table_name]
+        index_name = TextSearchManager.index_name(table_name)
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"NEW.{column}" for column in columns)
+        old_values = ", ".join(f"OLD.{column}" for column in columns)
+        indexed_through = (
+            "(SELECT indexed_through FROM search_index_state "
+            f"WHERE table_name = '{table_name}')"
+        )
+        insert = f"""
+            INSERT INTO {index_name} (rowid, {column_list})
+            SELECT NEW.{rowid}, {new_values}
+            WHERE NEW.{rowid} <= {indexed_through};
+        """
+        delete = f"""
+            INSERT INTO {index_name} ({index_name}, rowid, {column_list})
+            SELECT 'delete', OLD.{rowid}, {old_values}
+            WHERE OLD.{rowid} <= {indexed_through};
+        """
+        triggers = {
+            "insert": ("INSERT", insert),
+            "update": (f"UPDATE OF {rowid}, {column_list}", delete + insert),
+            "delete": ("DELETE", delete),
+        }
+        for operation, (event_clause, body) in triggers.items():
             await conn.execute(
                 text(f"""
-                INSERT INTO text_search (table_name, column_name, content, content_rowid)
-                SELECT 
-                    '{table_name}' AS table_name,
-                    '{column_name}' AS column_name,
-                    {column_name} AS content,
-                    rowid AS content_rowid
-                FROM {table_name}
-                WHERE {column_name} IS NOT NULL
+                CREATE TRIGGER IF NOT EXISTS {index_name}_{operation}
+                AFTER {event_clause} ON {table_name}
+                BEGIN
+                    {body}
+                END
             """)
             )
 
-            # Create triggers
-            await TextSearchManager.create_triggers(conn, table_name, column_name)
+    @staticmethod
+    async def index_batch(table_name: str, batch_size: int) -> bool:
+        """
+        Indexes the next batch of rows of the table in its own write
+        transaction, creating a new index first if the table's index
+        is missing or was built by an older version
+
+        :param table_name: the searchable table to index
+        :param batch_size: the most rows to index in the transaction
+        :return: True once every row of the table is indexed
+        """
+        rowid, columns, _ = SEARCH_TABLES[table_name]
+        index_name = TextSearchManager.index_name(table_name)
+        params = {"table_name": table_name}
+        async with write_engine.begin() as conn:
+            # write first so the transaction holds the write lock before it
+            # reads the state another worker could be changing
+            await conn.execute(
+                text("""
+                UPDATE search_index_state SET updated_at = CURRENT_TIMESTAMP
+                WHERE table_name = :table_name
+            """),
+                params,
+            )
+            state = (
+                await conn.execute(
+                    text("""
+                    SELECT version, indexed_through FROM search_index_state
+                    WHERE table_name = :table_name
+                """),
+                    params,
+                )
+            ).first()
+            if state is None or state.version != SEARCH_INDEX_VERSION:
+                await TextSearchManager.create_virtual_table(conn, table_name)
+                indexed_through = 0
+            else:
+                indexed_through = state.indexed_through
+            if indexed_through == INDEXED_ALL:
+                return True
 
-        await conn.commit()
+            batch_params = {"indexed_through": indexed_through, "limit": batch_size}
+            batch_end = await conn.scalar(
+                text(f"""
+                SELECT MAX({rowid}) FROM (
+                    SELECT {rowid} FROM {table_name}
+                    WHERE {rowid} > :indexed_through
+                    ORDER BY {rowid} LIMIT :limit
+                )
+            """),
+                batch_params,
+            )
+            if batch_end is not None:
+                await conn.execute(
+                    text(f"""
+                    INSERT INTO {index_name} (rowid, {", ".join(columns)})
+                    SELECT {rowid}, {", ".join(columns)} FROM {table_name}
+                    WHERE {rowid} > :indexed_through AND {rowid} <= :batch_end
+                """),
+                    {**batch_params, "batch_end": batch_end},
+                )
+            await conn.execute(
+                text("""
+                UPDATE search_index_state SET indexed_through = :indexed_through
+                WHERE table_name = :table_name
+            """),
+                {
+                    **params,
+                    "indexed_through": batch_end
+                    if batch_end is not None
+                    else INDEXED_ALL,
+                },
+            )
+            if batch_end is None:
+                # the build is done, merge its many small segments
+                await conn.execute(
+                    text(f"INSERT INTO {index_name}({index_name}) VALUES ('optimize')")
+                )
+                return True
+        return False
 
     @staticmethod
-    async def create_triggers(conn: AsyncConnection, table_name: str, column_name: str):
-        # Insert trigger
-        await conn.execute(
-            text(f"""
-            CREATE TRIGGER IF NOT EXISTS text_search_{table_name}_{column_name}_insert 
-            AFTER INSERT ON {table_name}
-            WHEN NEW.{column_name} IS NOT NULL
-            BEGIN
-                INSERT INTO text_search (table_name, column_name, content, content_rowid)
-                VALUES ('{table_name}', '{column_name}', NEW.{column_name}, NEW.rowid);
-            END
-        """)
-        )
+    async def merge(table_name: str, pages: int):
+        """
+        Runs an incremental FTS5 merge of the index segments created by
+        the triggers, bounded to roughly the given number of pages
 
-        # Update trigger
-        await conn.execute(
-            text(f"""
-            CREATE TRIGGER IF NOT EXISTS text_search_{table_name}_{column_name}_update 
-            AFTER UPDATE ON {table_name}
-            WHEN NEW.{column_name} IS NOT NULL
-            BEGIN
-                UPDATE text_search 
-                SET content = NEW.{column_name}
-                WHERE table_name = '{table_name}' 
-                AND column_name = '{column_name}'
-                AND content_rowid = OLD.rowid;
-            END
-        """)
-        )
+        :param table_name: the searchable table whose index is merged
+        :param pages: how much work the merge may do
+        """
+        index_name = TextSearchManager.index_name(table_name)
+        async with write_engine.begin() as conn:
+            await conn.execute(
+                text(
+                    f"INSERT INTO {index_name}({index_name}, rank) VALUES ('merge', :pages)"
+                ),
+                {"pages": pages},
+            )
 
-        # Delete trigger
-        await conn.execute(
-            text(f"""
-            CREATE TRIGGER IF NOT EXISTS text_search_{table_name}_{column_name}_delete 
-            AFTER DELETE ON {table_name}
-            BEGIN
-                DELETE FROM text_search 
-                WHERE table_name = '{table_name}' 
-                AND column_name = '{column_name}'
-                AND content_rowid = OLD.rowid;
-            END
-        """)
+    @staticmethod
+    async def run_background_tasks():
+        """
+        Builds every index that is missing or out of date, then merges the
+        index segments every search_merge_interval seconds. Runs as a task
+        started by the application lifespan, off the request path.
+        """
+        for table_name in SEARCH_TABLES:
+            try:
+                while not await TextSearchManager.index_batch(
+                    table_name, settings.search_index_batch_size
+                ):
+                    # let the requests queued on the writer go first
+                    await asyncio.sleep(0)
+                logger.info(f"Search index of {table_name} is ready")
+            except SQLAlchemyError:
+                logger.exception(f"Failed to build the search index of {table_name}")
+
+        while True:
+            await asyncio.sleep(settings.search_merge_interval)
+            for table_name in SEARCH_TABLES:
+                try:
+                    await TextSearchManager.merge(table_name, pages=500)
+                except SQLAlchemyError:
+                    logger.exception(
+                        f"Failed to merge the search index of {table_name}"
+                    )
+
+    @staticmethod
+    async def is_ready(session: AsyncSession, table_names: List[str]) -> bool:
+        """
+        Checks the build state marker of the indexes of the tables
+
+        :param session: the session to read the state with
+        :param table_names: the searchable tables to check
+        :return: True if all their indexes are fully built
+        """
+        pending = set(table_names) - TextSearchManager.ready_tables
+        if pending:
+            result = await session.execute(
+                text("""
+                SELECT table_name FROM search_index_state
+                WHERE version = :version AND indexed_through = :indexed_all
+            """),
+                {"version": SEARCH_INDEX_VERSION, "indexed_all": INDEXED_ALL},
+            )
+            TextSearchManager.ready_tables.update(result.scalars().all())
+        return not (pending - TextSearchManager.ready_tables)
+
+
+# Materialized aggregates for the HTMX application views
+#
+# the columns and aggregate query of every stats table, {where} is either
+# empty to build the whole table or restricts the query to the rows
+# being refreshed
+STATS_TABLES: Dict[str, Tuple[str, str, str]] = {
+    "artist_stats": (
+        "ArtistId, Name, AlbumCount, TrackCount",
+        "artists.ArtistId",
+        """
+        SELECT artists.ArtistId, artists.Name,
+               COUNT(DISTINCT albums.AlbumId), COUNT(DISTINCT tracks.TrackId)
+        FROM artists
+        LEFT JOIN albums ON albums.ArtistId = artists.ArtistId
+        LEFT JOIN tracks ON tracks.AlbumId = albums.AlbumId
+        {where}
+        GROUP BY artists.ArtistId
+        """,
+    ),
+    "album_stats": (
+        "AlbumId, Title, ArtistName, Duration, Price",
+        "albums.AlbumId",
+        """
+        SELECT albums.AlbumId, albums.Title, artists.Name,
+               SUM(tracks.Milliseconds), SUM(tracks.UnitPrice)
+        FROM albums
+        JOIN artists ON artists.ArtistId = albums.ArtistId
+        JOIN tracks ON tracks.AlbumId = albums.AlbumId
+        {where}
+        GROUP BY albums.AlbumId
+        """,
+    ),
+    "customer_stats": (
+        "CustomerId, FullName, OrdersTotal, OrdersTotalSpent",
+        "customers.CustomerId",
+        """
+        SELECT customers.CustomerId,
+               customers.LastName || ', ' || customers.FirstName,
+               COUNT(invoices.InvoiceId), SUM(invoices.Total)
+        FROM customers
+        JOIN invoices ON invoices.CustomerId = customers.CustomerId
+        {where}
+        GROUP BY customers.CustomerId
+        """,
+    ),
+    "employee_stats": (
+        "EmployeeId, EmployeeFullName, ManagerFullName, ManagerTitle, "
+        "TotalCustomers, TotalCustomersSpent",
+        "employee.EmployeeId",
+        """
+        SELECT employee.EmployeeId,
+               employee.LastName || ', ' || employee.FirstName,
+               COALESCE(manager.LastName || ', ' || manager.FirstName, ''),
+               COALESCE(manager.Title, ''),
+               COUNT(DISTINCT customers.CustomerId),
+               COALESCE(SUM(invoices.Total), 0)
+        FROM employees AS employee
+        LEFT JOIN employees AS manager ON manager.EmployeeId = employee.ReportsTo
+        LEFT JOIN customers ON customers.SupportRepId = employee.EmployeeId
+        LEFT JOIN invoices ON invoices.CustomerId = customers.CustomerId
+        {where}
+        GROUP BY employee.EmployeeId
+        """,
+    ),
+}
+
+# for every source table, the columns the aggregates read and the stats rows
+# to refresh when they change, each {Column} in the keys expression is
+# replaced by the OLD and/or NEW value of that column in the changed row
+STATS_TRIGGERS: Dict[str, Tuple[str, List[Tuple[str, str]]]] = {
+    "artists": (
+        "ArtistId, Name",
+        [
+            ("artist_stats", "{ArtistId}"),
+            (
+                "album_stats",
+                "SELECT AlbumId FROM albums WHERE ArtistId IN ({ArtistId})",
+            ),
+        ],
+    ),
+    "albums": (
+        "AlbumId, Title, ArtistId",
+        [
+            ("album_stats", "{AlbumId}"),
+            ("artist_stats", "{ArtistId}"),
+        ],
+    ),
+    "tracks": (
+        "TrackId, AlbumId, Milliseconds, UnitPrice",
+        [
+            ("album_stats", "{AlbumId}"),
+            (
+                "artist_stats",
+                "SELECT ArtistId FROM albums WHERE AlbumId IN ({AlbumId})",
+            ),
+        ],
+    ),
+    "customers": (
+        "CustomerId, FirstName, LastName, SupportRepId",
+        [
+            ("customer_stats", "{CustomerId}"),
+            ("employee_stats", "{SupportRepId}"),
+        ],
+    ),
+    "invoices": (
+        "InvoiceId, CustomerId, Total",
+        [
+            ("customer_stats", "{CustomerId}"),
+            (
+                "employee_stats",
+                "SELECT SupportRepId FROM customers WHERE CustomerId IN ({CustomerId})",
+            ),
+        ],
+    ),
+    "employees": (
+        "EmployeeId, FirstName, LastName, Title, ReportsTo",
+        [
+            # the employee and everyone reporting to them, whose manager
+            # name and title come from this row
+            ("employee_stats", "{EmployeeId}"),
+            (
+                "employee_stats",
+                "SELECT EmployeeId FROM employees WHERE ReportsTo IN ({EmployeeId})",
+            ),
+        ],
+    ),
+}
+
+
+class _TriggerRows(dict):
+    """Formats {Column} as the column of the OLD and/or NEW trigger rows"""
+
+    def __init__(self, rows: Tuple[str, ...]):
+        super().__init__()
+        self.rows = rows
+
+    def __missing__(self, column: str) -> str:
+        return ", ".join(f"{row}.{column}" for row in self.rows)
+
+
+class StatsManager:
+    @staticmethod
+    def refresh_statements(stats_table: str, keys: str) -> str:
+        """
+        Returns the statements that recompute the rows of a stats table
+
+        :param stats_table: the name of the stats table
+        :param keys: SQL expression list or sub query of the ids to recompute
+        :return: the DELETE and INSERT statements
+        """
+        columns, key_column, query = STATS_TABLES[stats_table]
+        stats_key = columns.split(",")[0]
+        select = query.format(where=f"WHERE {key_column} IN ({keys})")
+        return (
+            f"DELETE FROM {stats_table} WHERE {stats_key} IN ({keys});\n"
+            f"INSERT INTO {stats_table} ({columns}) {select};"
         )
+
+    @staticmethod
+    async def create_triggers(conn: AsyncConnection):
+        """
+        Creates the triggers that keep the stats tables in step with
+        every insert, update and delete of the tables they aggregate
+        """
+        trigger_rows = {
+            "insert": ("NEW",),
+            "update": ("OLD", "NEW"),
+            "delete": ("OLD",),
+        }
+        for table_name, (columns, dependents) in STATS_TRIGGERS.items():
+            for operation, rows in trigger_rows.items():
+                event_clause = operation.upper()
+                if operation == "update":
+                    event_clause = f"UPDATE OF {columns}"
+                body = "\n".join(
+                    StatsManager.refresh_statements(
+                        stats_table, keys.format_map(_TriggerRows(rows))
+                    )
+                    for stats_table, keys in dependents
+                )
+                await conn.execute(
+                    text(f"""
+                    CREATE TRIGGER IF NOT EXISTS stats_{table_name}_{operation}
+                    AFTER {event_clause} ON {table_name}
+                    BEGIN
+                        {body}
+                    END
+                """)
+                )
+
+    @staticmethod
+    async def rebuild(conn: AsyncConnection, only_empty: bool = False):
+        """
+        Recomputes every row of the stats tables
+
+        :param only_empty: only build the stats tables that have no rows yet
+        """
+        for stats_table, (columns, _, query) in STATS_TABLES.items():
+            if only_empty and await conn.scalar(
+                text(f"SELECT EXISTS (SELECT 1 FROM {stats_table})")
+            ):
+                continue
+            await conn.execute(text(f"DELETE FROM {stats_table}"))
+            await conn.execute(
+                text(f"INSERT INTO {stats_table} ({columns}) {query.format(where='')}")
+            )
@@ -1,9 +1,37 @@
+import asyncio
+from functools import wraps
+from logging import getLogger
 from pathlib import Path as PathlibPath
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+from urllib.parse import urlencode
 
-from database import get_db
-from fastapi import APIRouter, Depends, Query, Request
-from fastapi.responses import HTMLResponse
+from cache import fragment_cache, table_versions
+from config import settings
+from database import (
+    SEARCH_TABLES,
+    STATS_TRIGGERS,
+    TextSearchManager,
+    get_db,
+    get_session,
+)
+from endpoints.crud import decode_cursor, encode_cursor
+from endpoints.search import build_match_expression
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
+from markupsafe import Markup, escape
+from middleware import conditional_get
 from models.albums import Album, AlbumRead  # noqa: F401
 from models.artists import Artist, ArtistRead  # noqa: F401
 from models.customers import Customer, CustomerRead  # noqa: F401
@@ -13,13 +41,28 @@ from models.invoices import Invoice, InvoiceRead  # noqa: F401
 from models.playlist_track import PlaylistTrack  # noqa: F401
 from models.playlists import Playlist, PlaylistRead  # noqa: F401
 from models.tracks import Track, TrackRead  # noqa: F401
-from sqlalchemy import asc, desc, distinct, func, select
+from models.stats import AlbumStats, ArtistStats, CustomerStats, EmployeeStats
+from sqlalchemy import (
+    Float,
+    Numeric,
+    and_,
+    asc,
+    desc,
+    func,
+    select,
+    text,
+    true,
+    tuple_,
+    type_coerce,
+)
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased
+from sqlalchemy.sql.elements import ColumnElement
 from sqlalchemy.sql.selectable import Select
 
 # import jinja_partials
 
+logger = getLogger(__name__)
 
 # initialize the Jinja2 templates
 templates_dir = PathlibPath(__file__).resolve().parent.parent / "templates"
@@ -27,6 +70,301 @@ templates = Jinja2Templates(directory=templates_dir)
 # jinja_partials.register_starlette_extensions(templates)
 
 
+# the stats table behind every tab of the application
+STATS_CLASSES = {
+    "artists": ArtistStats,
+    "albums": AlbumStats,
+    "customers": CustomerStats,
+    "employees": EmployeeStats,
+}
+
+# the source tables of every tab, the tab's stats rows are recomputed
+# by the triggers of these tables so a write to any of them changes the tab
+TAB_TABLES = {
+    tab: tuple(
+        table_name
+        for table_name, (_, dependents) in STATS_TRIGGERS.items()
+        if any(
+            stats_table == stats_class.__tablename__ for stats_table, _ in dependents
+        )
+    )
+    for tab, stats_class in STATS_CLASSES.items()
+}
+# the pagination of any tab, the tab is a query parameter
+PAGINATION_TABLES = tuple(sorted(set().union(*TAB_TABLES.values())))
+
+# the data-sort values of the table headers and the columns they sort by
+SORT_COLUMNS = {
+    "artist_name": ArtistStats.name,
+    "artist_album_count": ArtistStats.album_count,
+    "artist_track": ArtistStats.track_count,
+    "album_title": AlbumStats.title,
+    "album_artist": AlbumStats.artist_name,
+    "album_duration": AlbumStats.duration,
+    "album_price": AlbumStats.price,
+    "customer_name": CustomerStats.full_name,
+    "customer_orders": CustomerStats.orders_total,
+    "customer_orders_spent": CustomerStats.orders_total_spent,
+    "employee_fullname": EmployeeStats.employee_fullname,
+    "manager_fullname": EmployeeStats.manager_fullname,
+    "manager_title": EmployeeStats.manager_title,
+    "employee_total_customers": EmployeeStats.employee_total_customers,
+    "employee_total_customers_spent": EmployeeStats.employee_total_customers_spent,
+}
+
+# the order of a tab before a column header has been clicked
+DEFAULT_SORT_COLUMNS = {
+    ArtistStats: ArtistStats.name,
+    AlbumStats: AlbumStats.title,
+    CustomerStats: CustomerStats.full_name,
+    EmployeeStats: EmployeeStats.employee_fullname,
+}
+
+
+# the tables and name columns searched by the typeahead, and the
+# shortest input worth searching for
+TYPEAHEAD_COLUMNS = {
+    "artists": "Name",
+    "albums": "Title",
+    "tracks": "Name",
+}
+TYPEAHEAD_MIN_LENGTH = 2
+
+
+def build_typeahead_query() -> str:
+    """
+    Builds the typeahead query, the best matches of every table are picked
+    from its FTS5 index first (ORDER BY rank with a LIMIT is answered by the
+    index), then merged by rank. The matched text is marked with control
+    characters so it can be highlighted after the text has been escaped.
+    """
+    selects = []
+    for table_name, column_name in TYPEAHEAD_COLUMNS.items():
+        index_name = TextSearchManager.index_name(table_name)
+        column_index = SEARCH_TABLES[table_name][1].index(column_name)
+        selects.append(f"""
+            SELECT * FROM (
+                SELECT '{table_name}' AS table_name,
+                       rowid AS id,
+                       highlight({index_name}, {column_index}, char(2), char(3))
+                           AS content,
+                       rank
+                FROM {index_name}
+                WHERE {index_name} MATCH :{table_name}
+                ORDER BY rank LIMIT :limit
+            )
+        """)
+    return " UNION ALL ".join(selects) + " ORDER BY rank LIMIT :limit"
+
+
+TYPEAHEAD_QUERY = build_typeahead_query()
+
+
+def fragment_key(path: str, params: Iterable[Tuple[str, str]]) -> str:
+    """
+    Builds the fragment cache key of a request, the query parameters are
+    sorted so their order in the request doesn't matter
+
+    :param path: the path of the request
+    :param params: the query parameters of the request
+    :return: the cache key
+    """
+    return f"{path}?{urlencode(sorted(params))}"
+
+
+def page_params(
+    items_per_page: int, sort: Optional[str] = None, direction: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    The query parameters, besides the current_page, of the requests that
+    page through a tab, sent by the pagination links and used to prefetch
+    the pages the links point to
+
+    :param items_per_page: the rows on a page
+    :param sort: the data column the rows are sorted by, if any
+    :param direction: the sorting direction, if any
+    :return: Dict of the query parameters
+    """
+    params = {"items_per_page": str(items_per_page)}
+    if sort is not None:
+        params["sort"] = sort
+    if direction is not None:
+        params["direction"] = direction
+    return params
+
+
+class PagePrefetcher:
+    """
+    Renders the pages next to the page being read into the fragment cache
+    so the next click on the pagination is answered from the cache. The
+    pages wait in a bounded queue and are rendered one at a time by the
+    run() task, off the request path and with a single read connection.
+    Pages are dropped when the queue is full, they are only a guess.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(maxsize, 1))
+        # the keys of the queued pages, so a page is only queued once
+        self.pending: Set[str] = set()
+        self.prefetched = 0
+        self.dropped = 0
+
+    def schedule(
+        self,
+        key: str,
+        table_names: Tuple[str, ...],
+        render: Callable[[], Awaitable[Response]],
+    ) -> None:
+        """
+        Queue a page to be rendered, unless it is queued or cached already
+
+        :param key: the fragment cache key of the page
+        :param table_names: the names of the tables the page is rendered from
+        :param render: renders the page
+        """
+        if self.maxsize <= 0 or key in self.pending:
+            return
+        if fragment_cache.contains(key, table_versions.token(table_names)):
+            return
+        try:
+            self.queue.put_nowait((key, table_names, render))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self.pending.add(key)
+
+    async def run(self):
+        """
+        Renders the queued pages, runs as a task started by the
+        application lifespan
+        """
+        while True:
+            key, table_names, render = await self.queue.get()
+            try:
+                # the tables may have changed, or the page was requested,
+                # while the page was waiting
+                version = table_versions.token(table_names)
+                if not fragment_cache.contains(key, version):
+                    response = await render()
+                    fragment_cache.set(
+                        key, version, response.body, response_total_pages(response)
+                    )
+                    self.prefetched += 1
+            except Exception:
+                logger.exception(f"Failed to prefetch {key}")
+            finally:
+                self.pending.discard(key)
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the counters of the prefetcher
+
+        :return: Dict of the prefetched, dropped and queued pages
+        """
+        return {
+            "prefetched": self.prefetched,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+        }
+
+
+page_prefetcher = PagePrefetcher(maxsize=settings.prefetch_queue_size)
+
+
+def prefetch_neighbours(
+    request: Request,
+    route: Callable[..., Awaitable[Response]],
+    kwargs: Dict,
+    table_names: Tuple[str, ...],
+    total_pages: int,
+) -> None:
+    """
+    Queue the previous and the next page of the page being served, with
+    the query parameters the pagination links request them with
+
+    :param request: the request of the page being served
+    :param route: the undecorated route that renders the pages
+    :param kwargs: the arguments the route was called with
+    :param table_names: the names of the tables the pages are rendered from
+    :param total_pages: the number of pages, there is no page after the last
+    """
+    current_page = kwargs["current_page"]
+    params = page_params(kwargs["items_per_page"], kwargs["sort"], kwargs["direction"])
+    for page in (current_page + 1, current_page - 1):
+        if page < 1 or page > total_pages:
+            continue
+        page_query = {**params, "current_page": str(page)}
+        page_request = Request(
+            {**request.scope, "query_string": urlencode(page_query).encode()}
+        )
+        page_kwargs = {**kwargs, "current_page": page}
+
+        async def render(page_request=page_request, page_kwargs=page_kwargs):
+            # the session of the request is closed by the time the page
+            # is rendered, so the page gets its own
+            page_kwargs["db"] = get_session(read_only=True)
+            return await route(request=page_request, **page_kwargs)
+
+        page_prefetcher.schedule(
+            fragment_key(request.url.path, page_query.items()), table_names, render
+        )
+
+
+def response_total_pages(response: Response) -> Optional[int]:
+    """
+    Get the number of pages of a rendered page, from the pagination context
+    of its template
+
+    :param response: the rendered page
+    :return: the number of pages, None for the chunks of the infinite
+        scroll mode and the fragments without pagination
+    """
+    context = getattr(response, "context", None) or {}
+    return context.get("total_pages")
+
+
+def cache_fragment(
+    *table_names: str, prefetch: bool = False
+) -> Callable[[Callable[..., Awaitable[Response]]], Callable[..., Awaitable[Response]]]:
+    """
+    Decorator that serves the route's rendered fragment from the fragment
+    cache. The fragment is keyed by the path and query parameters of the
+    request (sort, direction, current_page, items_per_page, tab) and is
+    rendered again when one of the tables it is rendered from changes.
+
+    :param table_names: the names of the tables the fragment is rendered from
+    :param prefetch: render the previous and the next page of the route's
+        page into the cache in the background
+    :return: the decorator
+    """
+
+    def decorator(
+        route: Callable[..., Awaitable[Response]],
+    ) -> Callable[..., Awaitable[Response]]:
+        @wraps(route)
+        async def cached_route(request: Request, **kwargs) -> Response:
+            key = fragment_key(request.url.path, request.query_params.multi_items())
+            version = table_versions.token(table_names)
+            cached = fragment_cache.get(key, version)
+            if cached is not None:
+                fragment, total_pages = cached
+                response = HTMLResponse(content=fragment)
+            else:
+                response = await route(request=request, **kwargs)
+                total_pages = response_total_pages(response)
+                fragment_cache.set(key, version, response.body, total_pages)
+            # the chunks of the infinite scroll mode have no neighbour pages
+            if prefetch and total_pages is not None:
+                prefetch_neighbours(request, route, kwargs, table_names, total_pages)
+            return response
+
+        return cached_route
+
+    return decorator
+
+
 # create a router for the model
 router = APIRouter(
     tags=["Application"],
@@ -78,7 +416,12 @@ async def get_template(
     )
 
 
-@router.get("/artists", response_class=HTMLResponse)
+@router.get(
+    "/artists",
+    response_class=HTMLResponse,
+    dependencies=[Depends(conditional_get(*TAB_TABLES["artists"]))],
+)
+@cache_fragment(*TAB_TABLES["artists"], prefetch=True)
 async def get_artists(
     request: Request,
     db: AsyncSession = Depends(get_db),
@@ -86,46 +429,62 @@ async def get_artists(
     direction: str = Query(None, alias="direction"),
     current_page: int = Query(1, alias="current_page"),
     items_per_page: int = Query(10, alias="items_per_page"),
+    scroll: bool = Query(False, alias="scroll"),
+    cursor: str = Query(None, alias="cursor"),
 ):
     # Log received parameters
     print(f"Current Page: {current_page}")
     print(f"Items Per Page: {items_per_page}")
 
-    limit = items_per_page
-    offset = items_per_page * (current_page - 1)
     async with db as session:
-        query = (
-            select(
-                Artist.id,
-                Artist.name,
-                func.count(distinct(Album.id)).label("album_count"),
-                func.count(distinct(Track.id)).label("track_count"),
-            )
-            .outerjoin(Artist.albums)
-            .outerjoin(Album.tracks)
-            .offset(offset)
-            .limit(limit)
-            .group_by(Artist.name)
+        query = select(
+            ArtistStats.id,
+            ArtistStats.name,
+            ArtistStats.album_count,
+            ArtistStats.track_count,
         )
-        query = query_order_by(
-            query=query, path=request.url.path, sort=sort, direction=direction
+        rows, total_items, next_cursor = await read_tab_page(
+            session=session,
+            query=query,
+            path=request.url.path,
+            sort=sort,
+            direction=direction,
+            current_page=current_page,
+            items_per_page=items_per_page,
+            scroll=scroll,
+            cursor=cursor,
         )
-        results = await session.execute(query)
 
     # Convert each row to a dictionary
-    results_list = [row._mapping for row in results.fetchall()]
+    results_list = [row._mapping for row in rows]
 
     retval = templates.TemplateResponse(
         name="partials/artists.html",
         context={
             "request": request,
             "artists": results_list,
+            **build_navigation(
+                tab="artists",
+                total_items=total_items,
+                items_per_page=items_per_page,
+                current_page=current_page,
+                sort=sort,
+                direction=direction,
+                scroll=scroll,
+                cursor=cursor,
+                next_cursor=next_cursor,
+            ),
         },
     )
     return retval
 
 
-@router.get("/albums", response_class=HTMLResponse)
+@router.get(
+    "/albums",
+    response_class=HTMLResponse,
+    dependencies=[Depends(conditional_get(*TAB_TABLES["albums"]))],
+)
+@cache_fragment(*TAB_TABLES["albums"], prefetch=True)
 async def get_albums(
     request: Request,
     db: AsyncSession = Depends(get_db),
@@ -133,44 +492,44 @@ async def get_albums(
     direction: str = Query(None, alias="direction"),
     current_page: int = Query(1, alias="current_page"),
     items_per_page: int = Query(10, alias="items_per_page"),
+    scroll: bool = Query(False, alias="scroll"),
+    cursor: str = Query(None, alias="cursor"),
 ):
     # Log received parameters
     print(f"Current Page: {current_page}")
     print(f"Items Per Page: {items_per_page}")
 
-    limit = items_per_page
-    offset = items_per_page * (current_page - 1)
     async with db as session:
-        query = (
-            select(
-                Album.title,
-                Artist.name.label("album_artist"),
-                func.sum(Track.milliseconds).label("album_duration"),
-                func.sum(Track.unit_price).label("album_price"),
-            )
-            .join(Album.artist)
-            .join(Album.tracks)
-            .offset(offset)
-            .limit(limit)
-            .group_by(Album.title)
+        query = select(
+            AlbumStats.title,
+            AlbumStats.artist_name,
+            AlbumStats.duration,
+            AlbumStats.price,
         )
-        query = query_order_by(
-            query=query, path=request.url.path, sort=sort, direction=direction
+        rows, total_items, next_cursor = await read_tab_page(
+            session=session,
+            query=query,
+            path=request.url.path,
+            sort=sort,
+            direction=direction,
+            current_page=current_page,
+            items_per_page=items_per_page,
+            scroll=scroll,
+            cursor=cursor,
         )
-        results = await session.execute(query)
 
     # Convert each row to a dictionary
     results_list = []
-    for row in results.fetchall():
-        duration_seconds = row.album_duration / 1000
+    for row in rows:
+        duration_seconds = row.duration / 1000
         minutes, seconds = divmod(duration_seconds, 60)
         results_list.append(
             {
                 "title": row.title,
-                "artist": row.album_artist,
+                "artist": row.artist_name,
                 "minutes": int(minutes),
                 "seconds": int(seconds),
-                "price": row.album_price,
+                "price": row.price,
             }
         )
     retval = templates.TemplateResponse(
@@ -178,12 +537,28 @@ async def get_albums(
         context={
             "request": request,
             "albums": results_list,
+            **build_navigation(
+                tab="albums",
+                total_items=total_items,
+                items_per_page=items_per_page,
+                current_page=current_page,
+                sort=sort,
+                direction=direction,
+                scroll=scroll,
+                cursor=cursor,
+                next_cursor=next_cursor,
+            ),
         },
     )
     return retval
 
 
-@router.get("/customers", response_class=HTMLResponse)
+@router.get(
+    "/customers",
+    response_class=HTMLResponse,
+    dependencies=[Depends(conditional_get(*TAB_TABLES["customers"]))],
+)
+@cache_fragment(*TAB_TABLES["customers"], prefetch=True)
 async def get_customers(
     request: Request,
     db: AsyncSession = Depends(get_db),
@@ -191,54 +566,61 @@ async def get_customers(
     direction: str = Query(None, alias="direction"),
     current_page: int = Query(1, alias="current_page"),
     items_per_page: int = Query(10, alias="items_per_page"),
+    scroll: bool = Query(False, alias="scroll"),
+    cursor: str = Query(None, alias="cursor"),
 ):
     # Log received parameters
     print(f"Current Page: {current_page}")
     print(f"Items Per Page: {items_per_page}")
 
-    limit = items_per_page
-    offset = items_per_page * (current_page - 1)
     async with db as session:
-        query = (
-            select(
-                Customer.id,
-                func.concat(Customer.last_name, ", ", Customer.first_name).label(
-                    "fullname"
-                ),
-                func.count(Invoice.customer_id).label("orders_total"),
-                func.sum(Invoice.total).label("orders_total_spent"),
-            )
-            .join(Invoice, Invoice.customer_id == Customer.id)
-            .offset(offset)
-            .limit(limit)
-            .group_by("fullname")
+        query = select(
+            CustomerStats.id,
+            CustomerStats.full_name,
+            CustomerStats.orders_total,
+            CustomerStats.orders_total_spent,
         )
-        query = query_order_by(
-            query=query, path=request.url.path, sort=sort, direction=direction
+        rows, total_items, next_cursor = await read_tab_page(
+            session=session,
+            query=query,
+            path=request.url.path,
+            sort=sort,
+            direction=direction,
+            current_page=current_page,
+            items_per_page=items_per_page,
+            scroll=scroll,
+            cursor=cursor,
         )
-        results = await session.execute(query)
 
     # Convert each row to a dictionary
-    results_list = []
-    for row in results.fetchall():
-        results_list.append(
-            {
-                "id": row.id,
-                "full_name": row.fullname,
-                "orders_total": row.orders_total,
-                "orders_total_spent": row.orders_total_spent,
-            }
-        )
+    results_list = [row._mapping for row in rows]
+
     return templates.TemplateResponse(
         name="partials/customers.html",
         context={
             "request": request,
             "customers": results_list,
+            **build_navigation(
+                tab="customers",
+                total_items=total_items,
+                items_per_page=items_per_page,
+                current_page=current_page,
+                sort=sort,
+                direction=direction,
+                scroll=scroll,
+                cursor=cursor,
+                next_cursor=next_cursor,
+            ),
         },
     )
 
 
-@router.get("/employees", response_class=HTMLResponse)
+@router.get(
+    "/employees",
+    response_class=HTMLResponse,
+    dependencies=[Depends(conditional_get(*TAB_TABLES["employees"]))],
+)
+@cache_fragment(*TAB_TABLES["employees"], prefetch=True)
 async def get_employees(
     request: Request,
     db: AsyncSession = Depends(get_db),
@@ -246,67 +628,102 @@ async def get_employees(
     direction: str = Query(None, alias="direction"),
     current_page: int = Query(1, alias="current_page"),
     items_per_page: int = Query(10, alias="items_per_page"),
+    scroll: bool = Query(False, alias="scroll"),
+    cursor: str = Query(None, alias="cursor"),
 ):
     # Log received parameters
     print(f"Current Page: {current_page}")
     print(f"Items Per Page: {items_per_page}")
 
-    limit = items_per_page
-    offset = items_per_page * (current_page - 1)
     async with db as session:
-        Manager = aliased(Employee)
-        query = (
-            select(
-                Employee.id,
-                func.concat(Employee.last_name, ", ", Employee.first_name).label(
-                    "employee_fullname"
-                ),
-                func.coalesce(
-                    func.nullif(
-                        func.concat(Manager.last_name, ", ", Manager.first_name), ", "
-                    ),
-                    "",
-                ).label("manager_fullname"),
-                func.coalesce(Manager.title, "").label("manager_title"),
-                func.count(distinct(Customer.id)).label("employee_total_customers"),
-                func.coalesce(func.sum(Invoice.total), 0).label(
-                    "employee_total_customers_spent"
-                ),
-            )
-            .outerjoin(Manager, Employee.reports_to == Manager.id)
-            .outerjoin(Customer, Customer.support_rep_id == Employee.id)
-            .outerjoin(Invoice, Invoice.customer_id == Customer.id)
-            .offset(offset)
-            .limit(limit)
-            .group_by("employee_fullname")
+        query = select(
+            EmployeeStats.id,
+            EmployeeStats.employee_fullname,
+            EmployeeStats.manager_fullname,
+            EmployeeStats.manager_title,
+            EmployeeStats.employee_total_customers,
+            EmployeeStats.employee_total_customers_spent,
         )
-        query = query_order_by(
-            query=query, path=request.url.path, sort=sort, direction=direction
+        rows, total_items, next_cursor = await read_tab_page(
+            session=session,
+            query=query,
+            path=request.url.path,
+            sort=sort,
+            direction=direction,
+            current_page=current_page,
+            items_per_page=items_per_page,
+            scroll=scroll,
+            cursor=cursor,
         )
-        results = await session.execute(query)
 
     # Convert each row to a dictionary
-    results_list = []
-    for row in results.fetchall():
-        results_list.append(
-            {
-                "id": row.id,
-                "employee_fullname": row.employee_fullname,
-                "manager_fullname": row.manager_fullname,
-                "manager_title": row.manager_title,
-                "employee_total_customers": row.employee_total_customers,
-                "employee_total_customers_spent": row.employee_total_customers_spent,
-            }
-        )
+    results_list = [row._mapping for row in rows]
+
     return templates.TemplateResponse(
         name="partials/employees.html",
         context={
             "request": request,
             "employees": results_list,
+            **build_navigation(
+                tab="employees",
+                total_items=total_items,
+                items_per_page=items_per_page,
+                current_page=current_page,
+                sort=sort,
+                direction=direction,
+                scroll=scroll,
+                cursor=cursor,
+                next_cursor=next_cursor,
+            ),
+        },
+    )
+
+
+@router.get("/typeahead", response_class=HTMLResponse)
+async def typeahead(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    q: str = Query("", alias="q"),
+    limit: int = Query(8, alias="limit", ge=1, le=50),
+):
+    results_list = []
+    if len(q.strip()) >= TYPEAHEAD_MIN_LENGTH:
+        async with db as session:
+            # no suggestions until the search indexes are built
+            if await TextSearchManager.is_ready(session, list(TYPEAHEAD_COLUMNS)):
+                params = {
+                    table_name: build_match_expression(q, column_name, prefix=True)
+                    for table_name, column_name in TYPEAHEAD_COLUMNS.items()
+                }
+                results = await session.execute(
+                    text(TYPEAHEAD_QUERY), {**params, "limit": limit}
+                )
+                for row in results.fetchall():
+                    results_list.append(
+                        {
+                            "table_name": row.table_name,
+                            "id": row.id,
+                            "content": highlight_markup(row.content),
+                        }
+                    )
+
+    return templates.TemplateResponse(
+        name="partials/typeahead.html",
+        context={
+            "request": request,
+            "results": results_list,
         },
     )
 
 
+@router.get("/fragment_cache")
+async def get_fragment_cache_stats():
+    """
+    The hit and miss counters and the size of the fragment cache
+    """
+    return fragment_cache.stats()
+
+
 @router.get("/about", response_class=HTMLResponse)
 async def get_about(
     request: Request,
@@ -318,7 +735,12 @@ async def get_about(
     )
 
 
-@router.get("/pagination", response_class=HTMLResponse)
+@router.get(
+    "/pagination",
+    response_class=HTMLResponse,
+    dependencies=[Depends(conditional_get(*PAGINATION_TABLES))],
+)
+@cache_fragment(*PAGINATION_TABLES)
 async def pagination(
     request: Request,
     db: AsyncSession = Depends(get_db),
@@ -326,47 +748,234 @@ async def pagination(
     items_per_page: int = Query(10, alias="items_per_page"),
     current_page: int = Query(1, alias="current_page"),
 ):
-    async with db as session:
-        # Get the total count based on the tab using the same queries as the data endpoints
-        total_items = 0
-
-        if tab == "artists":
-            query = select(func.count(distinct(Artist.id))).select_from(Artist)
-            results = await session.execute(query)
-            total_items = results.scalar()
-
-        elif tab == "albums":
-            query = (
-                select(func.count(distinct(Album.id)))
-                .select_from(Album)
-                .join(Album.artist)
-                .join(Album.tracks)
-            )
-            results = await session.execute(query)
-            total_items = results.scalar()
-
-        elif tab == "customers":
-            query = (
-                select(func.count(distinct(Customer.id)))
-                .select_from(Customer)
-                .join(Invoice, Invoice.customer_id == Customer.id)
-            )
-            results = await session.execute(query)
-            total_items = results.scalar()
-
-        elif tab == "employees":
-            query = select(func.count(distinct(Employee.id))).select_from(Employee)
-            results = await session.execute(query)
-            total_items = results.scalar()
-
-        total_pages = (
-            (total_items + items_per_page - 1) // items_per_page
-            if total_items > 0
-            else 1
+    total_items = 0
+    stats_class = STATS_CLASSES.get(tab)
+    if stats_class is not None:
+        async with db as session:
+            total_items = await count_tab_items(session, stats_class)
+
+    return templates.TemplateResponse(
+        name="partials/pagination.html",
+        context={
+            "request": request,
+            **build_pagination(
+                tab=tab,
+                total_items=total_items,
+                items_per_page=items_per_page,
+                current_page=current_page,
+            ),
+        },
+    )
+
+
+async def read_tab_page(
+    session: AsyncSession,
+    query: Select,
+    path: str,
+    sort: Optional[str],
+    direction: Optional[str],
+    current_page: int,
+    items_per_page: int,
+    scroll: bool,
+    cursor: Optional[str],
+) -> Tuple[Sequence[Row], Optional[int], Optional[str]]:
+    """
+    Reads the rows of a tab's page. A page of the paged mode is picked by
+    OFFSET and counted with COUNT(*) OVER () in the same pass. A chunk of
+    the infinite scroll mode seeks past the cursor of the previous chunk
+    on the sort column's index instead, so every chunk costs the same
+    however far the table has been scrolled, and it isn't counted.
+
+    :param session: the database session
+    :param query: the Select query of the tab's columns
+    :param path: the path of the tab's route
+    :param sort: the data column to sort by
+    :param direction: the sorting direction (asc, desc)
+    :param current_page: the page of the paged mode
+    :param items_per_page: the rows on a page, or in a chunk
+    :param scroll: read a chunk of the infinite scroll mode
+    :param cursor: the cursor of the previous chunk, None for the first one
+    :return: Tuple of the rows, the total count of the paged mode and the
+        cursor of the next chunk of the infinite scroll mode
+    """
+    stats_class = STATS_CLASSES[PathlibPath(path).name]
+    query = query_order_by(query=query, path=path, sort=sort, direction=direction)
+    if not scroll and cursor is None:
+        # the total in the same pass as the page, for the pagination
+        query = query.add_columns(func.count().over().label("total_count"))
+        offset = items_per_page * (current_page - 1)
+        results = await session.execute(query.offset(offset).limit(items_per_page))
+        rows = results.fetchall()
+        return rows, await count_tab_items(session, stats_class, rows), None
+
+    column = get_sort_column(stats_class, sort)
+    if isinstance(column.type, Numeric):
+        # the sums are stored as inexact REALs, the cursor has to hold the
+        # stored value and not the rounded Decimal, or the seek starts at
+        # the wrong row
+        column = type_coerce(column, Float)
+    query = query.add_columns(column.label("sort_key"), stats_class.id.label("row_id"))
+    if cursor is None:
+        conditions = [true()]
+    else:
+        value, last_id = decode_tab_cursor(cursor)
+        conditions = keyset_conditions(
+            column, stats_class.id, direction, value, last_id
         )
 
-        # Ensure the current page is within valid range
-        current_page = max(1, min(current_page, total_pages))
+    rows = []
+    for condition in conditions:
+        results = await session.execute(
+            query.where(condition).limit(items_per_page - len(rows))
+        )
+        rows.extend(results.fetchall())
+        if len(rows) >= items_per_page:
+            break
+
+    next_cursor = None
+    if 0 < items_per_page <= len(rows):
+        next_cursor = encode_cursor(rows[-1].sort_key, rows[-1].row_id)
+    return rows, None, next_cursor
+
+
+def decode_tab_cursor(cursor: str) -> Tuple[Any, int]:
+    """
+    Decode the cursor of an infinite scroll chunk
+
+    :param cursor: the cursor string from the client
+    :return: Tuple of the sort column value and the id of the last row
+    """
+    values = decode_cursor(cursor)
+    if len(values) != 2 or not isinstance(values[1], int):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return values[0], values[1]
+
+
+def keyset_conditions(
+    column: ColumnElement,
+    id_column: ColumnElement,
+    direction: Optional[str],
+    value: Any,
+    last_id: int,
+) -> List[ColumnElement]:
+    """
+    Builds the conditions of the rows that follow the last row of a chunk,
+    in the sort order. SQLite sorts the NULLs first, and a row value
+    comparison never matches a NULL, while an OR of the NULL and the other
+    rows can't seek on the index. So the NULL rows and the other rows
+    are separate conditions, each one a seek on the index, and the
+    second one is only queried when the first one runs out of rows.
+
+    :param column: the sort column
+    :param id_column: the id tie breaker of the sort
+    :param direction: the sorting direction (asc, desc)
+    :param value: the sort column value of the last row
+    :param last_id: the id of the last row
+    :return: List of the conditions, in the order their rows are read
+    """
+    if direction == "desc":
+        if value is None:
+            return [and_(column.is_(None), id_column < last_id)]
+        return [tuple_(column, id_column) < tuple_(value, last_id), column.is_(None)]
+    if value is None:
+        return [and_(column.is_(None), id_column > last_id), column.is_not(None)]
+    return [tuple_(column, id_column) > tuple_(value, last_id)]
+
+
+async def count_tab_items(
+    session: AsyncSession, stats_class: type, rows: Sequence[Row] = ()
+) -> int:
+    """
+    Returns the count of a tab's rows, every row of a stats table is one
+    row of the tab's view. The count is read from the total_count column
+    of the page's rows when there are any, so only an empty page (past the
+    last one) counts the stats table in a query of its own.
+
+    :param session: the database session
+    :param stats_class: the stats table of the tab
+    :param rows: the rows of the page, with the COUNT(*) OVER () column
+    :return: the count of the tab's rows
+    """
+    if rows:
+        return rows[0].total_count
+    return await session.scalar(select(func.count()).select_from(stats_class))
+
+
+def build_navigation(
+    tab: str,
+    total_items: Optional[int],
+    items_per_page: int,
+    current_page: int,
+    sort: Optional[str],
+    direction: Optional[str],
+    scroll: bool,
+    cursor: Optional[str],
+    next_cursor: Optional[str],
+) -> Dict:
+    """
+    Builds the context of the rows' navigation, the pagination nav of the
+    paged mode, or the request of the next chunk that the last row makes
+    when it is scrolled into view in the infinite scroll mode
+
+    :param tab: the tab the rows belong to
+    :param total_items: the count of the tab's rows, None when scrolling
+    :param items_per_page: the rows on a page, or in a chunk
+    :param current_page: the page being shown
+    :param sort: the data column the rows are sorted by
+    :param direction: the sorting direction
+    :param scroll: the rows are a chunk of the infinite scroll mode
+    :param cursor: the cursor the chunk was read after
+    :param next_cursor: the cursor of the next chunk, None after the last one
+    :return: the context of the rows' templates
+    """
+    if not scroll and cursor is None:
+        return build_pagination(
+            tab=tab,
+            total_items=total_items,
+            items_per_page=items_per_page,
+            current_page=current_page,
+            sort=sort,
+            direction=direction,
+        )
+
+    next_url = None
+    if next_cursor is not None:
+        params = {
+            **page_params(items_per_page, sort, direction),
+            "scroll": "true",
+            "cursor": next_cursor,
+        }
+        next_url = f"/application/{tab}?{urlencode(params)}"
+    # the first chunk empties the pagination nav of the paged mode
+    return {"next_url": next_url, "clear_pagination": cursor is None}
+
+
+def build_pagination(
+    tab: str,
+    total_items: int,
+    items_per_page: int,
+    current_page: int,
+    sort: Optional[str] = None,
+    direction: Optional[str] = None,
+) -> Dict:
+    """
+    Builds the context of the pagination nav of a tab, the nav is rendered
+    by the pagination route and swapped out of band by the tab routes
+
+    :param tab: the tab the nav pages through
+    :param total_items: the count of the tab's rows
+    :param items_per_page: the rows on a page
+    :param current_page: the page being shown
+    :param sort: the data column the rows are sorted by, kept by the links
+    :param direction: the sorting direction, kept by the links
+    :return: the context of the partials/pagination.html template
+    """
+    total_pages = (
+        (total_items + items_per_page - 1) // items_per_page if total_items > 0 else 1
+    )
+
+    # Ensure the current page is within valid range
+    current_page = max(1, min(current_page, total_pages))
 
     # Generate pagination links
     pagination_links = []
@@ -388,25 +997,38 @@ async def pagination(
                 + ["...", total_pages]
             )
 
-    retval = templates.TemplateResponse(
-        name="partials/pagination.html",
-        context={
-            "request": request,
-            "current_page": current_page,
-            "total_pages": total_pages,
-            "pagination_links": pagination_links,
-            "items_per_page": items_per_page,
-            "tab": tab,
-        },
+    return {
+        "current_page": current_page,
+        "total_pages": total_pages,
+        "pagination_links": pagination_links,
+        "items_per_page": items_per_page,
+        "page_params": page_params(items_per_page, sort, direction),
+        "tab": tab,
+    }
+
+
+def highlight_markup(content: str) -> Markup:
+    """
+    Escapes the matched text and replaces the highlight() marks with
+    <mark> tags
+
+    :param content: the text with the matches between char(2) and char(3)
+    :return: the safe HTML
+    """
+    return (
+        escape(content)
+        .replace("\x02", Markup("<mark>"))
+        .replace("\x03", Markup("</mark>"))
     )
-    return retval
 
 
 def query_order_by(query: Select, path: str, sort: str, direction: str) -> Select:
     (
         """
     Modifies the passed in query to add an order_by clause with
-    a direction determined by the class_ list
+    a direction determined by the class_ list. The id is added as a
+    tie breaker so the order is stable from page to page, and every
+    sort column is indexed together with the id.
 
     :param query: the Select query to modify
     :param path: the path that brought us here
@@ -417,38 +1039,21 @@ def query_order_by(query: Select, path: str, sort: str, direction: str) -> Selec
         ""
     )
     sort_func = desc if direction == "desc" else asc
+    stats_class = STATS_CLASSES[PathlibPath(path).name]
+    column = get_sort_column(stats_class, sort)
+    return query.order_by(sort_func(column), sort_func(stats_class.id))
 
-    match sort:
-        case "artist_name":
-            return query.order_by(sort_func(Artist.name))
-        case "artist_album_count":
-            return query.order_by(sort_func("album_count"))
-        case "artist_track":
-            return query.order_by(sort_func("track_count"))
-        case "album_title":
-            return query.order_by(sort_func(Album.title))
-        case "album_artist":
-            return query.order_by(sort_func("album_artist"))
-        case "album_duration":
-            return query.order_by(sort_func("album_duration"))
-        case "album_price":
-            return query.order_by(sort_func("album_price"))
-        case "customer_name":
-            return query.order_by(sort_func("fullname"))
-        case "customer_orders":
-            return query.order_by(sort_func("orders_total"))
-        case "customer_orders_spent":
-            return query.order_by(sort_func("orders_total_spent"))
-        case "employee_fullname":
-            return query.order_by(sort_func("employee_fullname"))
-        case "manager_fullname":
-            return query.order_by(sort_func("manager_fullname"))
-        case "manager_title":
-            return query.order_by(sort_func("manager_title"))
-        case "employee_total_customers":
-            return query.order_by(sort_func("employee_total_customers"))
-        case "employee_total_customers_spent":
-            return query.order_by(sort_func("employee_total_customers_spent"))
-        case _:
-            # Got here because @data-sort is undefined
-            return query
+
+def get_sort_column(stats_class: type, sort: Optional[str]) -> ColumnElement:
+    """
+    Returns the column of the stats table to sort by
+
+    :param stats_class: the stats table of the tab
+    :param sort: the data column to sort by
+    :return: the sort column, the tab's default one for an unknown sort
+    """
+    column = SORT_COLUMNS.get(sort)
+    if column is None or column.class_ is not stats_class:
+        # Got here because @data-sort is undefined
+        column = DEFAULT_SORT_COLUMNS[stats_class]
+    return column
@@ -1,537 +1,384 @@
-from typing import List, Tuple
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
 from types import ModuleType
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import select, func
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import Column, Table, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Select
+from sqlmodel import SQLModel
 
+from cache import CountMode
 from database import get_db
-from models.combined import CombinedResponseReadAll
-from models.albums import Album, AlbumRead
-from models.tracks import Track, TrackRead
-from models.playlists import Playlist, PlaylistRead
-from models.invoices import Invoice, InvoiceRead
-from models.invoice_items import InvoiceItem, InvoiceItemRead
-from models.playlist_track import PlaylistTrack
-from models.customers import Customer, CustomerRead
-from models.employees import Employee, EmployeeRead
+from middleware import conditional_get
+from endpoints import crud
+from endpoints import serializers
+from models.combined import (
+    ChildGroup,
+    CombinedResponseChildBatch,
+    CombinedResponseReadAll,
+)
 
 
-def get_routes(
-    router: APIRouter,
-    model: ModuleType,
-    child_models: List[ModuleType],
-) -> None:
-    """
-    iterate through the child models and build the specific routes for each model
+# the most parents a batched child request can ask for
+MAX_PARENT_IDS = 100
 
-    :params router: the router to add the routes to
-    :params model: the model to build the routes for
-    :params child_models: the child models to build the routes for
-    """ ""
-    route_handlers = {
-        "Artist": {"Album": _child_album_handler},
-        "Album": {"Track": _child_track_handler},
-        "Track": {
-            "InvoiceItem": _child_invoice_item_handler,
-            "Playlist": _child_track_playlist_handler,
-        },
-        "Genre": {"Track": _child_genre_track_handler},
-        "MediaType": {"Track": _child_media_type_track_handler},
-        "Playlist": {"Track": _child_playlist_track_handler},
-        "Invoice": {"InvoiceItem": _child_invoice_invoice_item_handler},
-        "Customer": {"Invoice": _child_customer_invoice_handler},
-        "Employee": {
-            "Customer": _child_employee_customer_handler,
-            "Employee": _child_employee_employee_hander,
-        },
-    }
-    # iterate through the child models
-    for child_model in child_models:
-        class_name = get_model_class_name(model)
-        child_class_name = get_model_class_name(child_model)
-
-        # create the child route
-        route_handler_func = route_handlers.get(class_name, {}).get(
-            child_class_name, None
-        )
-        if route_handler_func is not None:
-            route_handler_func(router)
+# the most children a batched child request returns for every parent
+MAX_PER_PARENT_LIMIT = 100
 
 
-def _child_album_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/albums",
-        response_model=CombinedResponseReadAll[List[AlbumRead], int],
-    )
-    async def read_artist_albums(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[AlbumRead], int]:
-        """
-        Retrieve an Artist the database with a paginated
-        list of associated albums
-        """
-        async with db as session:
-            query = (
-                select(Album)
-                .where(Album.artist_id == id)
-                .order_by(Album.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_albums = result.scalars().all()
+class SortDirection(str, Enum):
+    """
+    The sorting directions of the child routes
+    """
 
-            # Query for total count of albums
-            count_query = select(func.count(Album.id)).where(Album.artist_id == id)
-            total_count = await session.scalar(count_query)
+    asc = "asc"
+    desc = "desc"
 
-            albums = [AlbumRead.model_validate(db_album) for db_album in db_albums]
 
-            return CombinedResponseReadAll(
-                response=albums,
-                total_count=total_count,
-            )
+@dataclass(frozen=True)
+class ChildRelation:
+    """
+    How the items of a child route are found from the id of their parent.
+    The link table has the column holding the parent's id (parent_column)
+    and the column holding the child's id (child_column):
+
+    one to many (artist albums): the child table, albums.ArtistId and albums.AlbumId
+    many to one (album artist): the parent table, albums.AlbumId and albums.ArtistId
+    many to many (playlist tracks): the link table, playlist_track.PlaylistId
+    and playlist_track.TrackId
+    """
 
+    child_class: type
+    link_class: type
+    parent_column: ColumnElement
+    child_column: ColumnElement
 
-def _child_track_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/tracks",
-        response_model=CombinedResponseReadAll[List[TrackRead], int],
-    )
-    async def read_album_tracks(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[TrackRead], int]:
+    @property
+    def table_names(self) -> List[str]:
         """
-        Retrieve an Album the database with a paginated
-        list of associated albums
+        The names of the tables the child route reads
         """
-        async with db as session:
-            query = (
-                select(Track)
-                .where(Track.album_id == id)
-                .order_by(Track.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_tracks = result.scalars().all()
-
-            # Query for total count of tracks
-            count_query = select(func.count(Track.id)).where(Track.album_id == id)
-            total_count = await session.scalar(count_query)
-
-            tracks = [TrackRead.model_validate(db_track) for db_track in db_tracks]
-
-            return CombinedResponseReadAll(
-                response=tracks,
-                total_count=total_count,
-            )
-
+        return sorted({self.child_class.__tablename__, self.link_class.__tablename__})
 
-def _child_invoice_item_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/invoice_items",
-        response_model=CombinedResponseReadAll[List[InvoiceItemRead], int],
-    )
-    async def read_track_invoice_items(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[InvoiceItemRead], int]:
+    def join(self, query: Select) -> Select:
         """
-        Retrieve a Track from the database with a paginated
-        list of associated invoice items
-        """
-        async with db as session:
-            query = (
-                select(InvoiceItem)
-                .where(InvoiceItem.track_id == id)
-                .order_by(InvoiceItem.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_invoice_items = result.scalars().all()
-
-            # Query for total count of invoice items
-            count_query = select(func.count(InvoiceItem.id)).where(
-                InvoiceItem.track_id == id
-            )
-            total_count = await session.scalar(count_query)
+        Join the link table to the query of the child items, so the query
+        can be filtered on the parent_column
 
-            invoice_items = [
-                InvoiceItemRead.model_validate(db_invoice_item)
-                for db_invoice_item in db_invoice_items
-            ]
-
-            return CombinedResponseReadAll(
-                response=invoice_items,
-                total_count=total_count,
-            )
-
-
-def _child_track_playlist_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/playlists",
-        response_model=CombinedResponseReadAll[List[PlaylistRead], int],
-    )
-    async def read_track_playlists(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[PlaylistRead], int]:
-        """
-        Retrieve a Track from the database with a paginated
-        list of associated playlists
+        :param query: the Select query of the child columns
+        :return: the joined query
         """
-        async with db as session:
-            query = (
-                select(Playlist)
-                .join(
-                    PlaylistTrack, PlaylistTrack.playlist_id == Playlist.id
-                )  # Join Playlist to playlist_track
-                .join(
-                    Track, PlaylistTrack.track_id == Track.id
-                )  # Join playlist_track to Track
-                .where(Track.id == id)  # Filter by the track ID
-                .order_by(Playlist.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_playlists = result.scalars().all()
-
-            # Query for total count of playlists
-            count_query = (
-                select(func.count(Playlist.id))
-                .join(
-                    PlaylistTrack, PlaylistTrack.playlist_id == Playlist.id
-                )  # Join Playlist to playlist_track
-                .join(
-                    Track, PlaylistTrack.track_id == Track.id
-                )  # Join playlist_track to Track
-                .where(Track.id == id)
-            )
-            total_count = await session.scalar(count_query)
-
-            playlists = [
-                PlaylistRead.model_validate(db_playlist) for db_playlist in db_playlists
-            ]
-
-            return CombinedResponseReadAll(
-                response=playlists,
-                total_count=total_count,
-            )
-
+        if self.link_class is self.child_class:
+            return query
+        return query.join(self.link_class, self.child_column == self.child_class.id)
 
-def _child_genre_track_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/tracks",
-        response_model=CombinedResponseReadAll[List[TrackRead], int],
-    )
-    async def read_tracks(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[TrackRead], int]:
-        """
-        Retrieve a Genre the database with a paginated
-        list of associated tracks
+    def count_query(self, parent_id: int) -> Select:
         """
-        async with db as session:
-            query = (
-                select(Track)
-                .where(Track.genre_id == id)
-                .order_by(Track.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_tracks = result.scalars().all()
+        Returns the query counting the children of the parent, it only reads
+        the link table, so it is answered from the foreign key index
 
-            # Query for total count of media types
-            count_query = select(func.count(Track.id)).where(Track.genre_id == id)
-            total_count = await session.scalar(count_query)
-
-            tracks = [TrackRead.model_validate(db_track) for db_track in db_tracks]
-
-            return CombinedResponseReadAll(
-                response=tracks,
-                total_count=total_count,
-            )
+        :param parent_id: the id of the parent
+        :return: the SELECT count(...) query
+        """
+        return select(func.count(self.child_column)).where(
+            self.parent_column == parent_id
+        )
 
 
-def _child_media_type_track_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/tracks",
-        response_model=CombinedResponseReadAll[List[TrackRead], int],
-    )
-    async def read_tracks(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[TrackRead], int]:
-        """
-        Retrieve a MediaType the database with a paginated
-        list of associated tracks
-        """
-        async with db as session:
-            query = (
-                select(Track)
-                .where(Track.media_type_id == id)
-                .order_by(Track.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_tracks = result.scalars().all()
+def get_routes(
+    router: APIRouter,
+    model: ModuleType,
+    child_models: List[ModuleType],
+    child_paths: Optional[Dict[str, str]] = None,
+) -> None:
+    """
+    iterate through the child models and build a child route for each model,
+    the query of the route is derived from the foreign keys between the model
+    and the child model
 
-            # Query for total count of media types
-            count_query = select(func.count(Track.id)).where(Track.media_type_id == id)
-            total_count = await session.scalar(count_query)
+    :params router: the router to add the routes to
+    :params model: the model to build the routes for
+    :params child_models: the child models to build the routes for
+    :params child_paths: the paths of the child routes by child model name,
+    when it isn't the model name, e.g. {"employees": "reports"}
+    """
+    parent_class = getattr(model, get_model_class_name(model))
+    child_paths = child_paths or {}
+    for child_model in child_models:
+        child_class = getattr(child_model, get_model_class_name(child_model))
+        model_name = child_model.__name__.split(".")[-1].lower()
+        child_route(
+            router=router,
+            parent_class=parent_class,
+            relation=get_child_relation(parent_class, child_class),
+            path=child_paths.get(model_name, model_name),
+        )
 
-            tracks = [TrackRead.model_validate(db_track) for db_track in db_tracks]
 
-            return CombinedResponseReadAll(
-                response=tracks,
-                total_count=total_count,
-            )
+def child_route(
+    router: APIRouter,
+    parent_class: type,
+    relation: ChildRelation,
+    path: str,
+) -> None:
+    """
+    Create the child route of the relation, with the pagination, cached
+    count, sorting and fields of every child route
 
+    :params router: the router to add the route to
+    :params parent_class: the table model of the parent
+    :params relation: how the child items are found from the parent
+    :params path: the path of the route after the parent's id
+    """
+    child_class = relation.child_class
+    item_read = serializers.get_read_model(child_class)
+    parent_table = parent_class.__tablename__
 
-def _child_playlist_track_handler(router: APIRouter):
     @router.get(
-        path="/{id}/tracks",
-        response_model=CombinedResponseReadAll[List[TrackRead], int],
+        path=f"/{{id}}/{path}",
+        name=f"read_{parent_table}_{path}",
+        description=f"Retrieve the paginated list of the {path} of a "
+        f"{parent_class.__name__}",
+        dependencies=[Depends(conditional_get(*relation.table_names))],
+        response_model=CombinedResponseReadAll[List[item_read], int],
     )
-    async def read_playlists_track(
+    async def read_children(
         id: int,
         offset: int = 0,
         limit: int = 10,
+        after: Optional[str] = None,
+        count: CountMode = CountMode.cached,
+        sort: Optional[str] = sort_query(item_read),
+        direction: SortDirection = SortDirection.asc,
+        fields: Optional[str] = serializers.fields_query(item_read),
         db: AsyncSession = Depends(get_db),
-    ) -> [List[TrackRead], int]:
-        """
-        Retrieve a Track from the database with a paginated
-        list of associated playlists
-        """
+    ):
+        field_names = serializers.parse_fields(item_read, fields)
+        sort_column = parse_sort(child_class, item_read, sort)
         async with db as session:
-            query = (
-                select(Track)
-                .join(PlaylistTrack, PlaylistTrack.track_id == Track.id)
-                .join(Playlist, PlaylistTrack.playlist_id == Playlist.id)
-                .where(Playlist.id == id)
-                .order_by(Track.id)
-                .offset(offset)
-                .limit(limit)
+            columns = crud.model_columns(child_class, field_names)
+            if sort_column is not None:
+                columns.append(sort_column.label("sort_key"))
+            query = relation.join(select(*columns)).where(relation.parent_column == id)
+            query = crud.paginate(
+                query,
+                child_class.id,
+                offset,
+                limit,
+                after,
+                sort_column,
+                direction is SortDirection.desc,
             )
             # Execute the query
             result = await session.execute(query)
-            db_tracks = result.scalars().all()
-
-            # Query for total count of playlists
-            count_query = (
-                select(func.count(Track.id))
-                .join(PlaylistTrack, PlaylistTrack.track_id == Track.id)
-                .join(Playlist, PlaylistTrack.playlist_id == Playlist.id)
-                .where(Playlist.id == id)
+            rows = result.all()
+
+            total_count = await crud.count_items(
+                session,
+                relation.count_query(id),
+                relation.link_class,
+                (parent_table, id),
+                count,
             )
-            total_count = await session.scalar(count_query)
-
-            tracks = [TrackRead.model_validate(db_track) for db_track in db_tracks]
 
-            return CombinedResponseReadAll(
-                response=tracks,
-                total_count=total_count,
+            return serializers.rows_response(
+                item_read,
+                rows,
+                total_count,
+                crud.get_next_cursor(rows, limit, sort_column is not None),
+                field_names,
             )
 
 
-def _child_invoice_invoice_item_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/invoice_items",
-        response_model=CombinedResponseReadAll[List[InvoiceItemRead], int],
-    )
-    async def read_invoice_items(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[InvoiceItemRead], int]:
-        """
-        Retrieve a Invoice the database with a paginated
-        list of associated invoice items
-        """
-        async with db as session:
-            query = (
-                select(InvoiceItem)
-                .where(InvoiceItem.invoice_id == id)
-                .order_by(InvoiceItem.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_invoice_items = result.scalars().all()
-
-            # Query for total count of invoice items
-            count_query = select(func.count(InvoiceItem.id)).where(
-                InvoiceItem.invoice_id == id
-            )
-            total_count = await session.scalar(count_query)
+def get_batch_routes(
+    router: APIRouter,
+    model: ModuleType,
+    child_models: List[ModuleType],
+    child_paths: Optional[Dict[str, str]] = None,
+) -> None:
+    """
+    iterate through the child models and build the batched child route for
+    each model, which returns the children of many parents in one request
 
-            invoice_items = [
-                InvoiceItemRead.model_validate(db_invoice_item)
-                for db_invoice_item in db_invoice_items
-            ]
+    :params router: the router to add the routes to
+    :params model: the model to build the routes for
+    :params child_models: the child models to build the routes for
+    :params child_paths: the paths of the child routes by child model name,
+    when it isn't the model name, e.g. {"employees": "reports"}
+    """
+    parent_class = getattr(model, get_model_class_name(model))
+    child_paths = child_paths or {}
+    for child_model in child_models:
+        child_class = getattr(child_model, get_model_class_name(child_model))
+        model_name = child_model.__name__.split(".")[-1].lower()
+        child_batch_route(
+            router=router,
+            parent_class=parent_class,
+            relation=get_child_relation(parent_class, child_class),
+            path=child_paths.get(model_name, model_name),
+        )
 
-            return CombinedResponseReadAll(
-                response=invoice_items,
-                total_count=total_count,
-            )
 
+def child_batch_route(
+    router: APIRouter,
+    parent_class: type,
+    relation: ChildRelation,
+    path: str,
+) -> None:
+    """
+    Create the batched child route of the relation, e.g. /albums/tracks,
+    the first children of every parent are read in a single windowed
+    query, instead of one child request and one count per parent
+
+    :params router: the router to add the route to
+    :params parent_class: the table model of the parent
+    :params relation: how the child items are found from the parent
+    :params path: the path of the route
+    """
+    child_class = relation.child_class
+    item_read = serializers.get_read_model(child_class)
+    parent_table = parent_class.__tablename__
 
-def _child_customer_invoice_handler(router: APIRouter):
     @router.get(
-        path="/{id}/invoices",
-        response_model=CombinedResponseReadAll[List[InvoiceRead], int],
+        path=f"/{path}",
+        name=f"read_{parent_table}_{path}_batch",
+        description=f"Retrieve the first {path} of many {parent_table}, "
+        "grouped by parent with the count of every parent's children",
+        dependencies=[Depends(conditional_get(*relation.table_names))],
+        response_model=CombinedResponseChildBatch[List[ChildGroup[item_read]]],
     )
-    async def read_invoices(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
+    async def read_children_batch(
+        parent_ids: str = Query(
+            ...,
+            description=f"Comma separated IDs of the {parent_table}, "
+            f"at most {MAX_PARENT_IDS}",
+        ),
+        per_parent_limit: int = Query(
+            10,
+            ge=1,
+            le=MAX_PER_PARENT_LIMIT,
+            description=f"The most {path} returned for every parent",
+        ),
+        sort: Optional[str] = sort_query(item_read),
+        direction: SortDirection = SortDirection.asc,
+        fields: Optional[str] = serializers.fields_query(item_read),
         db: AsyncSession = Depends(get_db),
-    ) -> [List[InvoiceItemRead], int]:
-        """
-        Retrieve a Invoice the database with a paginated
-        list of associated invoice items
-        """
+    ):
+        ids = crud.parse_ids(parent_ids, MAX_PARENT_IDS, "parent_ids")
+        field_names = serializers.parse_fields(item_read, fields)
+        sort_column = parse_sort(child_class, item_read, sort)
         async with db as session:
-            query = (
-                select(Invoice)
-                .where(Invoice.customer_id == id)
-                .order_by(Invoice.id)
-                .offset(offset)
-                .limit(limit)
+            query = relation.join(
+                select(*crud.model_columns(child_class, field_names))
+            ).where(relation.parent_column.in_(set(ids)))
+            query = crud.limit_per_parent(
+                query,
+                relation.parent_column,
+                child_class.id,
+                per_parent_limit,
+                sort_column,
+                direction is SortDirection.desc,
             )
-            # Execute the query
             result = await session.execute(query)
-            db_invoices = result.scalars().all()
+            rows = result.all()
 
-            # Query for total count of invoice items
-            count_query = select(func.count(Invoice.id)).where(
-                Invoice.customer_id == id
+            return serializers.child_groups_response(
+                item_read, rows, ids, per_parent_limit, field_names
             )
-            total_count = await session.scalar(count_query)
 
-            invoices = [
-                InvoiceRead.model_validate(db_invoice) for db_invoice in db_invoices
-            ]
 
-            return CombinedResponseReadAll(
-                response=invoices,
-                total_count=total_count,
+def get_child_relation(parent_class: type, child_class: type) -> ChildRelation:
+    """
+    Returns how the child items are found from the parent, from the foreign
+    keys of the tables. The child table's foreign key to the parent makes
+    a one to many relation, the parent table's foreign key to the child a
+    many to one relation, and a table with foreign keys to both of them
+    a many to many relation.
+
+    :params parent_class: the table model of the parent
+    :params child_class: the table model of the children
+    :returns: the relation
+    """
+    parent_table = parent_class.__table__
+    child_table = child_class.__table__
+
+    column = get_foreign_key(child_table, parent_table)
+    if column is not None:
+        return ChildRelation(child_class, child_class, column, child_class.id)
+
+    column = get_foreign_key(parent_table, child_table)
+    if column is not None:
+        return ChildRelation(child_class, parent_class, parent_class.id, column)
+
+    for mapper in SQLModel._sa_registry.mappers:
+        link_table = mapper.local_table
+        if link_table is parent_table or link_table is child_table:
+            continue
+        parent_column = get_foreign_key(link_table, parent_table)
+        child_column = get_foreign_key(link_table, child_table)
+        if parent_column is not None and child_column is not None:
+            return ChildRelation(
+                child_class, mapper.class_, parent_column, child_column
             )
 
-
-def _child_employee_customer_handler(router: APIRouter):
-    @router.get(
-        path="/{id}/customers",
-        response_model=CombinedResponseReadAll[List[CustomerRead], int],
+    raise ValueError(
+        f"There is no foreign key between {parent_table.name} and {child_table.name}"
     )
-    async def read_customers(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[CustomerRead], int]:
-        """
-        Retrieve an Employee the database with a paginated
-        list of associated customers
-        """
-        async with db as session:
-            query = (
-                select(Customer)
-                .where(Customer.support_rep_id == id)
-                .order_by(Customer.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_customers = result.scalars().all()
 
-            # Query for total count of invoice items
-            count_query = select(func.count(Customer.id)).where(
-                Customer.support_rep_id == id
-            )
-            total_count = await session.scalar(count_query)
 
-            customers = [
-                CustomerRead.model_validate(db_customer) for db_customer in db_customers
-            ]
+def get_foreign_key(table: Table, referred_table: Table) -> Optional[Column]:
+    """
+    Returns the column of the table's foreign key to the referred table
 
-            return CombinedResponseReadAll(
-                response=customers,
-                total_count=total_count,
-            )
+    :params table: the table with the foreign key
+    :params referred_table: the table the foreign key refers to
+    :returns: the foreign key column, None when there is none
+    """
+    columns = [
+        key.parent for key in table.foreign_keys if key.column.table is referred_table
+    ]
+    if len(columns) > 1:
+        raise ValueError(
+            f"{table.name} has more than one foreign key to {referred_table.name}"
+        )
+    return columns[0] if columns else None
 
 
-def _child_employee_employee_hander(router: APIRouter):
-    @router.get(
-        path="/{id}/reports",
-        response_model=CombinedResponseReadAll[List[EmployeeRead], int],
-    )
-    async def read_employee_reports(
-        id: int,
-        offset: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db),
-    ) -> [List[EmployeeRead], int]:
-        """
-        Retrieve an Employee the database with a paginated
-        list of associated employees (reports)
-        """
-        async with db as session:
-            query = (
-                select(Employee)
-                .where(Employee.reports_to == id)
-                .order_by(Employee.id)
-                .offset(offset)
-                .limit(limit)
-            )
-            # Execute the query
-            result = await session.execute(query)
-            db_employees = result.scalars().all()
+def sort_query(item_read: type) -> Any:
+    """
+    Returns the sort query parameter of the child routes, documented with
+    the fields of the Read model
 
-            # Query for total count of invoice items
-            count_query = select(func.count(Employee.id)).where(
-                Employee.reports_to == id
-            )
-            total_count = await session.scalar(count_query)
+    :params item_read: the Read model of the children
+    :returns: the Query parameter
+    """
+    names = ", ".join(item_read.model_fields)
+    return Query(None, description=f"The field to sort by, the id by default: {names}")
 
-            employees = [
-                EmployeeRead.model_validate(db_employee) for db_employee in db_employees
-            ]
 
-            return CombinedResponseReadAll(
-                response=employees,
-                total_count=total_count,
-            )
+def parse_sort(
+    child_class: type, item_read: type, sort: Optional[str]
+) -> Optional[ColumnElement]:
+    """
+    Returns the column of the sort parameter
+
+    :params child_class: the table model of the children
+    :params item_read: the Read model the field is validated against
+    :params sort: the field to sort by, if any
+    :returns: the column to sort by, None to sort by the id
+    """
+    if sort is None or sort == "id":
+        return None
+    if sort not in item_read.model_fields:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown sort field {sort}, "
+            f"expected one of {', '.join(item_read.model_fields)}",
+        )
+    return crud.sort_key_column(getattr(child_class, sort))
 
 
 def get_model_class_name(model: ModuleType) -> Tuple[str]:
@@ -5,13 +5,44 @@ to support multiple response classes and multiple
 input classes
 """
 
-from typing import List, Type, TypeVar
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+)
+import base64
+import binascii
 import inspect
+import json
 
 from fastapi import HTTPException
-from sqlalchemy import select, func
+from sqlalchemy import Float, Numeric, and_, func, insert, or_, select, tuple_
+from sqlalchemy import type_coerce, update
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.engine import Result, Row
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
+from sqlalchemy.sql import Executable
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Select
 
+from cache import CountMode, count_cache, table_versions
+
+
+# the rows fetched from the cursor at a time by the streaming export
+EXPORT_CHUNK_SIZE = 1000
+
+# the most IDs bound in a single IN (...) query, well under the
+# bound variable limit of older SQLite versions (999)
+IN_CHUNK_SIZE = 500
 
 ParentType = TypeVar("ParentType")
 InputType = TypeVar("InputType")
@@ -33,6 +64,7 @@ async def create_item(
     db_item = model_class(**data.model_dump())
     session.add(db_item)
     await session.commit()
+    invalidate(model_class)
     await session.refresh(db_item)
     return db_item
 
@@ -42,71 +74,138 @@ async def read_items(
     offset: int = 0,
     limit: int = 10,
     model_class: Type[InputType] = None,
-) -> [List[OutputType], int]:
+    after: Optional[str] = None,
+    count: CountMode = CountMode.cached,
+    expand: Sequence[str] = (),
+    fields: Optional[Sequence[str]] = None,
+) -> Tuple[Sequence[Any], Optional[int], Optional[str]]:
     """
-    Retrieve a paginated list of items from the database.
-    Returns a list of items as the same class.
+    Retrieve a paginated list of items from the database, either by
+    offset or by seeking past the `after` cursor.
+    Returns the items as rows with a column for every model attribute,
+    or only for the fields when they are passed, without building the
+    ORM objects, the total count (None when count is CountMode.none) and
+    the cursor for the next page. With expand the items are ORM objects
+    with the expanded relationships loaded.
     """
     if not inspect.isclass(model_class):
         raise ValueError("model_class must be a class object")
 
-    query = select(model_class).offset(offset).limit(limit)
+    if expand:
+        query = select(model_class).options(
+            *load_options(model_class, fields, expand),
+            *expand_options(model_class, expand),
+        )
+    else:
+        query = select(*model_columns(model_class, fields))
+    query = paginate(query, model_class.id, offset, limit, after)
     result = await session.execute(query)
-    db_items = result.scalars().all()
+    rows = result.scalars().all() if expand else result.all()
 
     # Query for total count
     count_query = select(func.count()).select_from(model_class)
-    total_count = await session.scalar(count_query)
+    total_count = await count_items(session, count_query, model_class, None, count)
 
-    return [(db_item) for db_item in db_items], total_count
+    return rows, total_count, get_next_cursor(rows, limit)
 
 
 async def read_item(
     session: AsyncSession,
     id: int,
     model_class: Type[InputType],
+    expand: Sequence[str] = (),
+    fields: Optional[Sequence[str]] = None,
 ) -> OutputType:
     """
-    Retrieve an item from the database by ID.
+    Retrieve an item from the database by ID, with the expanded
+    relationships loaded. When fields are passed without expand the
+    item is a row with a column for every field.
     Returns the item as the same class if found, None otherwise.
     """
     if not inspect.isclass(model_class):
         raise ValueError("model_class must be class object")
 
-    query = select(model_class).where(model_class.id == id)
-    result = await session.execute(query)
-    db_item = result.scalar_one_or_none()
+    as_row = fields is not None and not expand
+    if as_row:
+        query = select(*model_columns(model_class, fields))
+    else:
+        query = select(model_class).options(
+            *load_options(model_class, fields, expand),
+            *expand_options(model_class, expand),
+        )
+    result = await session.execute(query.where(model_class.id == id))
+    db_item = result.first() if as_row else result.scalar_one_or_none()
     if db_item is None:
         raise HTTPException(status_code=404, detail=f"{model_class} not found")
     return db_item
 
 
+async def read_items_by_ids(
+    session: AsyncSession,
+    ids: Sequence[int],
+    model_class: Type[InputType],
+) -> List[Optional[OutputType]]:
+    """
+    Retrieve the items with the given IDs from the database, with one
+    IN query per chunk of IN_CHUNK_SIZE distinct IDs.
+    Returns the items in the order of the IDs, with None in the place
+    of every ID that wasn't found.
+    """
+    if not inspect.isclass(model_class):
+        raise ValueError("model_class must be class object")
+
+    unique_ids = list(dict.fromkeys(ids))
+    db_items = {}
+    for start in range(0, len(unique_ids), IN_CHUNK_SIZE):
+        chunk = unique_ids[start : start + IN_CHUNK_SIZE]
+        query = select(model_class).where(model_class.id.in_(chunk))
+        result = await session.execute(query)
+        db_items.update((db_item.id, db_item) for db_item in result.scalars())
+    return [db_items.get(id) for id in ids]
+
+
+async def stream_items(
+    session: AsyncSession,
+    model_class: Type[InputType],
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[Sequence[Row]]:
+    """
+    Stream every item of the table in id order from a server side cursor,
+    chunk_size rows at a time, so only one chunk is ever held in memory
+    however big the table is. The rows have a column for every model
+    attribute and skip building the ORM objects.
+    """
+    if not inspect.isclass(model_class):
+        raise ValueError("model_class must be class object")
+
+    query = (
+        select(*model_columns(model_class))
+        .order_by(model_class.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await session.stream(query)
+    try:
+        async for rows in result.partitions():
+            yield rows
+    finally:
+        await result.close()
+
+
 async def update_item(
     session: AsyncSession,
     id: int,
     data: InputType,
     model_class: Type[InputType],
-) -> OutputType:
+) -> Optional[Row]:
     """
-    Update an existing item in the database using the passed in input class and output class.
-    Returns the updated item as the same class if found, returns None otherwise.
+    Update an existing item in the database using the passed in input class.
+    Returns the updated row if found, returns None otherwise.
     """
     if not inspect.isclass(model_class):
         raise ValueError("model_class must be class object")
 
-    query = select(model_class).where(model_class.id == id)
-    result = await session.execute(query)
-    db_item = result.scalar_one_or_none()
-    if db_item is None:
-        return None
-
-    for key, value in data.dict(exclude_unset=True).items():
-        setattr(db_item, key, value)
-
-    session.add(db_item)
-    await session.commit()
-    await session.refresh(db_item)
-    return db_item
+    values = data.model_dump(exclude_unset=True)
+    return await update_returning(session, id, values, model_class)
 
 
 async def patch_item(
@@ -114,25 +213,530 @@ async def patch_item(
     id: int,
     data: InputType,
     model_class: Type[InputType],
-) -> OutputType:
+) -> Optional[Row]:
     """
-    Partially update an existing item in the database using the passed in input class and output class.
-    Returns the updated item as the same class if found, returns None otherwise.
+    Partially update an existing item in the database using the passed in input class.
+    Returns the updated row if found, returns None otherwise.
     """
     if not inspect.isclass(model_class):
         raise ValueError("model_class must be class object")
 
-    query = select(model_class).where(model_class.id == id)
+    values = {
+        key: value
+        for key, value in data.model_dump(exclude_unset=True).items()
+        if value is not None
+    }
+    return await update_returning(session, id, values, model_class)
+
+
+async def update_returning(
+    session: AsyncSession,
+    id: int,
+    values: Dict[str, Any],
+    model_class: Type[InputType],
+) -> Optional[Row]:
+    """
+    Updates the item with a single UPDATE ... RETURNING statement, instead
+    of loading the ORM object, changing it, committing and refreshing it.
+    No row returned means there is no item with the id.
+
+    :param session: the writer session
+    :param id: the id of the item to update
+    :param values: the new values by attribute name
+    :param model_class: the table model of the item
+    :return: the updated row with a column for every model attribute, or None
+    """
+    columns = model_columns(model_class)
+    if not values:
+        # nothing to change, return the row as it is
+        result = await session.execute(select(*columns).where(model_class.id == id))
+        return result.first()
+
+    query = (
+        update(model_class)
+        .where(model_class.id == id)
+        .values(**values)
+        .returning(*columns)
+        .execution_options(synchronize_session=False)
+    )
     result = await session.execute(query)
-    db_item = result.scalar_one_or_none()
-    if db_item is None:
-        return None
+    row = result.first()
+    await session.commit()
+    if row is not None:
+        invalidate(model_class)
+    return row
 
-    for key, value in data.dict(exclude_unset=True).items():
-        if value is not None:
-            setattr(db_item, key, value)
 
-    session.add(db_item)
+def model_columns(
+    model_class: Type[InputType], fields: Optional[Sequence[str]] = None
+) -> List[ColumnElement]:
+    """
+    Returns the column of every attribute of the model, labeled with the
+    attribute name, so a row selected with them validates into the *Read model.
+    With fields only their columns are returned, so the columns no one asked
+    for (Track.composer, the address of a customer) aren't read at all.
+
+    :param model_class: the table model
+    :param fields: the attribute names of a sparse fieldset, None for all of them
+    :return: List of the model columns
+    """
+    return [
+        getattr(model_class, attr.key)
+        for attr in sa_inspect(model_class).column_attrs
+        if fields is None or attr.key in fields
+    ]
+
+
+def model_relationships(model_class: Type[InputType]) -> Dict[str, Any]:
+    """
+    Returns the relationships declared on the model, e.g. Album.artist
+    and Album.tracks
+
+    :param model_class: the table model
+    :return: Dict of the relationship properties by name
+    """
+    return dict(sa_inspect(model_class).relationships.items())
+
+
+def relationship_tables(model_class: Type[InputType], name: str) -> List[str]:
+    """
+    Returns the names of the tables a relationship is loaded from, the
+    related table and the link table of a many to many relationship
+
+    :param model_class: the table model
+    :param name: the name of the relationship
+    :return: List of the table names
+    """
+    relationship = model_relationships(model_class)[name]
+    table_names = [relationship.mapper.local_table.name]
+    if relationship.secondary is not None:
+        table_names.append(relationship.secondary.name)
+    return table_names
+
+
+def load_options(
+    model_class: Type[InputType],
+    fields: Optional[Sequence[str]],
+    expand: Sequence[str],
+) -> List[Any]:
+    """
+    Returns the loader options that load only the columns of a sparse
+    fieldset into the ORM objects, plus the columns the expanded
+    relationships are joined on (e.g. Album.artist_id for Album.artist),
+    so loading a relationship never needs a column that wasn't loaded
+
+    :param model_class: the table model
+    :param fields: the attribute names of a sparse fieldset, None for all of them
+    :param expand: the names of the expanded relationships
+    :return: List of the loader options, empty without fields
+    """
+    if fields is None:
+        return []
+    mapper = sa_inspect(model_class)
+    names = set(fields)
+    for name in expand:
+        names.update(
+            mapper.get_property_by_column(column).key
+            for column in mapper.relationships[name].local_columns
+        )
+    return [load_only(*model_columns(model_class, names))]
+
+
+def expand_options(model_class: Type[InputType], expand: Sequence[str]) -> List[Any]:
+    """
+    Returns the loader options of the expanded relationships. Every one is
+    loaded with one batched SELECT ... WHERE ... IN (...) for all the items,
+    so a page of 100 albums with their artists costs 2 queries, never a
+    lazy load per item.
+
+    :param model_class: the table model
+    :param expand: the names of the relationships to load
+    :return: List of the loader options
+    """
+    return [selectinload(getattr(model_class, name)) for name in expand]
+
+
+async def create_items(
+    session: AsyncSession,
+    data: Sequence[InputType],
+    model_class: Type[InputType],
+    atomic: bool = False,
+) -> Tuple[List[Optional[int]], Dict[int, str]]:
+    """
+    Create new items in the database with a single executemany INSERT
+    ... RETURNING in one transaction.
+    Returns the created ids in the order of the data, with None for the
+    items that failed, and the database errors by the item's index.
+    With atomic, nothing is created if any item fails.
+    """
+    if not inspect.isclass(model_class):
+        raise ValueError("model_class must be class object")
+
+    rows = [item.model_dump() for item in data]
+    statement = insert(model_class).returning(
+        model_class.id, sort_by_parameter_order=True
+    )
+    ids, errors = await execute_bulk(session, statement, rows, atomic, returning=True)
+    if rows and not (atomic and errors):
+        invalidate(model_class)
+    return ids, errors
+
+
+async def patch_items(
+    session: AsyncSession,
+    data: Sequence[Tuple[int, InputType]],
+    model_class: Type[InputType],
+    atomic: bool = False,
+) -> Tuple[List[Optional[int]], Dict[int, str]]:
+    """
+    Partially update existing items in the database with a single
+    executemany UPDATE by primary key in one transaction.
+    Returns the updated ids in the order of the data, with None for the
+    items that failed, and the errors by the item's index.
+    With atomic, nothing is updated if any item fails.
+    """
+    if not inspect.isclass(model_class):
+        raise ValueError("model_class must be class object")
+
+    db_items = await read_items_by_ids(session, [id for id, _ in data], model_class)
+    rows = []
+    row_indexes = []
+    errors = {}
+    for index, ((id, item), db_item) in enumerate(zip(data, db_items)):
+        if db_item is None:
+            errors[index] = f"{model_class.__name__} {id} not found"
+            continue
+        values = {
+            key: value
+            for key, value in item.model_dump(exclude_unset=True).items()
+            if value is not None
+        }
+        rows.append({"id": id, **values})
+        row_indexes.append(index)
+    if atomic and errors:
+        return [None] * len(data), errors
+    # the items were only read to find the missing ids
+    session.expunge_all()
+
+    ids = [None] * len(data)
+    if rows:
+        updated_ids, update_errors = await execute_bulk(
+            session, update(model_class), rows, atomic, returning=False
+        )
+        for index, updated_id, row in zip(row_indexes, updated_ids, rows):
+            ids[index] = row["id"] if updated_id is not None else None
+        errors.update(
+            (row_indexes[row_index], error)
+            for row_index, error in update_errors.items()
+        )
+        if not (atomic and update_errors):
+            invalidate(model_class)
+    return ids, errors
+
+
+async def execute_bulk(
+    session: AsyncSession,
+    statement: Executable,
+    rows: List[Dict[str, Any]],
+    atomic: bool,
+    returning: bool,
+) -> Tuple[List[Optional[Any]], Dict[int, str]]:
+    """
+    Executes the statement once for all the rows (executemany) and commits.
+    If a row breaks a constraint, the transaction is rolled back and the
+    rows are replayed one statement at a time, still in one transaction,
+    to find the rows that fail, SQLite only rolls back the failing
+    statement so the others can still be committed.
+
+    :param session: the writer session
+    :param statement: the INSERT or UPDATE statement, optionally RETURNING one column
+    :param rows: the parameters of each row
+    :param atomic: roll back everything if any row fails
+    :param returning: the statement returns one column for each row
+    :return: the returned value of every row (True without RETURNING),
+        None for the failed rows, and the errors by row index
+    """
+    if not rows:
+        return [], {}
+
+    def row_values(result: Result, count: int) -> List[Any]:
+        return list(result.scalars()) if returning else [True] * count
+
+    try:
+        values = row_values(await session.execute(statement, rows), len(rows))
+        await session.commit()
+        return values, {}
+    except IntegrityError:
+        await session.rollback()
+
+    values = []
+    errors = {}
+    for index, row in enumerate(rows):
+        try:
+            values.extend(row_values(await session.execute(statement, [row]), 1))
+        except IntegrityError as error:
+            values.append(None)
+            errors[index] = str(error.orig)
+    if atomic and errors:
+        await session.rollback()
+        return [None] * len(rows), errors
     await session.commit()
-    await session.refresh(db_item)
-    return db_item
+    return values, errors
+
+
+def invalidate(model_class: Type[InputType]) -> None:
+    """
+    Bump the version of the model's table, which invalidates its cached
+    counts, called after every committed write to the table
+
+    :param model_class: the table model that was modified
+    """
+    table_versions.bump(model_class.__tablename__)
+
+
+async def count_items(
+    session: AsyncSession,
+    count_query: Select,
+    model_class: Type[InputType],
+    key: Hashable,
+    count: CountMode,
+) -> Optional[int]:
+    """
+    Get the total count for a paginated list, from the count cache when
+    allowed, otherwise by running the count query and caching the result.
+
+    :param session: the database session to count with
+    :param count_query: the SELECT count(...) query to run
+    :param model_class: the model being counted, its table keys the cache
+    :param key: the parent filter of the count, None for the whole table
+    :param count: how the count should be computed
+    :returns: the total count, or None when count is CountMode.none
+    """
+    if count is CountMode.none:
+        return None
+
+    table_name = model_class.__tablename__
+    if count is CountMode.cached:
+        total_count = count_cache.get(table_name, key)
+        if total_count is not None:
+            return total_count
+
+    total_count = await session.scalar(count_query)
+    count_cache.set(table_name, key, total_count)
+    return total_count
+
+
+def parse_ids(ids: str, max_ids: int, name: str = "ids") -> List[int]:
+    """
+    Returns the IDs of a comma separated list of IDs
+
+    :param ids: the comma separated IDs
+    :param max_ids: the most IDs allowed
+    :param name: the name of the parameter, for the error messages
+    :returns: List[int] of the IDs, in the order given
+    """
+    try:
+        item_ids = [int(id) for id in ids.split(",") if id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{name} must be a comma separated list of integers",
+        )
+    if not item_ids or len(item_ids) > max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{name} must have between 1 and {max_ids} IDs",
+        )
+    return item_ids
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Encode the key values of the last row of a page as an opaque cursor
+
+    :param values: the JSON serializable key values, e.g. the primary key
+    :returns: the URL safe cursor string
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """
+    Decode a cursor created by encode_cursor back into its key values
+
+    :param cursor: the cursor string from the client
+    :returns: List of the key values
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+    if not isinstance(values, list) or not values:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return values
+
+
+def paginate(
+    query: Select,
+    id_column: ColumnElement,
+    offset: int,
+    limit: int,
+    after: Optional[str] = None,
+    sort_column: Optional[ColumnElement] = None,
+    descending: bool = False,
+) -> Select:
+    """
+    Add the ordering and paging clauses to the query. When the `after` cursor
+    is passed the query seeks past the last id of the previous page using the
+    primary key index, so every page costs the same as the first one.
+    Otherwise it falls back to OFFSET/LIMIT.
+    With a sort column the rows are ordered by it, with the id as the tie
+    breaker, and the cursor holds both values of the last row, the query
+    has to select the sort column labeled sort_key for get_next_cursor.
+
+    :param query: the Select query to page
+    :param id_column: the primary key column to order and seek on
+    :param offset: number of rows to skip when not using a cursor
+    :param limit: maximum number of rows to return
+    :param after: the opaque cursor returned with the previous page
+    :param sort_column: the column to sort by, from sort_key_column, if any
+    :param descending: sort in descending order
+    :returns: the modified Select query
+    """
+    query = query.order_by(*sort_order(id_column, sort_column, descending))
+    if after is None:
+        return query.offset(offset).limit(limit)
+
+    values = decode_cursor(after)
+    last_id = values[-1]
+    if not isinstance(last_id, int) or len(values) != (1 if sort_column is None else 2):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    if sort_column is None:
+        condition = id_column < last_id if descending else id_column > last_id
+    else:
+        condition = seek_condition(
+            sort_column, id_column, descending, values[0], last_id
+        )
+    return query.where(condition).limit(limit)
+
+
+def sort_order(
+    id_column: ColumnElement,
+    sort_column: Optional[ColumnElement] = None,
+    descending: bool = False,
+) -> List[ColumnElement]:
+    """
+    Returns the ORDER BY clauses of a sort, the id is the tie breaker of
+    the sort column so every row has a single place in the order
+
+    :param id_column: the primary key column
+    :param sort_column: the column to sort by, None to sort by the id
+    :param descending: sort in descending order
+    :returns: List of the ORDER BY clauses
+    """
+    columns = [id_column] if sort_column is None else [sort_column, id_column]
+    return [column.desc() if descending else column for column in columns]
+
+
+def limit_per_parent(
+    query: Select,
+    parent_column: ColumnElement,
+    id_column: ColumnElement,
+    limit: int,
+    sort_column: Optional[ColumnElement] = None,
+    descending: bool = False,
+) -> Select:
+    """
+    Keep the first rows of every parent, in the sort order, with a single
+    windowed query instead of a query per parent. Every row is numbered
+    within its parent by ROW_NUMBER() OVER (PARTITION BY parent), and
+    counted by COUNT(*) OVER (PARTITION BY parent) in the same pass.
+    The rows have the parent_id, row_number and total_count columns added.
+
+    :param query: the Select query of the rows of all the parents
+    :param parent_column: the column with the parent id of the rows
+    :param id_column: the primary key column of the rows
+    :param limit: the most rows kept for every parent
+    :param sort_column: the column to sort by, from sort_key_column, if any
+    :param descending: sort in descending order
+    :returns: the Select query of the kept rows, ordered by parent
+    """
+    ranked = query.add_columns(
+        parent_column.label("parent_id"),
+        func.row_number()
+        .over(
+            partition_by=parent_column,
+            order_by=sort_order(id_column, sort_column, descending),
+        )
+        .label("row_number"),
+        func.count().over(partition_by=parent_column).label("total_count"),
+    ).subquery()
+    return (
+        select(ranked)
+        .where(ranked.c.row_number <= limit)
+        .order_by(ranked.c.parent_id, ranked.c.row_number)
+    )
+
+
+def seek_condition(
+    column: ColumnElement,
+    id_column: ColumnElement,
+    descending: bool,
+    value: Any,
+    last_id: int,
+) -> ColumnElement:
+    """
+    Builds the condition of the rows that follow the last row of a page in
+    the sort order. SQLite sorts the NULLs first and a row value comparison
+    never matches a NULL, so the NULL rows are compared on their own.
+
+    :param column: the sort column
+    :param id_column: the id tie breaker of the sort
+    :param descending: the rows are sorted in descending order
+    :param value: the sort column value of the last row
+    :param last_id: the id of the last row
+    :return: the condition
+    """
+    if descending:
+        if value is None:
+            return and_(column.is_(None), id_column < last_id)
+        return or_(tuple_(column, id_column) < tuple_(value, last_id), column.is_(None))
+    if value is None:
+        return or_(and_(column.is_(None), id_column > last_id), column.is_not(None))
+    return tuple_(column, id_column) > tuple_(value, last_id)
+
+
+def sort_key_column(column: ColumnElement) -> ColumnElement:
+    """
+    Returns the column to sort and seek on. The Numeric columns are stored
+    as inexact REALs, the cursor has to hold the stored value and not the
+    rounded Decimal (which isn't JSON serializable either), or the seek
+    starts at the wrong row.
+
+    :param column: the model column to sort by
+    :return: the column to pass to paginate and to select as sort_key
+    """
+    if isinstance(column.type, Numeric):
+        return type_coerce(column, Float)
+    return column
+
+
+def get_next_cursor(
+    db_items: Sequence[Any], limit: int, with_sort_key: bool = False
+) -> Optional[str]:
+    """
+    Get the cursor for the page that follows db_items, or None
+    when db_items is the last page
+
+    :param db_items: the rows of the current page, in the page order
+    :param limit: the page size that was requested
+    :param with_sort_key: the rows are sorted by their sort_key column
+    :returns: the opaque cursor string or None
+    """
+    if limit <= 0 or len(db_items) < limit:
+        return None
+    if with_sort_key:
+        return encode_cursor(db_items[-1].sort_key, db_items[-1].id)
+    return encode_cursor(db_items[-1].id)
@@ -1,12 +1,22 @@
-from typing import List, Tuple, TypeVar
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, TypeVar
 from types import ModuleType
+import csv
+import io
 
-from fastapi import APIRouter, Depends, Path, status, HTTPException
+from fastapi import APIRouter, Body, Depends, Path, Query, Request, Response, status
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache import CountMode
 from database import get_db
+from middleware import conditional_get
 from endpoints import crud
+from endpoints import serializers
 from models.metadata import (
+    BulkItemError,
     MetaDataCreate,
     MetaDataUpdate,
     MetaDataPatch,
@@ -15,12 +25,38 @@ from models.combined import (
     CombinedResponseCreate,
     CombinedResponseReadAll,
     CombinedResponseRead,
+    CombinedResponseBatch,
+    CombinedResponseBulk,
     CombinedResponseUpdate,
     CombinedResponsePatch,
 )
 from endpoints import children
 
 
+# the most IDs a batch request can ask for
+MAX_BATCH_IDS = 1000
+
+# the most items a bulk request can save
+MAX_BULK_ITEMS = 10000
+
+
+class ExportFormat(str, Enum):
+    """
+    The formats of the streaming export
+
+    ndjson: one JSON object per line
+    csv: a header line with the field names, then one line per item
+    """
+
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
 # Create some generic types to use in the code that follows
 InputType = TypeVar("InputType")
 OutputType = TypeVar("OutputType")
@@ -29,6 +65,7 @@ OutputType = TypeVar("OutputType")
 def build_routes(
     model: ModuleType,
     child_models: List[ModuleType],
+    child_paths: Optional[Dict[str, str]] = None,
 ) -> APIRouter:
     """
     This function builds all the CRUD routes for the passed
@@ -38,6 +75,7 @@ def build_routes(
 
     :params ModuleType: the module containing the model definitions
     :params List[ModuleType]: the list of modules containing child model definitions
+    :params Dict[str, str]: the paths of the child routes not named after the child model
     :returns APIRouter: a populated router FastAPI will handle
     """
     # takes advantage of the plural/singular naming conventions
@@ -57,13 +95,23 @@ def build_routes(
         "model": model,
     }
     create_item_route(**params)
+    create_items_bulk_route(**params)
     get_items_route(**params)
+    # registered before /{id} so "batch" isn't taken for an id
+    get_items_batch_route(**params)
+    export_items_route(**params)
+    # registered before /{id} so the child paths aren't taken for an id
+    children.get_batch_routes(
+        **params, child_models=child_models, child_paths=child_paths
+    )
     get_item_route(**params)
     update_item_route(**params)
+    # registered before /{id} so "bulk" isn't taken for an id
+    patch_items_bulk_route(**params)
     patch_item_route(**params)
 
-    # add the child modules for the specialized children routes
-    params.update({"child_models": child_models})
+    # add the child modules for the children routes
+    params.update({"child_models": child_models, "child_paths": child_paths})
     children.get_routes(**params)
     return router
 
@@ -111,6 +159,59 @@ def create_item_route(
             )
 
 
+def create_items_bulk_route(
+    router: APIRouter,
+    model: ModuleType,
+):
+    """
+    Create the generic bulk create items route, every item is validated
+    on its own so one bad item doesn't fail the others
+    """
+    prefix, prefix_singular, class_name = get_model_names(model)
+
+    @router.post(
+        "/bulk",
+        response_model=CombinedResponseBulk[List[Optional[int]]],
+        status_code=status.HTTP_201_CREATED,
+    )
+    async def create_items(
+        response: Response,
+        items: List[Dict[str, Any]] = Body(
+            ..., description=f"The {prefix} to create, at most {MAX_BULK_ITEMS}"
+        ),
+        atomic: bool = Query(False, description="Create nothing if any item fails"),
+        db: AsyncSession = Depends(get_db),
+    ):
+        """
+        The generic bulk create items (class_name) for the route
+
+        :params items: the data of every item to create
+        :params atomic: create nothing if any item fails
+        :db AsyncSession: the asynchronous database session to use
+        """
+        check_bulk_size(items)
+        create_class = getattr(model, f"{class_name}Create")
+        valid, failed = validate_bulk_items(items, create_class)
+        ids = [None] * len(items)
+        if valid and not (atomic and failed):
+            async with db as session:
+                created_ids, errors = await crud.create_items(
+                    session=session,
+                    data=[item for _, _, item in valid],
+                    model_class=getattr(model, f"{class_name}"),
+                    atomic=atomic,
+                )
+            failed.extend(bulk_errors(valid, errors))
+            for (index, _, _), id in zip(valid, created_ids):
+                ids[index] = id
+        if atomic and failed:
+            ids = [None] * len(items)
+        response.status_code = bulk_status_code(ids, status.HTTP_201_CREATED)
+        return CombinedResponseBulk(
+            response=ids, failed=sorted(failed, key=lambda error: error.index)
+        )
+
+
 def get_items_route(
     router: APIRouter,
     model: ModuleType,
@@ -119,29 +220,150 @@ def get_items_route(
     Create the generic get item route
     """
     prefix, prefix_singular, class_name = get_model_names(model)
+    model_class = getattr(model, f"{class_name}")
+    item_read = getattr(model, f"{class_name}Read")
 
     @router.get(
         "/",
+        dependencies=[Depends(expand_conditional_get(model_class))],
         response_model=CombinedResponseReadAll[
             List[getattr(model, f"{class_name}Read")], int
         ],
     )
     async def read_items(
-        offset: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)
+        offset: int = 0,
+        limit: int = 10,
+        after: Optional[str] = None,
+        count: CountMode = CountMode.cached,
+        expand: Optional[str] = expand_query(model_class),
+        fields: Optional[str] = serializers.fields_query(item_read),
+        db: AsyncSession = Depends(get_db),
     ):
+        expand_names = parse_expand(model_class, expand)
+        field_names = serializers.parse_fields(item_read, fields)
         async with db as session:
-            items, total_count = await crud.read_items(
+            rows, total_count, next_cursor = await crud.read_items(
                 session=session,
                 offset=offset,
                 limit=limit,
+                model_class=model_class,
+                after=after,
+                count=count,
+                expand=expand_names,
+                fields=field_names,
+            )
+            if expand_names:
+                return serializers.expanded_items_response(
+                    item_read, rows, expand_names, total_count, next_cursor, field_names
+                )
+            return serializers.rows_response(
+                item_read, rows, total_count, next_cursor, field_names
+            )
+
+
+def get_items_batch_route(
+    router: APIRouter,
+    model: ModuleType,
+):
+    """
+    Create the generic get items by IDs route
+    """
+    prefix, prefix_singular, class_name = get_model_names(model)
+    table_name = getattr(model, f"{class_name}").__tablename__
+
+    @router.get(
+        "/batch",
+        dependencies=[Depends(conditional_get(table_name))],
+        response_model=CombinedResponseBatch[
+            List[Optional[getattr(model, f"{class_name}Read")]]
+        ],
+    )
+    async def read_items_batch(
+        ids: str = Query(
+            ...,
+            description=f"Comma separated IDs of the {prefix} to get, "
+            f"at most {MAX_BATCH_IDS}",
+        ),
+        db: AsyncSession = Depends(get_db),
+    ):
+        item_ids = crud.parse_ids(ids, MAX_BATCH_IDS)
+        async with db as session:
+            items = await crud.read_items_by_ids(
+                session=session,
+                ids=item_ids,
                 model_class=getattr(model, f"{class_name}"),
             )
-            return CombinedResponseReadAll(
+            missing_ids = [id for id, item in zip(item_ids, items) if item is None]
+            return CombinedResponseBatch(
                 response=items,
-                total_count=total_count,
+                missing_ids=list(dict.fromkeys(missing_ids)),
             )
 
 
+def export_items_route(
+    router: APIRouter,
+    model: ModuleType,
+):
+    """
+    Create the generic streaming export route, registered before /{id}
+    so "export" isn't taken for an id
+    """
+    prefix, prefix_singular, class_name = get_model_names(model)
+    table_name = getattr(model, f"{class_name}").__tablename__
+
+    @router.get(
+        "/export",
+        dependencies=[Depends(conditional_get(table_name))],
+        response_class=StreamingResponse,
+        responses={
+            200: {
+                "content": {
+                    media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()
+                },
+                "description": f"Every one of the {prefix}",
+            }
+        },
+    )
+    async def export_items(
+        format: ExportFormat = Query(
+            ExportFormat.ndjson, description="The format of the export"
+        ),
+        db: AsyncSession = Depends(get_db),
+    ):
+        """
+        Stream every item of the table. The rows are read from a server
+        side cursor and encoded a chunk at a time, so memory use stays the
+        same however big the table is. The response isn't JSON, so the
+        metadata envelope isn't added to it.
+
+        :params format: the format of the export
+        :db AsyncSession: the asynchronous database session to use
+        """
+        item_read = getattr(model, f"{class_name}Read")
+        encode = encode_ndjson if format is ExportFormat.ndjson else encode_csv
+
+        async def content() -> AsyncIterator[str]:
+            # the session is opened by the generator so it stays open
+            # until the last chunk has been sent
+            async with db as session:
+                chunks = crud.stream_items(
+                    session=session,
+                    model_class=getattr(model, f"{class_name}"),
+                )
+                if format is ExportFormat.csv:
+                    yield encode_csv_header(item_read)
+                async for rows in chunks:
+                    yield encode(item_read, rows)
+
+        return StreamingResponse(
+            content(),
+            media_type=EXPORT_MEDIA_TYPES[format],
+            headers={
+                "Content-Disposition": f'attachment; filename="{prefix}.{format.value}"'
+            },
+        )
+
+
 def get_item_route(
     router: APIRouter,
     model: ModuleType,
@@ -150,27 +372,41 @@ def get_item_route(
     Create the generic get item route
     """
     prefix, prefix_singular, class_name = get_model_names(model)
+    model_class = getattr(model, f"{class_name}")
+    item_read = getattr(model, f"{class_name}Read")
 
     @router.get(
         "/{id}",
+        dependencies=[Depends(expand_conditional_get(model_class))],
         response_model=CombinedResponseRead[getattr(model, f"{class_name}Read")],
     )
     async def read_item(
         id: int = Path(..., title=f"The ID of the {prefix} to get"),
+        expand: Optional[str] = expand_query(model_class),
+        fields: Optional[str] = serializers.fields_query(item_read),
         db: AsyncSession = Depends(get_db),
     ):
+        expand_names = parse_expand(model_class, expand)
+        field_names = serializers.parse_fields(item_read, fields)
         async with db as session:
             db_item = await crud.read_item(
                 session=session,
                 id=id,
-                model_class=getattr(model, f"{class_name}"),
+                model_class=model_class,
+                expand=expand_names,
+                fields=field_names,
             )
             if db_item is None:
                 raise HTTPException(
                     status_code=404,
                     detail=f"{class_name} not found",
                 )
-            item_read = getattr(model, f"{class_name}Read")
+            if expand_names:
+                return serializers.expanded_item_response(
+                    item_read, db_item, expand_names, field_names
+                )
+            if field_names:
+                return serializers.row_response(item_read, db_item, field_names)
             return CombinedResponseRead(response=item_read.model_validate(db_item))
 
 
@@ -203,12 +439,67 @@ def update_item_route(
                 )
 
             # construct the response in the expected format
+            item_read = getattr(model, f"{class_name}Read")
             return CombinedResponseUpdate(
                 meta_data=MetaDataUpdate(),
-                response=db_item,
+                response=item_read.model_validate(db_item),
             )
 
 
+def patch_items_bulk_route(
+    router: APIRouter,
+    model: ModuleType,
+):
+    """
+    Create the generic bulk patch items route, every item has the id of
+    the item to patch and is validated on its own
+    """
+    prefix, prefix_singular, class_name = get_model_names(model)
+
+    @router.patch(
+        "/bulk",
+        response_model=CombinedResponseBulk[List[Optional[int]]],
+    )
+    async def patch_items(
+        response: Response,
+        items: List[Dict[str, Any]] = Body(
+            ...,
+            description=f"The id and changes of the {prefix} to patch, "
+            f"at most {MAX_BULK_ITEMS}",
+        ),
+        atomic: bool = Query(False, description="Patch nothing if any item fails"),
+        db: AsyncSession = Depends(get_db),
+    ):
+        """
+        The generic bulk patch items (class_name) for the route
+
+        :params items: the id and changes of every item to patch
+        :params atomic: patch nothing if any item fails
+        :db AsyncSession: the asynchronous database session to use
+        """
+        check_bulk_size(items)
+        patch_class = getattr(model, f"{class_name}Patch")
+        valid, failed = validate_bulk_items(items, patch_class, with_id=True)
+        ids = [None] * len(items)
+        if valid and not (atomic and failed):
+            async with db as session:
+                patched_ids, errors = await crud.patch_items(
+                    session=session,
+                    data=[(id, item) for _, id, item in valid],
+                    model_class=getattr(model, f"{class_name}"),
+                    atomic=atomic,
+                )
+            failed.extend(bulk_errors(valid, errors))
+            for (index, _, _), id in zip(valid, patched_ids):
+                ids[index] = id
+        if atomic and failed:
+            ids = [None] * len(items)
+        response.status_code = bulk_status_code(ids, status.HTTP_200_OK)
+        return CombinedResponseBulk(
+            response=ids, failed=sorted(failed, key=lambda error: error.index)
+        )
+
+
 def patch_item_route(
     router: APIRouter,
     model: ModuleType,
@@ -238,12 +529,55 @@ def patch_item_route(
                 )
 
             # construct the response in the expected format
+            item_read = getattr(model, f"{class_name}Read")
             return CombinedResponsePatch(
                 meta_data=MetaDataPatch(),
-                response=db_item,
+                response=item_read.model_validate(db_item),
             )
 
 
+def encode_ndjson(item_read: type, rows: List[Any]) -> str:
+    """
+    Encode the rows as JSON lines, every row is validated by the Read model
+    so the line is the same as the item in the JSON responses
+
+    :params item_read: the Read model of the rows
+    :params rows: the rows to encode
+    :returns: str of one JSON object per line
+    """
+    return "".join(
+        item_read.model_validate(row).model_dump_json() + "\n" for row in rows
+    )
+
+
+def encode_csv_header(item_read: type) -> str:
+    """
+    Encode the field names of the Read model as the CSV header line
+
+    :params item_read: the Read model of the rows
+    :returns: str of the CSV header line
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(item_read.model_fields)
+    return buffer.getvalue()
+
+
+def encode_csv(item_read: type, rows: List[Any]) -> str:
+    """
+    Encode the rows as CSV lines, with the values in the order of the
+    header fields and None written as an empty value
+
+    :params item_read: the Read model of the rows
+    :params rows: the rows to encode
+    :returns: str of one CSV line per row
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(item_read.model_validate(row).model_dump(mode="json").values())
+    return buffer.getvalue()
+
+
 def get_model_names(model: ModuleType) -> Tuple[str, str, str]:
     """
     Returns the prefix, singular version of the prefix and the class_name for the model
@@ -257,3 +591,149 @@ def get_model_names(model: ModuleType) -> Tuple[str, str, str]:
     prefix_singular = prefix.rstrip("s")
     class_name = prefix_singular.title().replace("_", "")
     return prefix, prefix_singular, class_name
+
+
+def expand_query(model_class: type) -> Any:
+    """
+    Returns the expand query parameter of the model's routes, documented
+    with the relationships the model declares
+
+    :params model_class: the table model
+    :returns: the Query parameter
+    """
+    names = ", ".join(crud.model_relationships(model_class))
+    return Query(
+        None,
+        description=f"Comma separated relationships to include: {names}",
+    )
+
+
+def parse_expand(model_class: type, expand: Optional[str]) -> List[str]:
+    """
+    Returns the relationships of a comma separated expand parameter
+
+    :params model_class: the table model
+    :params expand: the comma separated relationship names, if any
+    :returns: List[str] of the relationship names, without duplicates
+    """
+    if not expand:
+        return []
+    names = list(dict.fromkeys(name.strip() for name in expand.split(",")))
+    relationships = crud.model_relationships(model_class)
+    unknown = [name for name in names if name not in relationships]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown relationships {', '.join(unknown)}, "
+            f"expected some of {', '.join(relationships)}",
+        )
+    return names
+
+
+def expand_conditional_get(model_class: type) -> Callable[[Request], None]:
+    """
+    Create the conditional GET dependency of the routes that expand the
+    model's relationships, the tables of the expanded relationships are
+    part of the ETag so a change to an expanded item changes it too
+
+    :params model_class: the table model
+    :returns: the dependency function
+    """
+    checks = {}
+
+    def check_etag(request: Request) -> None:
+        names = tuple(parse_expand(model_class, request.query_params.get("expand")))
+        if names not in checks:
+            table_names = {model_class.__tablename__}
+            for name in names:
+                table_names.update(crud.relationship_tables(model_class, name))
+            checks[names] = conditional_get(*sorted(table_names))
+        checks[names](request)
+
+    return check_etag
+
+
+def check_bulk_size(items: List[Any]) -> None:
+    """
+    Rejects bulk requests with no items or too many items
+
+    :params items: the items of the bulk request
+    """
+    if not items or len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A bulk request must have between 1 and {MAX_BULK_ITEMS} items",
+        )
+
+
+def validate_bulk_items(
+    items: List[Dict[str, Any]], item_class: type, with_id: bool = False
+) -> Tuple[List[Tuple[int, Optional[int], Any]], List[BulkItemError]]:
+    """
+    Validates every item of a bulk request on its own
+
+    :params items: the items of the bulk request
+    :params item_class: the Create or Patch sqlmodel class to validate with
+    :params with_id: every item must also have the integer id of the item to change
+    :returns: the (index, id, validated item) of the valid items, and the
+    errors of the invalid items
+    """
+    valid = []
+    failed = []
+    for index, item in enumerate(items):
+        item = dict(item)
+        id = item.pop("id", None) if with_id else None
+        if with_id and (not isinstance(id, int) or isinstance(id, bool)):
+            failed.append(
+                BulkItemError(
+                    index=index,
+                    errors=[{"loc": ["id"], "msg": "An integer id is required"}],
+                )
+            )
+            continue
+        try:
+            valid.append((index, id, item_class.model_validate(item)))
+        except ValidationError as error:
+            failed.append(
+                BulkItemError(
+                    index=index,
+                    id=id,
+                    errors=error.errors(
+                        include_url=False, include_context=False, include_input=False
+                    ),
+                )
+            )
+    return valid, failed
+
+
+def bulk_errors(
+    valid: List[Tuple[int, Optional[int], Any]], errors: Dict[int, str]
+) -> List[BulkItemError]:
+    """
+    Returns the errors crud reported for the valid items of a bulk request
+
+    :params valid: the (index, id, validated item) the crud function was given
+    :params errors: the errors by position in the items crud was given
+    :returns: the errors with the items' positions in the request
+    """
+    return [
+        BulkItemError(index=valid[position][0], id=valid[position][1], errors=error)
+        for position, error in errors.items()
+    ]
+
+
+def bulk_status_code(ids: List[Optional[int]], success_status: int) -> int:
+    """
+    Returns the status code of a bulk request, 207 when only some of the
+    items were saved and 422 when none of them were
+
+    :params ids: the saved id of every item, None for the failed items
+    :params success_status: the status code when every item was saved
+    :returns: the status code
+    """
+    saved = sum(id is not None for id in ids)
+    if saved == len(ids):
+        return success_status
+    if saved == 0:
+        return status.HTTP_422_UNPROCESSABLE_ENTITY
+    return status.HTTP_207_MULTI_STATUS
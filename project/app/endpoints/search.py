@@ -1,24 +1,24 @@
-from typing import Optional
+from typing import List, Optional
 
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 
-from app.database import get_db
-from app.models import search
+from database import SEARCH_TABLES, TextSearchManager, get_db
+from models.combined import CombinedResponseReadAll
+from models.search import SearchResult
 
 # create a router for the model
 router = APIRouter(
-    prefix="/{search}",
     tags=["Search"],
     responses={404: {"description": "Not found"}},
     dependencies=[Depends(get_db)],
 )
 
 
-@router.get("/search", response_model=search.SearchResponse)
+@router.get("/search", response_model=CombinedResponseReadAll[List[SearchResult], int])
 async def search_text(
-    query: str,
+    query: str = Query(..., min_length=1, description="The words to search for"),
     table_name: Optional[str] = None,
     column_name: Optional[str] = None,
     limit: int = 10,
@@ -26,77 +26,108 @@ async def search_text(
     db: AsyncSession = Depends(get_db),
 ):
     """
-    Search across all text columns or specific table/column
-
-    Args:
-        query: Search term
-        table_name: Optional filter by table name
-        column_name: Optional filter by column name
-        limit: Maximum number of results to return
-        offset: Number of results to skip
+    Search across all the searchable tables or a specific table/column.
+    Every word of the query has to match, the results are ordered by
+    their bm25 rank and only the FTS5 indexes are scanned.
+
+    :param query: the search words
+    :param table_name: optional filter by table name
+    :param column_name: optional filter by column name
+    :param limit: maximum number of results to return
+    :param offset: number of results to skip
     """
-    try:
-        async with db as session:
-            conn = await session.connection()
-
-            # Base query
-            base_query = """
-                SELECT table_name, column_name, content, content_rowid
-                FROM text_search
-                WHERE content MATCH :query
-            """
-
-            # Add filters if provided
-            filters = []
-            params = {"query": f'"{query}"'}
-
-            if table_name:
-                filters.append("table_name = :table_name")
-                params.append(table_name)
-
-            if column_name:
-                filters.append("column_name = :column_name")
-                params.append(column_name)
-
-            if filters:
-                base_query += f" AND {' AND '.join(filters)}"
-
-            # Add ordering and pagination
-            base_query += " ORDER BY rank LIMIT :limit OFFSET :offset"
-            params.update(
-                {
-                    "limit": limit,
-                    "offset": offset,
-                }
+    tables = get_search_tables(table_name, column_name)
+    params = {
+        "query": build_match_expression(query, column_name),
+        "limit": limit,
+        "offset": offset,
+    }
+    selects = []
+    counts = []
+    for name in tables:
+        index_name = TextSearchManager.index_name(name)
+        _, _, content = SEARCH_TABLES[name]
+        selects.append(f"""
+            SELECT '{name}' AS table_name,
+                   rowid AS id,
+                   {content} AS content,
+                   snippet({index_name}, -1, '<mark>', '</mark>', '…', 12) AS snippet,
+                   bm25({index_name}) AS rank
+            FROM {index_name}
+            WHERE {index_name} MATCH :query
+        """)
+        counts.append(
+            f"(SELECT COUNT(*) FROM {index_name} WHERE {index_name} MATCH :query)"
+        )
+    search_query = (
+        " UNION ALL ".join(selects) + " ORDER BY rank LIMIT :limit OFFSET :offset"
+    )
+    count_query = f"SELECT {' + '.join(counts)}"
+
+    async with db as session:
+        if not await TextSearchManager.is_ready(session, tables):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The search index is being built, try again shortly",
+                headers={"Retry-After": "5"},
             )
+        results = await session.execute(text(search_query), params)
+        items = [SearchResult(**row._mapping) for row in results.fetchall()]
+        total_count = await session.scalar(text(count_query), params)
+        return CombinedResponseReadAll(response=items, total_count=total_count)
 
-            # Execute search query
-            results = await conn.execute(text(base_query), params)
-            results = results.fetchall()
 
-            # Get total count
-            count_query = f"""
-                SELECT COUNT(*) FROM text_search 
-                WHERE content MATCH :query
-                {f"AND {' AND '.join(filters)}" if filters else ""}
-            """
-            total_results = await conn.execute(text(count_query), params)
-            total_count = total_results.fetchone()[0]
-
-            # Format results
-            formatted_results = [
-                search.SearchResponse(
-                    table_name=row[0],
-                    column_name=row[1],
-                    content=row[2],
-                    content_rowid=row[3],
-                )
-                for row in results
-            ]
+def get_search_tables(
+    table_name: Optional[str], column_name: Optional[str]
+) -> List[str]:
+    """
+    Returns the searchable tables matching the filters, the filters are
+    only ever compared to the known table and column names so they never
+    reach the SQL as user input
 
-            return search.SearchResponse(
-                results=formatted_results, total_count=total_count
+    :param table_name: optional table name filter
+    :param column_name: optional column name filter
+    :return: the names of the tables to search
+    """
+    if table_name is not None and table_name not in SEARCH_TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{table_name} is not searchable, "
+            f"expected one of {', '.join(SEARCH_TABLES)}",
+        )
+    tables = [table_name] if table_name is not None else list(SEARCH_TABLES)
+    if column_name is not None:
+        tables = [name for name in tables if column_name in SEARCH_TABLES[name][1]]
+        if not tables:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{column_name} is not a searchable column",
             )
+    return tables
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+def build_match_expression(
+    query: str, column_name: Optional[str], prefix: bool = False
+) -> str:
+    """
+    Turns the search words into an FTS5 query that matches rows with all
+    the words. Every word is quoted so characters like *, ", - or : are
+    searched for as text instead of being parsed as FTS5 query syntax.
+
+    :param query: the search words
+    :param column_name: optional column to restrict the match to
+    :param prefix: match the last word as a prefix, for search as you type
+    :return: the FTS5 MATCH expression
+    """
+    words = query.split()
+    if not words:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The search query has no words",
+        )
+    expression = " ".join('"' + word.replace('"', '""') + '"' for word in words)
+    if prefix:
+        expression += "*"
+    if column_name is not None:
+        expression = f"{{{column_name}}} : ({expression})"
+    return expression
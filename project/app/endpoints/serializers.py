@@ -0,0 +1,327 @@
+"""
+This module contains the fast serialization path of the list routes.
+The routes select the columns of the *Read model as Core rows, and the
+rows are turned straight into the JSON ready values of the response,
+without building ORM objects, validating every row with the *Read
+model and having FastAPI validate and encode the response model again.
+The rows come from the database, so they already are valid.
+"""
+
+import sys
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.engine import Row
+from typing_extensions import TypedDict
+
+from middleware import MetadataJSONResponse
+
+
+# the model config settings that change how the values are serialized
+SERIALIZATION_CONFIG = ("json_encoders", "ser_json_timedelta", "ser_json_bytes")
+
+
+@lru_cache(maxsize=64)
+def get_rows_adapter(
+    item_read: Type[BaseModel], fields: Optional[Tuple[str, ...]] = None
+) -> TypeAdapter:
+    """
+    Returns the cached adapter that serializes a list of rows as the Read
+    model. The rows are dumped as a TypedDict with the fields and the
+    serialization config of the model, so the values (Decimal, datetime)
+    are encoded exactly as the model encodes them, without constructing
+    a model for every row.
+
+    :param item_read: the Read model of the rows
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: the TypeAdapter of the list of rows
+    """
+    names = fields or tuple(item_read.model_fields)
+    row_dict = TypedDict(
+        f"{item_read.__name__}Row",
+        {name: item_read.model_fields[name].annotation for name in names},
+    )
+    row_dict.__pydantic_config__ = ConfigDict(
+        **{
+            key: value
+            for key, value in item_read.model_config.items()
+            if key in SERIALIZATION_CONFIG
+        }
+    )
+    return TypeAdapter(List[row_dict])
+
+
+def fields_query(item_read: Type[BaseModel]) -> Any:
+    """
+    Returns the fields query parameter of the model's routes, documented
+    with the fields of the Read model
+
+    :param item_read: the Read model of the route
+    :return: the Query parameter
+    """
+    names = ", ".join(item_read.model_fields)
+    return Query(
+        None,
+        description=f"Comma separated fields to return, the id is always returned: "
+        f"{names}",
+    )
+
+
+def parse_fields(
+    item_read: Type[BaseModel], fields: Optional[str]
+) -> Optional[Tuple[str, ...]]:
+    """
+    Returns the sparse fieldset of a comma separated fields parameter. The
+    id is always part of it, it is the key of the item and of the cursor.
+
+    :param item_read: the Read model the fields are validated against
+    :param fields: the comma separated field names, if any
+    :return: the field names in the Read model order, None for all the fields
+    """
+    if not fields:
+        return None
+    names = {name.strip() for name in fields.split(",")}
+    unknown = sorted(names - set(item_read.model_fields))
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown fields {', '.join(unknown)}, "
+            f"expected some of {', '.join(item_read.model_fields)}",
+        )
+    names.add("id")
+    # in the model order so every request of the fieldset shares one adapter
+    return tuple(name for name in item_read.model_fields if name in names)
+
+
+def encode_rows(
+    item_read: Type[BaseModel],
+    rows: Sequence[Row],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> List[Dict]:
+    """
+    Encode the rows as the JSON ready dictionaries of the Read model
+
+    :param item_read: the Read model of the rows
+    :param rows: the rows with a column for every field of the Read model,
+        or for every field of the fieldset
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: List of the encoded rows, with the fields in the model order
+    """
+    if not rows:
+        return []
+    # the position of every model field in the rows
+    columns = rows[0]._fields
+    positions = [
+        (name, columns.index(name)) for name in fields or item_read.model_fields
+    ]
+    items = [{name: row[index] for name, index in positions} for row in rows]
+    return get_rows_adapter(item_read, fields).dump_python(items, mode="json")
+
+
+def rows_response(
+    item_read: Type[BaseModel],
+    rows: Sequence[Row],
+    total_count: Optional[int],
+    next_cursor: Optional[str],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> MetadataJSONResponse:
+    """
+    Build the paginated list response of the rows. The response is returned
+    by the route as it is, so FastAPI doesn't validate and encode it with
+    the response model, the content has the same fields in the same order
+    as the CombinedResponseReadAll model so the body is unchanged.
+
+    :param item_read: the Read model of the rows
+    :param rows: the rows of the page
+    :param total_count: the total count, None when it wasn't counted
+    :param next_cursor: the cursor of the next page, if any
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: the response to return from the route
+    """
+    return MetadataJSONResponse(
+        content={
+            "meta_data": None,
+            "response": encode_rows(item_read, rows, fields),
+            "total_count": total_count,
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def row_response(
+    item_read: Type[BaseModel], row: Row, fields: Optional[Tuple[str, ...]]
+) -> MetadataJSONResponse:
+    """
+    Build the response of a single item selected as a row
+
+    :param item_read: the Read model of the row
+    :param row: the row of the item
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: the response to return from the route
+    """
+    return MetadataJSONResponse(
+        content={
+            "meta_data": None,
+            "response": encode_rows(item_read, [row], fields)[0],
+        }
+    )
+
+
+def child_groups_response(
+    item_read: Type[BaseModel],
+    rows: Sequence[Row],
+    parent_ids: Sequence[int],
+    per_parent_limit: int,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> MetadataJSONResponse:
+    """
+    Build the response of the batched child route, the children grouped by
+    parent, in the order of the parent IDs, with every parent's count. A
+    parent without children (or that doesn't exist) has an empty group.
+
+    :param item_read: the Read model of the children
+    :param rows: the children, with their parent_id and total_count columns
+    :param parent_ids: the IDs of the parents that were asked for
+    :param per_parent_limit: the most children of every parent
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: the response to return from the route
+    """
+    groups = {
+        parent_id: {"parent_id": parent_id, "total_count": 0, "items": []}
+        for parent_id in parent_ids
+    }
+    for row, item in zip(rows, encode_rows(item_read, rows, fields)):
+        group = groups[row.parent_id]
+        group["total_count"] = row.total_count
+        group["items"].append(item)
+    return MetadataJSONResponse(
+        content={
+            "meta_data": None,
+            "response": list(groups.values()),
+            "per_parent_limit": per_parent_limit,
+        }
+    )
+
+
+def get_read_model(model_class: type) -> Type[BaseModel]:
+    """
+    Returns the Read model of a table model, every model module declares
+    it next to the table model, e.g. AlbumRead for Album
+
+    :param model_class: the table model
+    :return: the Read model
+    """
+    return getattr(sys.modules[model_class.__module__], f"{model_class.__name__}Read")
+
+
+def encode_objects(
+    item_read: Type[BaseModel],
+    db_items: Sequence[Any],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> List[Dict]:
+    """
+    Encode the ORM objects as the JSON ready dictionaries of the Read model
+
+    :param item_read: the Read model of the objects
+    :param db_items: the ORM objects
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: List of the encoded objects, with the fields in the model order
+    """
+    items = [
+        {name: getattr(db_item, name) for name in fields or item_read.model_fields}
+        for db_item in db_items
+    ]
+    return get_rows_adapter(item_read, fields).dump_python(items, mode="json")
+
+
+def encode_expanded(
+    item_read: Type[BaseModel],
+    db_items: Sequence[Any],
+    expand: Sequence[str],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> List[Dict]:
+    """
+    Encode the ORM objects with their expanded relationships, every
+    related object is encoded with the Read model of its own table, a
+    list for the one to many and many to many relationships, an object
+    or None for the many to one ones
+
+    :param item_read: the Read model of the objects
+    :param db_items: the ORM objects, with the expanded relationships loaded
+    :param expand: the names of the expanded relationships
+    :param fields: the fields of a sparse fieldset of the objects, the
+        related objects always have all their fields
+    :return: List of the encoded objects
+    """
+    items = encode_objects(item_read, db_items, fields)
+    if not db_items:
+        return items
+    relationships = sa_inspect(type(db_items[0])).relationships
+    for name in expand:
+        relationship = relationships[name]
+        related_read = get_read_model(relationship.mapper.class_)
+        for item, db_item in zip(items, db_items):
+            related = getattr(db_item, name)
+            if relationship.uselist:
+                item[name] = encode_objects(related_read, related)
+            elif related is not None:
+                item[name] = encode_objects(related_read, [related])[0]
+            else:
+                item[name] = None
+    return items
+
+
+def expanded_items_response(
+    item_read: Type[BaseModel],
+    db_items: Sequence[Any],
+    expand: Sequence[str],
+    total_count: Optional[int],
+    next_cursor: Optional[str],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> MetadataJSONResponse:
+    """
+    Build the paginated list response of the items with their expanded
+    relationships, the same fields as rows_response plus the relationships
+
+    :param item_read: the Read model of the items
+    :param db_items: the ORM objects of the page
+    :param expand: the names of the expanded relationships
+    :param total_count: the total count, None when it wasn't counted
+    :param next_cursor: the cursor of the next page, if any
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: the response to return from the route
+    """
+    return MetadataJSONResponse(
+        content={
+            "meta_data": None,
+            "response": encode_expanded(item_read, db_items, expand, fields),
+            "total_count": total_count,
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def expanded_item_response(
+    item_read: Type[BaseModel],
+    db_item: Any,
+    expand: Sequence[str],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> MetadataJSONResponse:
+    """
+    Build the response of a single item with its expanded relationships
+
+    :param item_read: the Read model of the item
+    :param db_item: the ORM object
+    :param expand: the names of the expanded relationships
+    :param fields: the fields of a sparse fieldset, None for all of them
+    :return: the response to return from the route
+    """
+    return MetadataJSONResponse(
+        content={
+            "meta_data": None,
+            "response": encode_expanded(item_read, [db_item], expand, fields)[0],
+        }
+    )
@@ -12,9 +12,10 @@ up and running. The database itself is the chinook sample database
 available here: https://www.sqlitetutorial.net/sqlite-sample-database/
 """
 
+import asyncio
 from typing import Dict
 from logging import getLogger
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -23,9 +24,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
 
-from middleware import log_middleware, MetadataMiddleware
+from middleware import (
+    log_middleware,
+    ETagMiddleware,
+    MetadataMiddleware,
+    MetadataJSONResponse,
+)
 
-from database import init_db
+from database import init_db, close_db, TextSearchManager
 
 # get the endpoint models to build the routes
 from models import artists
@@ -40,8 +46,8 @@ from models import customers
 from models import employees
 from endpoints.routes import build_routes
 
-# from app.endpoints.search import router as search_router
-from endpoints.application import router as application_router
+from endpoints.search import router as search_router
+from endpoints.application import router as application_router, page_prefetcher
 from logger_config import setup_logging
 
 
@@ -62,11 +68,22 @@ async def lifespan(app: FastAPI):
     msg = await init_db()
     logger.info(msg)
 
+    # build and maintain the search indexes without holding up startup
+    search_index_task = asyncio.create_task(TextSearchManager.run_background_tasks())
+    # render the neighbour pages of the HTMX tabs into the fragment cache
+    prefetch_task = asyncio.create_task(page_prefetcher.run())
+
     # yield to the application until it is shutdown
     yield
 
+    for task in (search_index_task, prefetch_task):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
     """Event handler for the shutdown event"""
     logger.info("Shutting down presentation app")
+    await close_db()
 
 
 def app_factory():
@@ -83,6 +100,7 @@ def app_factory():
         openapi_url="/openapi.json",
         lifespan=lifespan,
         debug=True,
+        default_response_class=MetadataJSONResponse,
     )
 
     # add CORS middleware
@@ -95,6 +113,7 @@ def app_factory():
     )
     fastapi_app.add_middleware(BaseHTTPMiddleware, dispatch=log_middleware)
     fastapi_app.add_middleware(MetadataMiddleware)
+    fastapi_app.add_middleware(ETagMiddleware)
 
     # serve the static files
     static_dir = Path(__file__).resolve().parent / "static"
@@ -105,7 +124,7 @@ def app_factory():
         fastapi_app.include_router(build_routes(**route_config), prefix="/api/v1")
 
     # add the search route
-    # fastapi_app.include_router(search_router, prefix="/api/v1")
+    fastapi_app.include_router(search_router, prefix="/api/v1")
 
     # Route for favicon.ico
     @fastapi_app.get("/favicon.ico", include_in_schema=False)
@@ -131,7 +150,11 @@ def get_routes_config() -> Dict:
     """
     return [
         {"model": artists, "child_models": [albums]},
-        {"model": albums, "child_models": [tracks]},
+        {
+            "model": albums,
+            "child_models": [tracks, artists],
+            "child_paths": {"artists": "artist"},
+        },
         {"model": tracks, "child_models": [invoice_items, playlists]},
         {"model": genres, "child_models": [tracks]},
         {"model": media_types, "child_models": [tracks]},
@@ -139,7 +162,11 @@ def get_routes_config() -> Dict:
         {"model": invoices, "child_models": [invoice_items]},
         {"model": invoice_items, "child_models": []},
         {"model": customers, "child_models": [invoices]},
-        {"model": employees, "child_models": [customers, employees]},
+        {
+            "model": employees,
+            "child_models": [customers, employees],
+            "child_paths": {"employees": "reports"},
+        },
     ]
 
 
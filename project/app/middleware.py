@@ -1,20 +1,25 @@
 """
 This module contains the middleware that logs
 information about every request the application
-handles, and modifies the response to include
-metadata about the response
+handles, modifies the response to include
+metadata about the response, and answers the
+conditional GETs of unchanged resources
 """
 
-import json
+from contextvars import ContextVar
+from hashlib import blake2b
 from logging import getLogger
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional
 from http import HTTPStatus
 from urllib.parse import parse_qs
 from functools import lru_cache
 
-from fastapi import Request, Response
+from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from cache import table_versions
 
 
 logger = getLogger()
@@ -35,76 +40,173 @@ async def log_middleware(request: Request, call_next):
     return response
 
 
-class MetadataMiddleware(BaseHTTPMiddleware):
+# the ASGI scope of the request being handled, set by the MetadataMiddleware
+# so the response class can build the metadata when it renders the body
+request_scope: ContextVar[Optional[Scope]] = ContextVar("request_scope", default=None)
+
+
+class MetadataMiddleware:
     """
-    This middleware class modifies the response to include
-    metadata about the response, like location of resource for POST, PUT
-    and PATCH requests, and pagination information for GET requests of collections
+    This pure ASGI middleware hands the request context to the
+    MetadataJSONResponse class, which adds metadata about the response, like
+    location of resource for POST, PUT and PATCH requests, and pagination
+    information for GET requests of collections. Because the metadata is
+    added before the response body is serialized the body is never buffered,
+    parsed and serialized again here, and streaming responses, like the
+    exports, pass through a chunk at a time.
     """
 
-    async def dispatch(self, request: Request, call_next):
-        # Skip modification for OpenAPI schema requests
-        if request.url.path == "/openapi.json":
-            return await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        # Get the response from the route handler
-        original_response = await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # return original response if not JSON
-        if original_response.headers.get("content-type") != "application/json":
-            return original_response
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_scope.reset(token)
 
-        # Extract the response body
-        response_body = [section async for section in original_response.body_iterator]
-        # Decode the JSON response body
-        decoded_body = b"".join(response_body).decode()
 
-        # parse the JSON response body
-        try:
-            data = json.loads(decoded_body)
-        except json.JSONDecodeError:
-            return original_response
+class ETagMiddleware:
+    """
+    This pure ASGI middleware adds the ETag computed by the conditional_get
+    dependency of the route to the successful response, with a no-cache
+    Cache-Control so the clients revalidate it with If-None-Match on every
+    request instead of guessing how long it stays fresh.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_etag(message: Message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                etag = scope.get("state", {}).get("etag")
+                if etag is not None:
+                    headers = MutableHeaders(scope=message)
+                    headers["ETag"] = etag
+                    headers["Cache-Control"] = "no-cache"
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+
+def conditional_get(*table_names: str) -> Callable[[Request], None]:
+    """
+    Create the dependency that makes the GET route conditional. The weak
+    ETag is derived from the versions of the tables the route reads and
+    the request's path and query parameters, so a request whose
+    If-None-Match has the current ETag is answered with 304 Not Modified
+    before the route touches the database.
+
+    :param table_names: the names of the tables the route reads
+    :return: the dependency function
+    """
+
+    def check_etag(request: Request) -> None:
+        etag = build_etag(request, table_names)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(
+                status_code=304,
+                headers={"ETag": etag, "Cache-Control": "no-cache"},
+            )
+        # added to the response by the ETagMiddleware
+        request.state.etag = etag
+
+    return check_etag
+
+
+def build_etag(request: Request, table_names: tuple) -> str:
+    """
+    Build the weak ETag of the request
+
+    :param request: the GET request
+    :param table_names: the names of the tables the route reads
+    :return: the ETag header value
+    """
+    query = sorted(request.query_params.multi_items())
+    key = f"{table_versions.token(table_names)}|{request.url.path}|{query}"
+    return f'W/"{blake2b(key.encode(), digest_size=12).hexdigest()}"'
 
-        # Modify the JSON data
-        modified_data = build_response_data(request, original_response, data)
 
-        # Create a new JSON response with updated content
-        response = JSONResponse(
-            content=modified_data,
-            status_code=original_response.status_code,
-            headers=original_response.headers,
-        )
-        # Update the Content-Length header for the modified JSON response
-        response.headers["Content-Length"] = str(len(response.body))
-        return response
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of the If-None-Match header with the ETag
+
+    :param if_none_match: the header value, if the request has one
+    :param etag: the current ETag of the resource
+    :return: True if the client already has the current version
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(",")
+    )
+
+
+class MetadataJSONResponse(JSONResponse):
+    """
+    JSON response class that adds the metadata for the current request
+    to the response content before it is serialized, so every response
+    body is serialized exactly once
+    """
+
+    def render(self, content: Any) -> bytes:
+        scope = request_scope.get()
+        if scope is not None and isinstance(content, Dict):
+            content = (
+                build_response_data(Request(scope), self.status_code, content)
+                or content
+            )
+        return super().render(content)
 
 
 @lru_cache(maxsize=32)
 def get_status_description(status_code: int) -> str:
     """Cache HTTP status descriptions to avoid repeated lookups"""
-    return HTTPStatus(status_code).description
+    # some statuses, like 207 and 422, only have a phrase
+    http_status = HTTPStatus(status_code)
+    return http_status.description or http_status.phrase
 
 
 def build_response_data(
-    request: Request, original_response: Response, data: Dict
+    request: Request, status_code: int, data: Dict
 ) -> Optional[Dict]:
     """
     Build a response based on the request and data
 
     :param request: FastAPI Request object
-    :param original_response: FastAPI Response object
+    :param status_code: the HTTP status code of the response
     :param data: Dictionary containing response data
 
     returns: Dict containing formatted response data or None
     """
     # get common metadata elements
     base_meta = {
-        "status_code": original_response.status_code,
-        "status_message": get_status_description(original_response.status_code),
+        "status_code": status_code,
+        "status_message": get_status_description(status_code),
     }
     request_url = str(request.url)
 
     match request.method:
+        case "POST" | "PATCH" if "failed" in data:
+            data["meta_data"] = {
+                **base_meta,
+                "failed": data.pop("failed"),
+            }
+            return data
+
         case "POST":
             data["meta_data"] = {
                 **base_meta,
@@ -119,27 +221,51 @@ def build_response_data(
             }
             return data
 
+        case "GET" if "missing_ids" in data:
+            data["meta_data"] = {
+                **base_meta,
+                "missing_ids": data.pop("missing_ids"),
+            }
+            return data
+
+        case "GET" if "per_parent_limit" in data:
+            data["meta_data"] = {
+                **base_meta,
+                "per_parent_limit": data.pop("per_parent_limit"),
+            }
+            return data
+
         case "GET" if "response" in data and isinstance(data["response"], List):
+            next_cursor = data.pop("next_cursor", None)
             try:
                 query_string = request.scope.get("query_string", b"").decode()
                 query_params = parse_qs(query_string)
                 offset = int(query_params.get("offset", [0])[0])
                 limit = int(query_params.get("limit", [10])[0])
-                total_count = int(data.pop("total_count", 0))
+                after = query_params.get("after", [None])[0]
+                total_count = data.pop("total_count", 0)
                 page = (offset // limit) + 1
-                page_count = total_count // limit + (
-                    1 if total_count % limit != 0 else 0
-                )
+                # the total is None when the client asked to skip the count
+                page_count = None
+                if total_count is not None:
+                    total_count = int(total_count)
+                    page_count = total_count // limit + (
+                        1 if total_count % limit != 0 else 0
+                    )
                 if page_count == 0:
                     collection_name = request.url.path.split("/")[-1]
                     base_meta["status_message"] = f"No {collection_name} found"
+                # a cursor page has no offset, so it has no page number either
+                if after is not None:
+                    position = {"after": after, "limit": limit}
+                else:
+                    position = {"offset": offset, "limit": limit, "page": page}
                 data["meta_data"] = {
                     **base_meta,
-                    "offset": offset,
-                    "limit": limit,
-                    "page": page,
+                    **position,
                     "page_count": page_count,
                     "total_count": total_count,
+                    "next_cursor": next_cursor,
                 }
                 return data
             except (KeyError, ValueError, TypeError):
@@ -4,13 +4,17 @@ used to pull together the particular route class response and
 a corresponding metadata response.
 """
 
-from typing import Generic, TypeVar
+from typing import Generic, List, Optional, TypeVar
 from pydantic import BaseModel
 
 from .metadata import (
     MetaDataCreate,
     MetaDataReadAll,
     MetaDataReadOne,
+    MetaDataBatch,
+    MetaDataChildBatch,
+    MetaDataBulk,
+    BulkItemError,
     MetaDataUpdate,
     MetaDataPatch,
 )
@@ -28,7 +32,8 @@ class CombinedResponseCreate(BaseModel, Generic[T]):
 class CombinedResponseReadAll(BaseModel, Generic[T, U]):
     meta_data: MetaDataReadAll = MetaDataReadAll()
     response: T
-    total_count: U
+    total_count: Optional[U] = None
+    next_cursor: Optional[str] = None
 
 
 class CombinedResponseRead(BaseModel, Generic[T]):
@@ -36,6 +41,30 @@ class CombinedResponseRead(BaseModel, Generic[T]):
     response: T
 
 
+class CombinedResponseBatch(BaseModel, Generic[T]):
+    meta_data: MetaDataBatch = MetaDataBatch()
+    response: T
+    missing_ids: List[int] = []
+
+
+class ChildGroup(BaseModel, Generic[T]):
+    parent_id: int
+    total_count: int
+    items: List[T]
+
+
+class CombinedResponseChildBatch(BaseModel, Generic[T]):
+    meta_data: MetaDataChildBatch = MetaDataChildBatch()
+    response: T
+    per_parent_limit: int = 0
+
+
+class CombinedResponseBulk(BaseModel, Generic[T]):
+    meta_data: MetaDataBulk = MetaDataBulk()
+    response: T
+    failed: List[BulkItemError] = []
+
+
 class CombinedResponseUpdate(BaseModel, Generic[T]):
     meta_data: MetaDataUpdate = MetaDataUpdate()
     response: T
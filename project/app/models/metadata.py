@@ -5,7 +5,7 @@ middleware. It contains the response data, status code, message
 and other information relevant to the response.
 """
 
-from typing import Optional
+from typing import Any, List, Optional
 from pydantic import BaseModel, HttpUrl
 from http import HTTPStatus
 
@@ -31,16 +31,50 @@ class MetaDataCreate(MetaData):
 
 class MetaDataReadAll(MetaData):
     page: int = Field(default=0, ge=0, description="Current page number")
-    page_count: int = Field(default=0, ge=0, description="Total number of pages")
+    page_count: Optional[int] = Field(
+        default=0, ge=0, description="Total number of pages, null when not counted"
+    )
     offset: int = Field(default=0, ge=0, description="Offset value")
     limit: int = Field(default=0, ge=0, description="Limit value")
-    total_count: int = Field(default=0, ge=0, description="Total number of records")
+    total_count: Optional[int] = Field(
+        default=0, ge=0, description="Total number of records, null when not counted"
+    )
+    after: Optional[str] = Field(
+        default=None, description="Cursor the page was read after, if any"
+    )
+    next_cursor: Optional[str] = Field(
+        default=None, description="Cursor to pass as `after` to get the next page"
+    )
 
 
 class MetaDataReadOne(MetaData):
     pass
 
 
+class MetaDataBatch(MetaData):
+    missing_ids: List[int] = Field(
+        default=[], description="The requested IDs that weren't found"
+    )
+
+
+class MetaDataChildBatch(MetaData):
+    per_parent_limit: int = Field(
+        default=0, ge=0, description="The most children returned for every parent"
+    )
+
+
+class BulkItemError(BaseModel):
+    index: int = Field(description="Position of the failed item in the request")
+    id: Optional[int] = Field(default=None, description="ID of the failed item")
+    errors: Any = Field(description="Why the item failed")
+
+
+class MetaDataBulk(MetaData):
+    failed: List[BulkItemError] = Field(
+        default=[], description="The items that weren't saved"
+    )
+
+
 class MetaDataUpdate(MetaData):
     location: HttpUrl = Field(
         default="https://example.com", description="Location of the created resource"
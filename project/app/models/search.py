@@ -1,9 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 # Models
-class SearchResponse(BaseModel):
-    table_name: str
-    column_name: str
-    content: str
-    content_rowid: int
+class SearchResult(BaseModel):
+    table_name: str = Field(description="The table the matching row is in")
+    id: int = Field(description="The primary key of the matching row")
+    content: str = Field(description="The display text of the matching row")
+    snippet: str = Field(
+        description="The best matching text of the row with the matched terms highlighted"
+    )
+    rank: float = Field(description="The bm25 rank of the match, lower is better")
@@ -0,0 +1,109 @@
+"""
+The materialized aggregate tables behind the HTMX application views.
+Every row holds the pre-computed totals of one artist, album, customer
+or employee so the views page through an indexed table instead of
+grouping the joined source tables on every request. The rows are kept
+up to date by the triggers created by database.StatsManager.
+"""
+
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import Column, Index, Integer, Numeric, String
+from sqlmodel import SQLModel, Field
+
+
+class ArtistStats(SQLModel, table=True):
+    __tablename__ = "artist_stats"
+
+    id: Optional[int] = Field(
+        default=None,
+        sa_column=Column("ArtistId", Integer, primary_key=True),
+    )
+    name: Optional[str] = Field(default=None, sa_column=Column("Name", String))
+    album_count: int = Field(sa_column=Column("AlbumCount", Integer, nullable=False))
+    track_count: int = Field(sa_column=Column("TrackCount", Integer, nullable=False))
+
+    # every sortable column is indexed together with the id tie breaker
+    # so both sort directions are a plain index scan
+    __table_args__ = (
+        Index("IX_ArtistStatsName", "Name", "ArtistId"),
+        Index("IX_ArtistStatsAlbumCount", "AlbumCount", "ArtistId"),
+        Index("IX_ArtistStatsTrackCount", "TrackCount", "ArtistId"),
+    )
+
+
+class AlbumStats(SQLModel, table=True):
+    __tablename__ = "album_stats"
+
+    id: Optional[int] = Field(
+        default=None,
+        sa_column=Column("AlbumId", Integer, primary_key=True),
+    )
+    title: Optional[str] = Field(default=None, sa_column=Column("Title", String))
+    artist_name: Optional[str] = Field(
+        default=None, sa_column=Column("ArtistName", String)
+    )
+    duration: Optional[int] = Field(default=None, sa_column=Column("Duration", Integer))
+    price: Optional[Decimal] = Field(
+        default=None, sa_column=Column("Price", Numeric(10, 2))
+    )
+
+    __table_args__ = (
+        Index("IX_AlbumStatsTitle", "Title", "AlbumId"),
+        Index("IX_AlbumStatsArtistName", "ArtistName", "AlbumId"),
+        Index("IX_AlbumStatsDuration", "Duration", "AlbumId"),
+        Index("IX_AlbumStatsPrice", "Price", "AlbumId"),
+    )
+
+
+class CustomerStats(SQLModel, table=True):
+    __tablename__ = "customer_stats"
+
+    id: Optional[int] = Field(
+        default=None,
+        sa_column=Column("CustomerId", Integer, primary_key=True),
+    )
+    full_name: Optional[str] = Field(default=None, sa_column=Column("FullName", String))
+    orders_total: int = Field(sa_column=Column("OrdersTotal", Integer, nullable=False))
+    orders_total_spent: Optional[Decimal] = Field(
+        default=None, sa_column=Column("OrdersTotalSpent", Numeric(10, 2))
+    )
+
+    __table_args__ = (
+        Index("IX_CustomerStatsFullName", "FullName", "CustomerId"),
+        Index("IX_CustomerStatsOrdersTotal", "OrdersTotal", "CustomerId"),
+        Index("IX_CustomerStatsOrdersTotalSpent", "OrdersTotalSpent", "CustomerId"),
+    )
+
+
+class EmployeeStats(SQLModel, table=True):
+    __tablename__ = "employee_stats"
+
+    id: Optional[int] = Field(
+        default=None,
+        sa_column=Column("EmployeeId", Integer, primary_key=True),
+    )
+    employee_fullname: Optional[str] = Field(
+        default=None, sa_column=Column("EmployeeFullName", String)
+    )
+    manager_fullname: str = Field(
+        sa_column=Column("ManagerFullName", String, nullable=False)
+    )
+    manager_title: str = Field(sa_column=Column("ManagerTitle", String, nullable=False))
+    employee_total_customers: int = Field(
+        sa_column=Column("TotalCustomers", Integer, nullable=False)
+    )
+    employee_total_customers_spent: Decimal = Field(
+        sa_column=Column("TotalCustomersSpent", Numeric(10, 2), nullable=False)
+    )
+
+    __table_args__ = (
+        Index("IX_EmployeeStatsFullName", "EmployeeFullName", "EmployeeId"),
+        Index("IX_EmployeeStatsManagerFullName", "ManagerFullName", "EmployeeId"),
+        Index("IX_EmployeeStatsManagerTitle", "ManagerTitle", "EmployeeId"),
+        Index("IX_EmployeeStatsTotalCustomers", "TotalCustomers", "EmployeeId"),
+        Index(
+            "IX_EmployeeStatsTotalCustomersSpent", "TotalCustomersSpent", "EmployeeId"
+        ),
+    )
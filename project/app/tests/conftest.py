@@ -0,0 +1,46 @@
+"""
+The shared fixtures of the tests. The tests run the application against
+a copy of the original chinook database, so they never change the active
+database, and with the in memory caches.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+
+# the settings are read when config is imported, so they are set first
+DATA_DIR = Path(tempfile.mkdtemp(prefix="chinook-tests-"))
+ORIGINAL_DB_PATH = Path(__file__).resolve().parent.parent / "db" / "original"
+shutil.copy(ORIGINAL_DB_PATH / "chinook.db", DATA_DIR / "chinook.db")
+os.environ["DATABASE_PATH"] = str(DATA_DIR / "chinook.db")
+os.environ["CACHE_BACKEND"] = "memory"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from database import read_engine  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The test client of the application, started once for all the tests"""
+    with TestClient(main.app) as test_client:
+        yield test_client
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def statements():
+    """The SQL statements run on the read connections during the test"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(read_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(read_engine.sync_engine, "before_cursor_execute", record)
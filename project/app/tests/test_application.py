@@ -0,0 +1,80 @@
+"""
+Tests of the HTMX application routes
+"""
+
+import html
+import re
+
+import pytest
+
+from endpoints.application import SORT_COLUMNS, STATS_CLASSES
+from sqlalchemy import Numeric
+
+# the sorts of the Numeric (REAL stored) columns, and of one text column
+SCROLL_SORTS = [
+    (tab, sort)
+    for tab, stats_class in STATS_CLASSES.items()
+    for sort, column in SORT_COLUMNS.items()
+    if column.class_ is stats_class and isinstance(column.type, Numeric)
+] + [("artists", "artist_name")]
+
+NEXT_CHUNK = re.compile(r'hx-get="([^"]+)" hx-trigger="revealed"')
+
+
+def table_rows(fragment: str) -> list:
+    """The rows of a fragment, without the attributes of their <tr> tags"""
+    return [
+        re.sub(r"<tr[^>]*>", "<tr>", row, count=1)
+        for row in re.findall(r"<tr.*?</tr>", fragment, re.S)
+    ]
+
+
+@pytest.mark.parametrize("direction", ["asc", "desc"])
+@pytest.mark.parametrize("tab, sort", SCROLL_SORTS)
+def test_scroll_matches_pages(client, tab, sort, direction):
+    """Scrolling a tab to the end returns the rows of the paged view, in order"""
+    query = f"sort={sort}&direction={direction}"
+    paged = table_rows(
+        client.get(f"/application/{tab}?items_per_page=100000&{query}").text
+    )
+
+    scrolled = []
+    url = f"/application/{tab}?scroll=true&items_per_page=7&{query}"
+    for _ in range(len(paged) // 7 + 2):
+        response = client.get(url)
+        assert response.status_code == 200
+        scrolled += table_rows(response.text)
+        match = NEXT_CHUNK.search(response.text)
+        if match is None:
+            break
+        url = html.unescape(match.group(1))
+    else:
+        pytest.fail("the chunks don't end")
+
+    assert scrolled == paged
+
+
+def test_scroll_invalid_cursor(client):
+    """A cursor that wasn't made by the route is rejected"""
+    response = client.get("/application/albums?scroll=true&cursor=zzz")
+    assert response.status_code == 400
+
+
+def test_prefetch_stops_at_the_last_page(client, monkeypatch):
+    """The last page prefetches the page before it, and not one past the end"""
+    from endpoints import application
+
+    scheduled = []
+    monkeypatch.setattr(
+        application.page_prefetcher,
+        "schedule",
+        lambda key, table_names, render: scheduled.append(key),
+    )
+    rows = table_rows(client.get("/application/artists?items_per_page=100000").text)
+    last_page = (len(rows) + 12) // 13
+    url = f"/application/artists?items_per_page=13&current_page={last_page}"
+    # rendered, then served from the fragment cache
+    for _ in range(2):
+        assert client.get(url).status_code == 200
+    assert len(scheduled) == 2
+    assert all(f"current_page={last_page - 1}" in key for key in scheduled)
@@ -0,0 +1,77 @@
+"""
+Tests of the SQLite cache backend shared by the worker processes
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from cache import CacheBackend, SQLiteBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """A SQLite backend of 1000 bytes in a new file"""
+    return SQLiteBackend(
+        tmp_path / "cache.db", max_bytes=1000, sync_interval=0, busy_timeout_ms=20
+    )
+
+
+def test_backend_is_abstract():
+    """A backend missing a method of the interface can't be created"""
+
+    class IncompleteBackend(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_totals_follow_the_entries(backend):
+    """The running totals match the entries after inserts and overwrites"""
+    backend.set("a", b"x" * 100, 60)
+    backend.set("b", b"x" * 200, 60)
+    backend.set("a", b"x" * 50, 60)
+    assert backend.stats() == {"entries": 2, "size": 250, "max_bytes": 1000}
+    assert backend.get("a") == b"x" * 50
+
+
+def test_totals_of_an_existing_file(backend, tmp_path):
+    """A second process opening the file reads the same totals"""
+    backend.set("a", b"x" * 100, 60)
+    other = SQLiteBackend(
+        tmp_path / "cache.db", max_bytes=1000, sync_interval=0, busy_timeout_ms=20
+    )
+    assert other.stats()["size"] == 100
+
+
+def test_eviction_frees_the_least_recently_used(backend):
+    """Going over max_bytes evicts the entries used longest ago"""
+    for index in range(9):
+        backend.set(f"key-{index}", b"x" * 100, 60)
+    # key-0 is read again, so key-1 is now the least recently used
+    backend.TOUCH_INTERVAL = 0
+    time.sleep(0.01)
+    assert backend.get("key-0") is not None
+    backend.set("key-9", b"x" * 200, 60)
+    stats = backend.stats()
+    assert stats["size"] <= 1000 * backend.EVICT_TARGET
+    assert backend.get("key-0") is not None
+    assert backend.get("key-1") is None
+    assert backend.get("key-9") is not None
+
+
+def test_locked_file_is_a_miss(backend, tmp_path):
+    """An entry locked by another worker is a miss and a skipped write"""
+    backend.set("a", b"x" * 100, 60)
+    other = sqlite3.connect(tmp_path / "cache.db", isolation_level=None)
+    other.execute("PRAGMA busy_timeout=0")
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        backend.set("b", b"x" * 100, 60)
+    finally:
+        other.execute("ROLLBACK")
+    assert backend.get("b") is None
+    assert backend.stats()["entries"] == 1
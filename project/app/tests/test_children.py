@@ -0,0 +1,108 @@
+"""
+Tests of the child routes built from the foreign keys between the models
+"""
+
+import pytest
+
+from cache import table_versions
+
+
+def read_all(client, url, limit):
+    """Read every item of a child route a cursor page at a time"""
+    separator = "&" if "?" in url else "?"
+    items = []
+    body = client.get(f"{url}{separator}limit={limit}").json()
+    while True:
+        items.extend(body["response"])
+        cursor = body["meta_data"]["next_cursor"]
+        if cursor is None:
+            return items
+        body = client.get(f"{url}{separator}limit={limit}&after={cursor}").json()
+
+
+@pytest.mark.parametrize(
+    "url, sort",
+    [
+        ("/api/v1/albums/141/tracks", "name"),
+        ("/api/v1/albums/141/tracks", "unit_price"),
+        ("/api/v1/playlists/17/tracks", "composer"),
+        ("/api/v1/customers/1/invoices", "total"),
+        ("/api/v1/employees/2/reports", "first_name"),
+    ],
+)
+@pytest.mark.parametrize("direction", ["asc", "desc"])
+def test_sorted_cursor_pages(client, url, sort, direction):
+    """The cursor pages of a sorted route are the rows of the sorted list"""
+    sorted_url = f"{url}?sort={sort}&direction={direction}&count=none"
+    everything = client.get(f"{sorted_url}&limit=1000").json()["response"]
+    assert read_all(client, sorted_url, 3) == everything
+    values = [item[sort] for item in everything if item[sort] is not None]
+    assert values == sorted(values, reverse=direction == "desc")
+
+
+def test_many_to_one_route(client):
+    """The album's artist is a child route of its own"""
+    body = client.get("/api/v1/albums/1/artist").json()
+    assert body["response"] == [client.get("/api/v1/artists/1").json()["response"]]
+    assert body["meta_data"]["total_count"] == 1
+
+
+def test_many_to_many_count_reads_the_link_table(client, statements):
+    """The count of a many to many route only reads the link table"""
+    body = client.get("/api/v1/playlists/1/tracks?count=exact").json()
+    assert body["meta_data"]["total_count"] == 3290
+    count = statements[-1]
+    assert "count" in count and "playlist_track" in count and "tracks" not in count
+
+
+def test_child_route_etag_follows_the_link_table(client):
+    """A many to many route's ETag changes with the link table"""
+    url = "/api/v1/tracks/1/playlists"
+    etag = client.get(url).headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    table_versions.bump("playlist_track")
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_unknown_sort_field(client):
+    """An unknown sort field is rejected"""
+    response = client.get("/api/v1/albums/1/tracks?sort=lyrics")
+    assert response.status_code == 422
+
+
+def test_batched_children_match_the_child_routes(client, statements):
+    """The batched route has the first children and count of every parent"""
+    body = client.get("/api/v1/albums/tracks?parent_ids=1,2,999&per_parent_limit=5")
+    assert body.status_code == 200
+    assert body.json()["meta_data"]["per_parent_limit"] == 5
+    groups = body.json()["response"]
+    assert len(statements) == 1
+    assert [group["parent_id"] for group in groups] == [1, 2, 999]
+    for group in groups:
+        single = client.get(
+            f"/api/v1/albums/{group['parent_id']}/tracks?limit=5&count=exact"
+        ).json()
+        assert group["items"] == single["response"]
+        assert group["total_count"] == single["meta_data"]["total_count"]
+
+
+def test_batched_children_sorted_many_to_many(client):
+    """The batched route sorts every parent's children"""
+    url = "/api/v1/playlists/tracks?parent_ids=5,17&per_parent_limit=4"
+    groups = client.get(f"{url}&sort=name&direction=desc").json()["response"]
+    for group in groups:
+        single = client.get(
+            f"/api/v1/playlists/{group['parent_id']}/tracks"
+            "?limit=4&sort=name&direction=desc"
+        ).json()
+        assert group["items"] == single["response"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["parent_ids=1,x", "parent_ids=", "parent_ids=1&per_parent_limit=0"],
+)
+def test_batched_children_invalid(client, query):
+    """Invalid parent IDs and limits are rejected"""
+    response = client.get(f"/api/v1/albums/tracks?{query}")
+    assert response.status_code in (400, 422)
@@ -0,0 +1,77 @@
+"""
+Tests of the expand parameter of the generated list and get routes
+"""
+
+import pytest
+
+
+def test_expand_list_batches_the_relationships(client, statements):
+    """A page of albums with their artists costs 2 queries, not 1 + 100"""
+    response = client.get("/api/v1/albums/?limit=100&count=none&expand=artist")
+    assert response.status_code == 200
+    albums = response.json()["response"]
+    assert len(albums) == 100
+    assert all(album["artist"]["id"] == album["artist_id"] for album in albums)
+    selects = [statement for statement in statements if "SELECT" in statement]
+    assert len(selects) == 2
+
+
+def test_expand_list_many_relationships(client, statements):
+    """Every expanded relationship is one more batched query"""
+    response = client.get("/api/v1/albums/?limit=20&count=none&expand=artist,tracks")
+    assert response.status_code == 200
+    albums = response.json()["response"]
+    assert all(
+        track["album_id"] == album["id"]
+        for album in albums
+        for track in album["tracks"]
+    )
+    assert sum(len(album["tracks"]) for album in albums) > 20
+    assert len(statements) == 3
+
+
+def test_expand_item(client):
+    """A single item is expanded with the Read models of the related tables"""
+    album = client.get("/api/v1/albums/1?expand=artist,tracks").json()["response"]
+    assert album["artist"] == client.get("/api/v1/artists/1").json()["response"]
+    assert len(album["tracks"]) == 10
+    assert set(album["tracks"][0]) == set(
+        client.get("/api/v1/tracks/1").json()["response"]
+    )
+
+
+@pytest.mark.parametrize(
+    "url, name",
+    [
+        ("/api/v1/employees/2?expand=manager", "manager"),
+        ("/api/v1/tracks/1?expand=genre", "genre"),
+        ("/api/v1/tracks/1?expand=playlists", "playlists"),
+    ],
+)
+def test_expand_relationship_kinds(client, url, name):
+    """Self referential, many to one and many to many relationships expand"""
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json()["response"][name]
+
+
+def test_expand_unchanged_without_expand(client):
+    """Without expand the items have only the Read model fields"""
+    album = client.get("/api/v1/albums/1").json()["response"]
+    assert "artist" not in album and "tracks" not in album
+
+
+def test_expand_unknown_relationship(client):
+    """An unknown relationship is rejected"""
+    response = client.get("/api/v1/albums/?expand=artist,label")
+    assert response.status_code == 422
+
+
+def test_expand_etag_follows_the_related_tables(client):
+    """A write to an expanded table changes the ETag of the expanded item"""
+    plain = client.get("/api/v1/albums/1").headers["etag"]
+    expanded = client.get("/api/v1/albums/1?expand=artist").headers["etag"]
+    artist = client.get("/api/v1/artists/1").json()["response"]
+    client.put("/api/v1/artists/1", json={"name": artist["name"]})
+    assert client.get("/api/v1/albums/1").headers["etag"] == plain
+    assert client.get("/api/v1/albums/1?expand=artist").headers["etag"] != expanded
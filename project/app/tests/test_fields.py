@@ -0,0 +1,84 @@
+"""
+Tests of the fields parameter of the generated list, get and child routes
+"""
+
+import pytest
+
+
+def test_fields_list_selects_only_the_fields(client, statements):
+    """Only the id and the requested columns are read and returned"""
+    response = client.get("/api/v1/tracks/?limit=5&count=none&fields=name")
+    assert response.status_code == 200
+    tracks = response.json()["response"]
+    assert len(tracks) == 5
+    assert all(set(track) == {"id", "name"} for track in tracks)
+    (select,) = statements
+    assert "Composer" not in select and "Bytes" not in select
+
+
+def test_fields_list_values_match_the_full_items(client):
+    """The sparse items have the same values as the full items"""
+    full = client.get("/api/v1/tracks/?limit=5").json()["response"]
+    sparse = client.get("/api/v1/tracks/?limit=5&fields=unit_price,name").json()
+    assert sparse["response"] == [
+        {"id": track["id"], "name": track["name"], "unit_price": track["unit_price"]}
+        for track in full
+    ]
+
+
+def test_fields_list_cursor(client):
+    """The cursor pages work without the id being requested"""
+    first = client.get("/api/v1/albums/?limit=3&fields=title").json()
+    second = client.get(
+        f"/api/v1/albums/?limit=3&after={first['meta_data']['next_cursor']}"
+    )
+    assert [album["id"] for album in second.json()["response"]] == [4, 5, 6]
+
+
+def test_fields_item(client, statements):
+    """A single item is read as a row of the requested columns"""
+    response = client.get("/api/v1/customers/1?fields=first_name,email")
+    assert response.status_code == 200
+    assert response.json()["response"] == {
+        "id": 1,
+        "first_name": "Luís",
+        "email": "luisg@embraer.com.br",
+    }
+    (select,) = statements
+    assert "Address" not in select
+
+
+def test_fields_child_route(client, statements):
+    """The child routes read only the requested columns"""
+    response = client.get("/api/v1/albums/1/tracks?count=none&fields=name")
+    assert response.status_code == 200
+    tracks = response.json()["response"]
+    assert all(set(track) == {"id", "name"} for track in tracks)
+    (select,) = statements
+    assert "Composer" not in select
+
+
+def test_fields_with_expand(client, statements):
+    """The relationship columns are still loaded for the expanded items"""
+    response = client.get(
+        "/api/v1/albums/?limit=5&count=none&fields=title&expand=artist"
+    )
+    assert response.status_code == 200
+    albums = response.json()["response"]
+    assert set(albums[0]) == {"id", "title", "artist"}
+    assert albums[0]["artist"]["id"] == 1
+    assert len(statements) == 2
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/v1/tracks/?fields=name,size",
+        "/api/v1/tracks/1?fields=lyrics",
+        "/api/v1/albums/1/tracks?fields=title",
+    ],
+)
+def test_fields_unknown_field(client, url):
+    """An unknown field is rejected"""
+    response = client.get(url)
+    assert response.status_code == 422